@@ -1,7 +1,25 @@
-from flask import Flask, render_template, request, jsonify, session
+from flask import Flask, Response, abort, render_template, request, jsonify, session
+import asyncio
+import hmac
+import json
+import tempfile
 import uuid
+from functools import wraps
+from app.config.config import ADMIN_TOKEN
+from app.database.db_handler import get_intent_stats
+from app.utils.metrics import register_gauge, render_metrics
+from app.utils.profiler import profiler
+from app.database.export import (
+    EXPORT_FORMATS,
+    PARQUET_AVAILABLE,
+    TEXT_WRITERS,
+    iter_export_chunks,
+    parse_date,
+    write_parquet
+)
 from app.controllers.conversation_controller import ConversationController
 from app.models.models import init_db
+from app.utils.intent_classifier import train_local_model
 
 # Inicializar la aplicación Flask
 app = Flask(__name__, 
@@ -12,10 +30,21 @@ app.secret_key = 'your_secret_key_here'  # Cambiar en producción
 # Inicializar el controlador de conversaciones
 conversation_controller = ConversationController()
 
+# Métricas calculadas al exportar
+register_gauge('active_sessions', 'Sesiones activas en el almacén de sesiones',
+               lambda: len(conversation_controller.sessions))
+register_gauge('sessions_in_flight', 'Sesiones con un turno en curso',
+               lambda: len(conversation_controller._mailboxes))
+if conversation_controller.writer is not None:
+    register_gauge('write_behind_pending', 'Turnos pendientes en la escritura diferida',
+                   lambda: len(conversation_controller.writer))
+
 # Inicializar la base de datos
 # Reemplazamos @app.before_first_request por un contexto de aplicación
 with app.app_context():
     init_db()
+    # Entrenar el clasificador local de intents con las conversaciones guardadas
+    train_local_model()
 
 @app.route('/')
 def index():
@@ -26,18 +55,174 @@ def index():
     return render_template('index.html')
 
 @app.route('/send_message', methods=['POST'])
-def send_message():
+async def send_message():
     # Obtener el mensaje del usuario
     message = request.json.get('message', '')
     
     # Obtener el ID de sesión
     session_id = session.get('session_id', str(uuid.uuid4()))
     
-    # Procesar el mensaje
-    result = conversation_controller.handle_message(session_id, message)
+    # Procesar el mensaje (las llamadas al LLM son asíncronas), perfilándolo si está activado
+    with profiler.profile('/send_message'):
+        result = await conversation_controller.ahandle_message(session_id, message)
     
     return jsonify(result)
 
+def iterate_async(agen):
+    """Recorre un generador asíncrono desde una vista síncrona con un bucle de eventos propio"""
+    loop = asyncio.new_event_loop()
+    try:
+        while True:
+            try:
+                item = loop.run_until_complete(agen.__anext__())
+            except StopAsyncIteration:
+                break
+            yield item
+    finally:
+        # Si el cliente se desconecta se cierra el generador para liberar la sesión
+        try:
+            loop.run_until_complete(agen.aclose())
+        finally:
+            # Cancelar las tareas que sigan pendientes (por ejemplo una respuesta especulativa)
+            # y cerrar los generadores asíncronos antes de cerrar el bucle
+            pending = asyncio.all_tasks(loop)
+            for task in pending:
+                task.cancel()
+            if pending:
+                loop.run_until_complete(asyncio.gather(*pending, return_exceptions=True))
+            loop.run_until_complete(loop.shutdown_asyncgens())
+            loop.close()
+
+def format_sse(event: str, data) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+@app.route('/send_message/stream', methods=['POST'])
+def send_message_stream():
+    # Obtener el mensaje del usuario
+    message = request.json.get('message', '')
+    
+    # Obtener el ID de sesión
+    session_id = session.get('session_id', str(uuid.uuid4()))
+    
+    def generate():
+        # El perfil cubre todo el turno, que se ejecuta mientras se envían los eventos
+        with profiler.profile('/send_message/stream'):
+            try:
+                for event in iterate_async(conversation_controller.astream_message(session_id, message)):
+                    event_type = event.pop("type")
+                    yield format_sse(event_type, event)
+            except Exception:
+                # El detalle queda en el log, al cliente no se le envía el texto de la excepción
+                app.logger.exception("Error procesando el mensaje")
+                yield format_sse("error", {"message": "Lo siento, ha ocurrido un error. Por favor, inténtalo de nuevo."})
+    
+    # Enviar los tokens como Server-Sent Events a medida que se generan
+    return Response(generate(), mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no'
+    })
+
+def admin_required(view):
+    """Exige el token de administración en la cabecera X-Admin-Token"""
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        token = request.headers.get('X-Admin-Token', '')
+        if not ADMIN_TOKEN or not hmac.compare_digest(token, ADMIN_TOKEN):
+            abort(403)
+        return view(*args, **kwargs)
+    return wrapper
+
+@app.route('/admin/export')
+@admin_required
+def admin_export():
+    # Filtros del export: ?format=csv&start=2024-01-01&end=2024-02-01&intent=hours_info
+    fmt = request.args.get('format', 'csv')
+    if fmt not in EXPORT_FORMATS:
+        abort(400)
+    if fmt == 'parquet' and not PARQUET_AVAILABLE:
+        abort(501)
+    try:
+        chunks = iter_export_chunks(
+            start=parse_date(request.args.get('start')),
+            end=parse_date(request.args.get('end')),
+            intents=request.args.getlist('intent')
+        )
+    except ValueError:
+        abort(400)
+    filename = f"conversations.{fmt}"
+    headers = {'Content-Disposition': f'attachment; filename="{filename}"'}
+    
+    if fmt == 'parquet':
+        # Parquet necesita el archivo completo, se escribe en disco y se envía por bloques
+        spool = tempfile.TemporaryFile()
+        write_parquet(chunks, spool)
+        spool.seek(0)
+        
+        def read_spool():
+            with spool:
+                while True:
+                    block = spool.read(1024 * 1024)
+                    if not block:
+                        break
+                    yield block
+        return Response(read_spool(), mimetype='application/octet-stream', headers=headers)
+    
+    mimetype = 'text/csv' if fmt == 'csv' else 'application/x-ndjson'
+    return Response(TEXT_WRITERS[fmt](chunks), mimetype=mimetype, headers=headers)
+
+@app.route('/stats/intents')
+@admin_required
+def intent_stats():
+    # Conversaciones por hora e intent: ?start=2024-01-01&end=2024-01-02&intent=hours_info
+    try:
+        rows = get_intent_stats(
+            start=parse_date(request.args.get('start')),
+            end=parse_date(request.args.get('end')),
+            intents=request.args.getlist('intent')
+        )
+    except ValueError:
+        abort(400)
+    
+    totals = {}
+    for row in rows:
+        totals[row.intent] = totals.get(row.intent, 0) + row.count
+    return jsonify({
+        'buckets': [
+            {'hour': row.hour_bucket.isoformat(), 'intent': row.intent, 'count': row.count}
+            for row in rows
+        ],
+        'totals': totals
+    })
+
+@app.route('/metrics')
+def metrics():
+    # Métricas en el formato de texto de Prometheus
+    return Response(render_metrics(), mimetype='text/plain; version=0.0.4')
+
+@app.route('/admin/profiles')
+@admin_required
+def list_profiles():
+    # Últimos turnos perfilados, del más reciente al más antiguo
+    return jsonify({'enabled': profiler.enabled, 'profiles': profiler.list()})
+
+@app.route('/admin/profiles/<int:profile_id>')
+@admin_required
+def download_profile(profile_id):
+    capture = profiler.get(profile_id)
+    if capture is None:
+        abort(404)
+    # ?format=pstats (pstats.Stats, snakeviz) o collapsed (flamegraph.pl, speedscope)
+    fmt = request.args.get('format', 'pstats')
+    if fmt == 'pstats':
+        body, mimetype, extension = capture.pstats(), 'application/octet-stream', 'prof'
+    elif fmt == 'collapsed':
+        body, mimetype, extension = capture.collapsed(), 'text/plain', 'txt'
+    else:
+        abort(400)
+    return Response(body, mimetype=mimetype, headers={
+        'Content-Disposition': f'attachment; filename="profile-{profile_id}.{extension}"'
+    })
+
 @app.route('/reset_conversation', methods=['POST'])
 def reset_conversation():
     # Obtener el ID de sesión
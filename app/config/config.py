@@ -8,4 +8,107 @@ load_dotenv()
 DATABASE_URL = os.getenv("DATABASE_URL")
 
 # Configuración de la API de OpenAI
-OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
\ No newline at end of file
+OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
+
+# Configuración del clasificador local de intents
+# Por debajo de esta confianza (0 a 1) se consulta al LLM
+INTENT_CONFIDENCE_THRESHOLD = float(os.getenv("INTENT_CONFIDENCE_THRESHOLD", "0.6"))
+# Diferencia mínima de confianza con el segundo intent más probable para no consultar al LLM
+INTENT_MIN_MARGIN = float(os.getenv("INTENT_MIN_MARGIN", "0.5"))
+# Número máximo de mensajes de la base de datos usados para entrenar
+INTENT_TRAINING_LIMIT = int(os.getenv("INTENT_TRAINING_LIMIT", "50000"))
+# Clasificaciones del LLM guardadas por mensaje normalizado: máximo en memoria, expiración
+# y archivo SQLite donde persistirlas entre reinicios (vacío = solo memoria)
+INTENT_CACHE_MAX_ENTRIES = int(os.getenv("INTENT_CACHE_MAX_ENTRIES", "10000"))
+INTENT_CACHE_TTL_SECONDS = float(os.getenv("INTENT_CACHE_TTL_SECONDS", "86400"))
+INTENT_CACHE_PATH = os.getenv("INTENT_CACHE_PATH", "")
+
+# Configuración de las respuestas pre-generadas del onboarding
+# Pasos que responden con plantillas en lugar del LLM (greeting, get_name, get_email, request_name, request_email)
+RESPONSE_TEMPLATE_STEPS = [
+    step.strip()
+    for step in os.getenv("RESPONSE_TEMPLATE_STEPS", "greeting,get_name,get_email,request_name,request_email").split(",")
+    if step.strip()
+]
+RESPONSE_TEMPLATES_PATH = os.getenv(
+    "RESPONSE_TEMPLATES_PATH",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "response_templates.json")
+)
+
+# Configuración del historial enviado en los prompts
+# Mensajes recientes que se envían textualmente, los anteriores se resumen
+HISTORY_MAX_MESSAGES = int(os.getenv("HISTORY_MAX_MESSAGES", "12"))
+# Mensajes fuera de la ventana que se acumulan antes de actualizar el resumen
+SUMMARY_BATCH_MESSAGES = int(os.getenv("SUMMARY_BATCH_MESSAGES", "6"))
+# Presupuesto de tokens del historial por prompt, por ejemplo "provide_service:2000,greeting:300"
+HISTORY_TOKEN_BUDGET = int(os.getenv("HISTORY_TOKEN_BUDGET", "1500"))
+HISTORY_TOKEN_BUDGETS = {
+    name.strip(): int(budget)
+    for name, budget in (
+        item.split(":") for item in os.getenv("HISTORY_TOKEN_BUDGETS", "").split(",") if ":" in item
+    )
+}
+
+# Configuración del flujo de conversación
+# "multi_call": extracción, clasificación y respuesta en llamadas separadas al LLM
+# "single_shot": una sola llamada por turno que devuelve en JSON los datos del cliente, el intent y la respuesta
+CONVERSATION_MODE = os.getenv("CONVERSATION_MODE", "multi_call")
+# En multi_call, si el clasificador local duda, generar la respuesta para el intent probable
+# (el del turno anterior o la mejor predicción local) mientras el LLM clasifica el mensaje
+SPECULATIVE_REPLY = os.getenv("SPECULATIVE_REPLY", "false").lower() in ("1", "true", "yes")
+
+# Configuración de la base de conocimiento (JSON o YAML, se recarga al cambiar el archivo)
+# Horarios, promociones y reservaciones que se responden sin el LLM, vacío = desactivada.
+# app/config/knowledge_base.example.json es un ejemplo con datos inventados, no se usa por defecto
+KNOWLEDGE_BASE_PATH = os.getenv("KNOWLEDGE_BASE_PATH", "")
+
+# Configuración de la caché semántica de respuestas
+# Intents cuyas respuestas se reutilizan entre preguntas parecidas, por ejemplo "hours_info,discounts,product_info"
+# (vacío = caché desactivada)
+RESPONSE_CACHE_INTENTS = [
+    intent.strip() for intent in os.getenv("RESPONSE_CACHE_INTENTS", "").split(",") if intent.strip()
+]
+# Similitud coseno mínima (0 a 1) entre las preguntas para reutilizar una respuesta
+RESPONSE_CACHE_THRESHOLD = float(os.getenv("RESPONSE_CACHE_THRESHOLD", "0.9"))
+RESPONSE_CACHE_MAX_ENTRIES = int(os.getenv("RESPONSE_CACHE_MAX_ENTRIES", "1000"))
+RESPONSE_CACHE_TTL_SECONDS = float(os.getenv("RESPONSE_CACHE_TTL_SECONDS", "3600"))
+
+# Configuración del almacén de sesiones
+# Almacén de sesiones: "memory" (por proceso) o "sql" (compartido entre procesos en la tabla sessions)
+SESSION_STORE = os.getenv("SESSION_STORE", "memory")
+# Límites del almacén en memoria
+SESSION_MAX_ENTRIES = int(os.getenv("SESSION_MAX_ENTRIES", "10000"))
+SESSION_MAX_BYTES = int(os.getenv("SESSION_MAX_BYTES", str(256 * 1024 * 1024)))
+SESSION_TTL_SECONDS = float(os.getenv("SESSION_TTL_SECONDS", "1800"))
+# Turnos que se recuperan de la base de datos al restaurar una sesión desalojada
+SESSION_REHYDRATE_TURNS = int(os.getenv("SESSION_REHYDRATE_TURNS", "10"))
+# Reintentos de un turno cuando otro proceso modificó la misma sesión
+SESSION_CONFLICT_RETRIES = int(os.getenv("SESSION_CONFLICT_RETRIES", "1"))
+# Escrituras de sesiones tras las que el almacén SQL borra las sesiones expiradas (SESSION_TTL_SECONDS)
+SESSION_PURGE_EVERY_WRITES = int(os.getenv("SESSION_PURGE_EVERY_WRITES", "500"))
+
+# Configuración de la escritura diferida de conversaciones
+# Si está activa los turnos se guardan en lotes desde un hilo en segundo plano
+WRITE_BEHIND_ENABLED = os.getenv("WRITE_BEHIND_ENABLED", "true").lower() in ("1", "true", "yes")
+# Se escribe un lote al juntar este número de filas o al pasar este tiempo desde la primera
+WRITE_BEHIND_BATCH_ROWS = int(os.getenv("WRITE_BEHIND_BATCH_ROWS", "100"))
+WRITE_BEHIND_FLUSH_MS = int(os.getenv("WRITE_BEHIND_FLUSH_MS", "200"))
+# Filas pendientes como máximo; con la cola llena la petición espera hasta este tiempo
+# y después guarda su turno directamente
+WRITE_BEHIND_MAX_PENDING = int(os.getenv("WRITE_BEHIND_MAX_PENDING", "10000"))
+WRITE_BEHIND_PUT_TIMEOUT = float(os.getenv("WRITE_BEHIND_PUT_TIMEOUT", "1.0"))
+
+# Configuración de la administración
+# Token que deben enviar las rutas /admin en la cabecera X-Admin-Token, vacío = rutas desactivadas
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN", "")
+# Filas leídas por bloque al exportar conversaciones
+EXPORT_CHUNK_ROWS = int(os.getenv("EXPORT_CHUNK_ROWS", "5000"))
+
+# Configuración del perfilador de turnos
+# Fracción de los mensajes que se perfilan (0 a 1)
+PROFILE_SAMPLE_RATE = float(os.getenv("PROFILE_SAMPLE_RATE", "0"))
+# Si es mayor que 0 también se guardan los turnos que tarden más de estos milisegundos
+PROFILE_SLOW_MS = float(os.getenv("PROFILE_SLOW_MS", "0"))
+# Capturas que se conservan en memoria e intervalo entre muestras
+PROFILE_BUFFER_SIZE = int(os.getenv("PROFILE_BUFFER_SIZE", "20"))
+PROFILE_INTERVAL_MS = float(os.getenv("PROFILE_INTERVAL_MS", "5"))
@@ -1,62 +1,374 @@
-from app.utils.conversation_handler import process_message
-from app.database.db_handler import save_user, save_conversation
-from typing import Dict, Any
+from app.utils.conversation_handler import process_message, aprocess_message, astream_message, create_initial_state
+from app.utils.message_log import MessageLog
+from app.utils.session_store import SessionStore, StaleSessionError, create_session_store
+from app.database.write_behind import WriteBehindQueue, create_write_behind
+from app.utils.concurrency import run_in_thread
+from app.database.db_handler import (
+    save_user,
+    save_conversation,
+    get_user_by_id,
+    get_recent_conversations_by_session
+)
+from app.config.config import SESSION_REHYDRATE_TURNS, SESSION_CONFLICT_RETRIES, WRITE_BEHIND_ENABLED
+from typing import AsyncIterator, Dict, Any, List, Optional
+import asyncio
+import threading
+
+# Intervalo con el que un turno asíncrono comprueba si su sesión quedó libre
+MAILBOX_POLL_SECONDS = 0.01
+
+class PendingMessage:
+    """Mensaje esperando a ser procesado en el buzón de su sesión"""
+
+    __slots__ = ("message", "result", "error", "done")
+
+    def __init__(self, message: str):
+        self.message = message
+        self.result = None
+        self.error = None
+        self.done = False
+
+class SessionMailbox:
+    """Buzón de una sesión con un turno en curso: los turnos de una sesión se procesan de uno en uno"""
+
+    __slots__ = ("lock", "pending", "users")
 
-class ConversationController:
     def __init__(self):
-        """Inicializa el controlador de conversaciones"""
-        self.active_conversations = {}  # Almacena las conversaciones activas por session_id
-    
+        self.lock = threading.Lock()
+        self.pending: List[PendingMessage] = []
+        self.users = 0  # Peticiones que están usando el buzón
+
+class ConversationController:
+    def __init__(
+        self,
+        session_store: SessionStore = None,
+        writer: Optional[WriteBehindQueue] = None,
+        write_behind: bool = WRITE_BEHIND_ENABLED
+    ):
+        """
+        Inicializa el controlador de conversaciones
+
+        Args:
+            session_store (SessionStore): Almacén de las conversaciones activas por session_id,
+                por defecto el configurado en SESSION_STORE
+            writer (WriteBehindQueue): Cola de escritura diferida de los turnos
+            write_behind (bool): Si no se pasa una cola, crear una (True) o guardar
+                los turnos directamente (False)
+        """
+        if session_store is None:
+            session_store = create_session_store()
+        if writer is None:
+            writer = create_write_behind(write_behind)
+        self.sessions = session_store
+        self.writer = writer
+        self.rehydrated_sessions = 0  # Sesiones restauradas desde la base de datos
+        self.coalesced_messages = 0  # Mensajes agrupados con otros en un mismo turno
+        self._mailboxes: Dict[str, SessionMailbox] = {}
+        self._mailboxes_lock = threading.Lock()
+
     def handle_message(self, session_id: str, message: str) -> Dict[str, Any]:
         """
-        Maneja un mensaje del usuario
-        
+        Maneja un mensaje del usuario. Los mensajes de una misma sesión se procesan
+        en orden, y los que llegan mientras hay un turno en curso se agrupan en un
+        único turno. Solo la petición del último mensaje agrupado recibe la respuesta,
+        las demás reciben una respuesta vacía con "coalesced" en True.
+
         Args:
             session_id (str): Identificador único de la sesión
             message (str): Mensaje del usuario
-            
+
         Returns:
             Dict: Diccionario con la respuesta
         """
-        # Obtener el estado actual de la conversación si existe
-        current_state = self.active_conversations.get(session_id)
-        
-        # Procesar el mensaje
-        result = process_message(message, current_state)
-        
-        # Actualizar el estado
+        mailbox, pending = self._enter_mailbox(session_id, message)
+        try:
+            with mailbox.lock:
+                batch = self._take_batch(mailbox, pending)
+                if batch:
+                    try:
+                        result = self._run_turn(session_id, self._merge_batch(batch))
+                    except Exception as e:
+                        self._fail_batch(batch, e)
+                        raise
+                    self._complete_batch(batch, result)
+        finally:
+            self._leave_mailbox(session_id, mailbox)
+        return self._pending_result(pending)
+
+    async def ahandle_message(self, session_id: str, message: str) -> Dict[str, Any]:
+        """
+        Versión asíncrona de handle_message: el turno usa las llamadas asíncronas
+        al LLM y las operaciones bloqueantes (base de datos, sesiones) se ejecutan
+        en hilos, así el bucle de eventos puede atender otras conversaciones.
+
+        Args:
+            session_id (str): Identificador único de la sesión
+            message (str): Mensaje del usuario
+
+        Returns:
+            Dict: Diccionario con la respuesta
+        """
+        mailbox, pending = self._enter_mailbox(session_id, message)
+        try:
+            # Esperar el turno de la sesión sin bloquear el bucle de eventos
+            while not mailbox.lock.acquire(blocking=False):
+                await asyncio.sleep(MAILBOX_POLL_SECONDS)
+            try:
+                batch = self._take_batch(mailbox, pending)
+                if batch:
+                    try:
+                        result = await self._arun_turn(session_id, self._merge_batch(batch))
+                    except BaseException as e:
+                        self._fail_batch(batch, e)
+                        raise
+                    self._complete_batch(batch, result)
+            finally:
+                mailbox.lock.release()
+        finally:
+            self._leave_mailbox(session_id, mailbox)
+        return self._pending_result(pending)
+
+    async def astream_message(self, session_id: str, message: str) -> AsyncIterator[Dict[str, Any]]:
+        """
+        Versión de ahandle_message que emite la respuesta token a token. Si se agrupan
+        varios mensajes, la respuesta la recibe la petición que ejecuta el turno y emite
+        los tokens; las demás solo reciben el evento done con "coalesced" en True.
+
+        Args:
+            session_id (str): Identificador único de la sesión
+            message (str): Mensaje del usuario
+
+        Yields:
+            Dict: Eventos {"type": "token", "content": ...}, {"type": "reset"} si el turno
+                se repite por un conflicto de sesión (el cliente descarta el texto recibido)
+                y al final {"type": "done", ...} con el mismo contenido que ahandle_message
+        """
+        mailbox, pending = self._enter_mailbox(session_id, message)
+        try:
+            # Esperar el turno de la sesión sin bloquear el bucle de eventos
+            while not mailbox.lock.acquire(blocking=False):
+                await asyncio.sleep(MAILBOX_POLL_SECONDS)
+            try:
+                batch = self._take_batch(mailbox, pending)
+                if batch:
+                    try:
+                        async for event in self._astream_turn(session_id, self._merge_batch(batch)):
+                            if event["type"] == "done":
+                                result = event["result"]
+                            else:
+                                yield event
+                    except BaseException as e:
+                        self._fail_batch(batch, e)
+                        raise
+                    # Esta petición emitió los tokens, así que recibe la respuesta completa
+                    self._complete_batch(batch, result, owner=pending)
+            finally:
+                mailbox.lock.release()
+        finally:
+            self._leave_mailbox(session_id, mailbox)
+        yield {"type": "done", **self._pending_result(pending)}
+
+    def _enter_mailbox(self, session_id: str, message: str):
+        pending = PendingMessage(message)
+        with self._mailboxes_lock:
+            mailbox = self._mailboxes.get(session_id)
+            if mailbox is None:
+                mailbox = self._mailboxes[session_id] = SessionMailbox()
+            mailbox.users += 1
+            mailbox.pending.append(pending)
+        return mailbox, pending
+
+    def _take_batch(self, mailbox: SessionMailbox, pending: PendingMessage) -> List[PendingMessage]:
+        # Si otra petición ya procesó este mensaje junto con los suyos no hay nada que hacer
+        if pending.done:
+            return []
+        with self._mailboxes_lock:
+            batch, mailbox.pending = mailbox.pending, []
+        return batch
+
+    def _leave_mailbox(self, session_id: str, mailbox: SessionMailbox) -> None:
+        with self._mailboxes_lock:
+            mailbox.users -= 1
+            if mailbox.users == 0:
+                del self._mailboxes[session_id]
+
+    def _merge_batch(self, batch: List[PendingMessage]) -> str:
+        if len(batch) == 1:
+            return batch[0].message
+        return "\n".join(p.message for p in batch if p.message)
+
+    def _complete_batch(
+        self,
+        batch: List[PendingMessage],
+        result: Dict[str, Any],
+        owner: Optional[PendingMessage] = None
+    ) -> None:
+        # owner recibe la respuesta (por defecto el último mensaje), el resto una respuesta vacía
+        owner = owner or batch[-1]
+        for p in batch:
+            p.result = result if p is owner else {**result, "response": "", "coalesced": True}
+            p.done = True
+        self.coalesced_messages += len(batch) - 1
+
+    def _fail_batch(self, batch: List[PendingMessage], error: BaseException) -> None:
+        if not isinstance(error, Exception):
+            # El turno se canceló (cliente desconectado), los demás mensajes del lote fallan
+            # con un error normal para no propagar la cancelación a otras peticiones
+            error = RuntimeError("El turno se canceló antes de terminar")
+        for p in batch:
+            p.error = error
+            p.done = True
+
+    def _pending_result(self, pending: PendingMessage) -> Dict[str, Any]:
+        if pending.error is not None:
+            raise pending.error
+        return pending.result
+
+    def _run_turn(self, session_id: str, message: str) -> Dict[str, Any]:
+        for attempt in range(SESSION_CONFLICT_RETRIES + 1):
+            current_state = self._load_state(session_id)
+            # Procesar el mensaje
+            result = process_message(message, current_state)
+            if self._store_state(session_id, result["state"], attempt):
+                break
+        return self._persist_turn(session_id, message, result)
+
+    async def _arun_turn(self, session_id: str, message: str) -> Dict[str, Any]:
+        for attempt in range(SESSION_CONFLICT_RETRIES + 1):
+            current_state = await run_in_thread(self._load_state, session_id)
+            # Procesar el mensaje
+            result = await aprocess_message(message, current_state)
+            if await run_in_thread(self._store_state, session_id, result["state"], attempt):
+                break
+        return await run_in_thread(self._persist_turn, session_id, message, result)
+
+    async def _astream_turn(self, session_id: str, message: str) -> AsyncIterator[Dict[str, Any]]:
+        for attempt in range(SESSION_CONFLICT_RETRIES + 1):
+            current_state = await run_in_thread(self._load_state, session_id)
+            # Procesar el mensaje reenviando los tokens de la respuesta
+            async for event in astream_message(message, current_state):
+                if event["type"] == "done":
+                    result = event
+                else:
+                    yield event
+            if await run_in_thread(self._store_state, session_id, result["state"], attempt):
+                break
+            yield {"type": "reset"}
+        yield {"type": "done", "result": await run_in_thread(self._persist_turn, session_id, message, result)}
+
+    def _load_state(self, session_id: str) -> Optional[Dict]:
+        # Obtener el estado actual de la conversación si existe, si fue desalojada
+        # de memoria se restaura desde la base de datos
+        current_state = self.sessions.get(session_id)
+        if current_state is None:
+            current_state = self.rehydrate_conversation(session_id)
+        return current_state
+
+    def _resolve_user(self, state: Dict) -> None:
+        # El usuario se guarda una sola vez por sesión, después se usa el ID del estado
+        user_info = state["user_info"]
+        if state.get("user_id") is None and "name" in user_info and "email" in user_info:
+            state["user_id"] = save_user(name=user_info["name"], email=user_info["email"])
+
+    def _store_state(self, session_id: str, state: Dict, attempt: int) -> bool:
+        self._resolve_user(state)
+        # Actualizar el estado, si otro proceso guardó la sesión mientras tanto
+        # se repite el turno sobre el estado más reciente
+        try:
+            self.sessions.put(session_id, state)
+            return True
+        except StaleSessionError:
+            if attempt == SESSION_CONFLICT_RETRIES:
+                raise
+            return False
+
+    def _persist_turn(self, session_id: str, message: str, result: Dict) -> Dict[str, Any]:
         new_state = result["state"]
-        self.active_conversations[session_id] = new_state
-        
+
         # Guardar en la base de datos si tenemos suficiente información
-        if "name" in new_state["user_info"] and "email" in new_state["user_info"]:
-            # Guardar o actualizar usuario
-            user_id = save_user(
-                name=new_state["user_info"]["name"],
-                email=new_state["user_info"]["email"]
-            )
-            
-            # Guardar la conversación
-            save_conversation(
+        user_id = new_state.get("user_id")
+        if user_id is not None:
+            # Guardar la conversación, con la escritura diferida solo se encola
+            persist = self.writer.save_conversation if self.writer is not None else save_conversation
+            persist(
                 user_id=user_id,
                 message=message,
                 response=result["response"],
-                intent=new_state.get("intent", "not_classified")
+                intent=new_state.get("intent", "not_classified"),
+                session_id=session_id,
+                label_source=new_state.get("intent_source")
             )
-        
+
         return {
             "response": result["response"],
             "session_id": session_id,
             "user_info": new_state["user_info"],
-            "intent": new_state.get("intent", "")
+            "intent": new_state.get("intent", ""),
+            "coalesced": False
+        }
+
+    def rehydrate_conversation(self, session_id: str) -> Optional[Dict]:
+        """
+        Reconstruye el estado de una sesión a partir de sus últimos turnos guardados
+
+        Args:
+            session_id (str): Identificador único de la sesión
+
+        Returns:
+            Dict: Estado de la conversación o None si la sesión no tiene turnos guardados
+        """
+        if self.writer is not None:
+            # Los últimos turnos de esta sesión pueden seguir en la cola de escritura,
+            # solo se espera a esos (una sesión nueva no tiene ninguno)
+            self.writer.flush_session(session_id)
+        rows = get_recent_conversations_by_session(session_id, SESSION_REHYDRATE_TURNS)
+        if not rows:
+            return None
+        user = get_user_by_id(rows[-1].user_id)
+        if user is None:
+            return None
+
+        messages = MessageLog(
+            message
+            for row in rows
+            for message in (
+                {"role": "user", "content": row.message},
+                {"role": "assistant", "content": row.response}
+            )
+        )
+        self.rehydrated_sessions += 1
+        # Solo se guardan turnos con nombre y email, así que se retoma en la clasificación
+        return create_initial_state(
+            user_info={"name": user.name, "email": user.email},
+            user_id=user.id,
+            messages=messages,
+            intent=rows[-1].intent or "",
+            current_step="determine_intent"
+        )
+
+    def get_stats(self) -> Dict[str, Any]:
+        """
+        Devuelve las estadísticas del almacén de sesiones
+
+        Returns:
+            Dict: Sesiones activas, tamaño, desalojos, sesiones restauradas, mensajes agrupados
+                y escritura diferida
+        """
+        stats = {
+            **self.sessions.stats(),
+            "rehydrated": self.rehydrated_sessions,
+            "coalesced_messages": self.coalesced_messages,
+            "sessions_in_flight": len(self._mailboxes)
         }
-    
+        if self.writer is not None:
+            stats["write_behind"] = self.writer.stats()
+        return stats
+
     def reset_conversation(self, session_id: str) -> None:
         """
         Reinicia una conversación
-        
+
         Args:
             session_id (str): Identificador único de la sesión
         """
-        if session_id in self.active_conversations:
-            del self.active_conversations[session_id]
\ No newline at end of file
+        self.sessions.delete(session_id)
@@ -1,8 +1,19 @@
-from app.models.models import Session, User, Conversation
+from collections import Counter
+from datetime import datetime, timedelta
+from sqlalchemy import func, insert, select, tuple_, update
+from sqlalchemy.dialects.mysql import insert as mysql_insert
+from sqlalchemy.dialects.postgresql import insert as postgresql_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.exc import IntegrityError
+from app.models.models import Session, User, Conversation, ConversationSession, IntentStat
+from app.utils.metrics import timed_db_write
 
+@timed_db_write("save_user")
 def save_user(name, email):
     """
-    Guarda un usuario en la base de datos
+    Guarda un usuario en la base de datos, si ya existe uno con el mismo email
+    devuelve su ID. Es una sola sentencia atómica (upsert sobre el índice único
+    de email), así dos peticiones simultáneas no crean usuarios duplicados.
     
     Args:
         name (str): Nombre del usuario
@@ -13,23 +24,43 @@ def save_user(name, email):
     """
     session = Session()
     try:
-        # Verificar si el usuario ya existe por email
-        existing_user = session.query(User).filter_by(email=email).first()
-        if existing_user:
-            return existing_user.id
-            
-        # Si no existe, crear nuevo usuario
-        user = User(name=name, email=email)
-        session.add(user)
+        dialect = session.get_bind().dialect.name
+        if dialect == "mysql":
+            # LAST_INSERT_ID(id) hace que lastrowid sea el ID de la fila existente
+            statement = mysql_insert(User).values(name=name, email=email)
+            statement = statement.on_duplicate_key_update(id=func.last_insert_id(User.id))
+            user_id = session.execute(statement).lastrowid
+        elif dialect in ("sqlite", "postgresql"):
+            insert_fn = sqlite_insert if dialect == "sqlite" else postgresql_insert
+            statement = insert_fn(User).values(name=name, email=email)
+            # Actualización sin cambios para que RETURNING devuelva también la fila existente
+            statement = statement.on_conflict_do_update(
+                index_elements=[User.email],
+                set_={"email": statement.excluded.email}
+            ).returning(User.id)
+            user_id = session.execute(statement).scalar_one()
+        else:
+            user_id = _save_user_without_upsert(session, name, email)
         session.commit()
-        return user.id
+        return user_id
     except Exception as e:
         session.rollback()
         raise e
     finally:
         session.close()
 
-def save_conversation(user_id, message, response, intent):
+def _save_user_without_upsert(session, name, email):
+    # Otros motores: insertar y, si el email ya existe, leer el usuario guardado
+    try:
+        with session.begin_nested():
+            user = User(name=name, email=email)
+            session.add(user)
+        return user.id
+    except IntegrityError:
+        return session.query(User.id).filter_by(email=email).scalar()
+
+@timed_db_write("save_conversation")
+def save_conversation(user_id, message, response, intent, session_id=None, label_source=None):
     """
     Guarda una conversación en la base de datos
     
@@ -38,24 +69,115 @@ def save_conversation(user_id, message, response, intent):
         message (str): Mensaje del usuario
         response (str): Respuesta del asistente
         intent (str): Intención detectada
+        session_id (str): Identificador de la sesión del chat
+        label_source (str): Quién clasificó el mensaje ("local", "llm"), None si no se clasificó en el turno
     """
     session = Session()
     try:
         conversation = Conversation(
             user_id=user_id,
+            session_id=session_id,
             message=message,
             response=response,
-            intent=intent
+            intent=intent,
+            label_source=label_source,
+            created_at=datetime.now()
         )
         session.add(conversation)
+        # Actualizar las estadísticas por intent en la misma transacción
+        _increment_intent_stats(session, [{"intent": intent, "created_at": conversation.created_at}])
+        session.flush()
+        conversation_id = conversation.id
         session.commit()
-        return conversation.id
+        return conversation_id
     except Exception as e:
         session.rollback()
         raise e
     finally:
         session.close()
 
+@timed_db_write("save_conversations")
+def save_conversations(rows):
+    """
+    Guarda varios turnos de conversación en un solo INSERT y una sola transacción
+    
+    Args:
+        rows (List[Dict]): Turnos con user_id, session_id, message, response, intent, label_source y created_at
+    """
+    if not rows:
+        return
+    session = Session()
+    try:
+        session.execute(insert(Conversation), rows)
+        _increment_intent_stats(session, rows)
+        session.commit()
+    except Exception as e:
+        session.rollback()
+        raise e
+    finally:
+        session.close()
+
+def hour_bucket(moment):
+    return moment.replace(minute=0, second=0, microsecond=0)
+
+def _increment_intent_stats(session, rows):
+    # Agrupar los turnos por (hora, intent) y sumarlos a la tabla de estadísticas con un upsert
+    counts = Counter((hour_bucket(row["created_at"]), row["intent"] or "") for row in rows)
+    values = [
+        {"hour_bucket": bucket, "intent": intent, "count": count}
+        for (bucket, intent), count in sorted(counts.items())
+    ]
+    dialect = session.get_bind().dialect.name
+    if dialect == "mysql":
+        statement = mysql_insert(IntentStat).values(values)
+        statement = statement.on_duplicate_key_update(count=IntentStat.count + statement.inserted.count)
+    elif dialect in ("sqlite", "postgresql"):
+        insert_fn = sqlite_insert if dialect == "sqlite" else postgresql_insert
+        statement = insert_fn(IntentStat).values(values)
+        statement = statement.on_conflict_do_update(
+            index_elements=[IntentStat.hour_bucket, IntentStat.intent],
+            set_={"count": IntentStat.count + statement.excluded.count}
+        )
+    else:
+        for value in values:
+            updated = session.execute(
+                update(IntentStat)
+                .where(IntentStat.hour_bucket == value["hour_bucket"], IntentStat.intent == value["intent"])
+                .values(count=IntentStat.count + value["count"])
+            ).rowcount
+            if not updated:
+                session.execute(insert(IntentStat).values(**value))
+        return
+    session.execute(statement)
+
+def get_intent_stats(start=None, end=None, intents=None):
+    """
+    Obtiene las conversaciones por hora e intent desde la tabla de estadísticas,
+    sin recorrer la tabla de conversaciones
+    
+    Args:
+        start (datetime): Hora mínima (incluida)
+        end (datetime): Hora máxima (excluida)
+        intents (List[str]): Intents a incluir, todos si está vacío
+        
+    Returns:
+        List[Row]: Filas (hour_bucket, intent, count) ordenadas por hora
+    """
+    query = select(IntentStat.hour_bucket, IntentStat.intent, IntentStat.count).order_by(
+        IntentStat.hour_bucket, IntentStat.intent
+    )
+    if start is not None:
+        query = query.where(IntentStat.hour_bucket >= hour_bucket(start))
+    if end is not None:
+        query = query.where(IntentStat.hour_bucket < end)
+    if intents:
+        query = query.where(IntentStat.intent.in_(intents))
+    session = Session()
+    try:
+        return session.execute(query).all()
+    finally:
+        session.close()
+
 def get_user_by_email(email):
     """
     Obtiene un usuario por su email
@@ -72,9 +194,98 @@ def get_user_by_email(email):
     finally:
         session.close()
 
+def get_user_by_id(user_id):
+    """
+    Obtiene un usuario por su ID
+    
+    Args:
+        user_id (int): ID del usuario
+        
+    Returns:
+        User: Usuario encontrado o None
+    """
+    session = Session()
+    try:
+        return session.get(User, user_id)
+    finally:
+        session.close()
+
+# Columnas que se leen del historial: filas ligeras en lugar de objetos ORM
+CONVERSATION_COLUMNS = (
+    Conversation.id,
+    Conversation.user_id,
+    Conversation.session_id,
+    Conversation.message,
+    Conversation.response,
+    Conversation.intent,
+    Conversation.created_at
+)
+
+def get_recent_conversations_by_session(session_id, limit):
+    """
+    Obtiene los últimos turnos guardados de una sesión del chat. Usa el índice
+    de session_id (que incluye la clave primaria), así que solo lee `limit` filas.
+    
+    Args:
+        session_id (str): Identificador de la sesión
+        limit (int): Número máximo de turnos
+        
+    Returns:
+        List[Row]: Turnos ordenados del más antiguo al más reciente, con los
+            atributos de CONVERSATION_COLUMNS
+    """
+    session = Session()
+    try:
+        rows = session.execute(
+            select(*CONVERSATION_COLUMNS)
+            .where(Conversation.session_id == session_id)
+            .order_by(Conversation.id.desc())
+            .limit(limit)
+        ).all()
+        return list(reversed(rows))
+    finally:
+        session.close()
+
+def iter_conversations_by_user_id(user_id, page_size=500, after=None):
+    """
+    Recorre las conversaciones de un usuario en orden cronológico con paginación
+    por clave (user_id, created_at, id): cada página continúa donde terminó la
+    anterior usando el índice compuesto, sin OFFSET ni ordenar en memoria.
+    
+    Args:
+        user_id (int): ID del usuario
+        page_size (int): Filas leídas por consulta
+        after (Tuple[datetime, int]): (created_at, id) de la última fila ya leída,
+            para continuar un recorrido anterior
+        
+    Yields:
+        Row: Turnos con los atributos de CONVERSATION_COLUMNS
+    """
+    while True:
+        query = (
+            select(*CONVERSATION_COLUMNS)
+            .where(Conversation.user_id == user_id)
+            .order_by(Conversation.created_at, Conversation.id)
+            .limit(page_size)
+        )
+        if after is not None:
+            # Comparación de tuplas (created_at, id) > (x, y), que el índice resuelve como un rango
+            query = query.where(tuple_(Conversation.created_at, Conversation.id) > tuple_(*after))
+        # Una sesión por página para no retener la conexión mientras se consumen las filas
+        session = Session()
+        try:
+            rows = session.execute(query).all()
+        finally:
+            session.close()
+        yield from rows
+        if len(rows) < page_size:
+            return
+        after = (rows[-1].created_at, rows[-1].id)
+
 def get_conversations_by_user_id(user_id):
     """
-    Obtiene todas las conversaciones de un usuario
+    Obtiene todas las conversaciones de un usuario. Carga todas las filas en
+    memoria, para usuarios con mucho historial usar iter_conversations_by_user_id.
     
     Args:
         user_id (int): ID del usuario
@@ -86,4 +297,149 @@ def get_conversations_by_user_id(user_id):
     try:
         return session.query(Conversation).filter_by(user_id=user_id).all()
     finally:
-        session.close()
\ No newline at end of file
+        session.close()
+
+def get_labeled_messages(intents, label_sources, limit=None):
+    """
+    Obtiene los mensajes ya clasificados para entrenar el clasificador local
+    
+    Args:
+        intents (List[str]): Intents válidos a incluir
+        label_sources (List[str]): Orígenes de la etiqueta a incluir (por ejemplo "llm" y "human")
+        limit (int): Número máximo de mensajes (los más recientes)
+        
+    Returns:
+        List[Tuple[str, str]]: Pares (mensaje, intent)
+    """
+    session = Session()
+    try:
+        query = (
+            session.query(Conversation.message, Conversation.intent)
+            .filter(Conversation.intent.in_(intents), Conversation.label_source.in_(label_sources))
+            .order_by(Conversation.id.desc())
+        )
+        if limit:
+            query = query.limit(limit)
+        return [(message, intent) for message, intent in query]
+    finally:
+        session.close()
+
+def get_session_state(session_id):
+    """
+    Obtiene el estado serializado de una sesión del chat
+    
+    Args:
+        session_id (str): Identificador de la sesión
+        
+    Returns:
+        Tuple[bytes, int]: Estado serializado y su versión, o None si no existe
+    """
+    session = Session()
+    try:
+        row = (
+            session.query(ConversationSession.state, ConversationSession.version)
+            .filter_by(session_id=session_id)
+            .first()
+        )
+        return (row.state, row.version) if row else None
+    finally:
+        session.close()
+
+@timed_db_write("save_session_state")
+def save_session_state(session_id, state, expected_version=None):
+    """
+    Guarda el estado serializado de una sesión con control optimista de concurrencia
+    
+    Args:
+        session_id (str): Identificador de la sesión
+        state (bytes): Estado serializado
+        expected_version (int): Versión leída antes de procesar el turno, None si la sesión es nueva
+        
+    Returns:
+        int: Nueva versión, o None si otro proceso modificó la sesión mientras tanto
+    """
+    session = Session()
+    try:
+        if expected_version is None:
+            session.add(ConversationSession(session_id=session_id, state=state, version=1))
+            try:
+                session.commit()
+            except IntegrityError:
+                session.rollback()
+                return None
+            return 1
+        
+        updated = (
+            session.query(ConversationSession)
+            .filter_by(session_id=session_id, version=expected_version)
+            .update(
+                {"state": state, "version": expected_version + 1, "updated_at": datetime.now()},
+                synchronize_session=False
+            )
+        )
+        session.commit()
+        return expected_version + 1 if updated else None
+    except Exception as e:
+        session.rollback()
+        raise e
+    finally:
+        session.close()
+
+def delete_session_state(session_id):
+    """
+    Elimina el estado guardado de una sesión
+    
+    Args:
+        session_id (str): Identificador de la sesión
+        
+    Returns:
+        int: Número de sesiones eliminadas (0 si no existía)
+    """
+    session = Session()
+    try:
+        deleted = session.query(ConversationSession).filter_by(session_id=session_id).delete(synchronize_session=False)
+        session.commit()
+        return deleted
+    except Exception as e:
+        session.rollback()
+        raise e
+    finally:
+        session.close()
+
+def count_session_states():
+    """
+    Cuenta las sesiones guardadas
+    
+    Returns:
+        int: Número de sesiones
+    """
+    session = Session()
+    try:
+        return session.query(ConversationSession).count()
+    finally:
+        session.close()
+
+def delete_expired_session_states(ttl_seconds):
+    """
+    Elimina las sesiones sin actividad durante más de ttl_seconds
+    
+    Args:
+        ttl_seconds (float): Tiempo de inactividad máximo
+        
+    Returns:
+        int: Número de sesiones eliminadas
+    """
+    session = Session()
+    try:
+        deleted = (
+            session.query(ConversationSession)
+            .filter(ConversationSession.updated_at < datetime.now() - timedelta(seconds=ttl_seconds))
+            .delete(synchronize_session=False)
+        )
+        session.commit()
+        return deleted
+    except Exception as e:
+        session.rollback()
+        raise e
+    finally:
+        session.close()
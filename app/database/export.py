@@ -0,0 +1,186 @@
+import argparse
+import csv
+import io
+import json
+import sys
+from datetime import datetime
+from typing import Iterable, Iterator, List, Optional
+from sqlalchemy import select
+from app.config.config import EXPORT_CHUNK_ROWS
+from app.models.models import engine, User, Conversation
+
+try:
+    import pyarrow
+    import pyarrow.parquet as parquet
+except ImportError:  # pyarrow es opcional, solo se necesita para exportar en Parquet
+    pyarrow = None
+
+# Columnas del export: cada turno con los datos de su usuario
+EXPORT_COLUMNS = [
+    "id",
+    "created_at",
+    "session_id",
+    "user_id",
+    "user_name",
+    "user_email",
+    "intent",
+    "message",
+    "response"
+]
+
+EXPORT_FORMATS = ["csv", "jsonl", "parquet"]
+PARQUET_AVAILABLE = pyarrow is not None
+
+def iter_export_chunks(
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    intents: Optional[List[str]] = None,
+    chunk_size: int = EXPORT_CHUNK_ROWS
+) -> Iterator[List[tuple]]:
+    """
+    Lee las conversaciones con su usuario en bloques de tamaño fijo usando un
+    cursor del lado del servidor, así la memoria no depende del número de filas
+
+    Args:
+        start (datetime): Fecha mínima (incluida)
+        end (datetime): Fecha máxima (excluida)
+        intents (List[str]): Intents a incluir, todos si está vacío
+        chunk_size (int): Filas por bloque
+
+    Yields:
+        List[tuple]: Bloques de filas con las columnas de EXPORT_COLUMNS
+    """
+    query = (
+        select(
+            Conversation.id,
+            Conversation.created_at,
+            Conversation.session_id,
+            Conversation.user_id,
+            User.name,
+            User.email,
+            Conversation.intent,
+            Conversation.message,
+            Conversation.response
+        )
+        .outerjoin(User, User.id == Conversation.user_id)
+        .order_by(Conversation.id)
+    )
+    if start is not None:
+        query = query.where(Conversation.created_at >= start)
+    if end is not None:
+        query = query.where(Conversation.created_at < end)
+    if intents:
+        query = query.where(Conversation.intent.in_(intents))
+
+    with engine.connect() as connection:
+        result = connection.execution_options(stream_results=True, yield_per=chunk_size).execute(query)
+        for partition in result.partitions():
+            yield [tuple(row) for row in partition]
+
+def _json_value(value):
+    return value.isoformat() if isinstance(value, datetime) else value
+
+def iter_csv(chunks: Iterable[List[tuple]]) -> Iterator[str]:
+    """Convierte los bloques de filas en texto CSV, un fragmento por bloque"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(EXPORT_COLUMNS)
+    yield buffer.getvalue()
+    for chunk in chunks:
+        buffer.seek(0)
+        buffer.truncate()
+        writer.writerows(chunk)
+        yield buffer.getvalue()
+
+def iter_jsonl(chunks: Iterable[List[tuple]]) -> Iterator[str]:
+    """Convierte los bloques de filas en JSON Lines, un fragmento por bloque"""
+    for chunk in chunks:
+        yield "".join(
+            json.dumps(
+                {column: _json_value(value) for column, value in zip(EXPORT_COLUMNS, row)},
+                ensure_ascii=False
+            ) + "\n"
+            for row in chunk
+        )
+
+TEXT_WRITERS = {"csv": iter_csv, "jsonl": iter_jsonl}
+
+def write_parquet(chunks: Iterable[List[tuple]], sink) -> int:
+    """
+    Escribe los bloques de filas en Parquet, un grupo de filas por bloque
+
+    Args:
+        chunks (Iterable[List[tuple]]): Bloques de filas
+        sink: Ruta o archivo binario de destino
+
+    Returns:
+        int: Número de filas escritas
+    """
+    if pyarrow is None:
+        raise RuntimeError("Para exportar en Parquet hay que instalar pyarrow")
+    schema = pyarrow.schema([
+        ("id", pyarrow.int64()),
+        ("created_at", pyarrow.timestamp("us")),
+        ("session_id", pyarrow.string()),
+        ("user_id", pyarrow.int64()),
+        ("user_name", pyarrow.string()),
+        ("user_email", pyarrow.string()),
+        ("intent", pyarrow.string()),
+        ("message", pyarrow.string()),
+        ("response", pyarrow.string())
+    ])
+    total = 0
+    with parquet.ParquetWriter(sink, schema) as writer:
+        for chunk in chunks:
+            columns = list(zip(*chunk))
+            writer.write_table(pyarrow.Table.from_arrays(
+                [pyarrow.array(column, type=field.type) for column, field in zip(columns, schema)],
+                schema=schema
+            ))
+            total += len(chunk)
+    return total
+
+def export_conversations(output, fmt: str = "csv", **filters) -> None:
+    """
+    Exporta las conversaciones en el formato indicado
+
+    Args:
+        output: Ruta del archivo de destino o "-" para la salida estándar
+        fmt (str): csv, jsonl o parquet
+        **filters: start, end, intents y chunk_size de iter_export_chunks
+    """
+    chunks = iter_export_chunks(**filters)
+    if fmt == "parquet":
+        write_parquet(chunks, sys.stdout.buffer if output == "-" else output)
+        return
+    if fmt not in TEXT_WRITERS:
+        raise ValueError(f"Formato de exportación desconocido: {fmt}")
+    target = sys.stdout if output == "-" else open(output, "w", encoding="utf-8", newline="")
+    try:
+        for text in TEXT_WRITERS[fmt](chunks):
+            target.write(text)
+    finally:
+        if target is not sys.stdout:
+            target.close()
+
+def parse_date(value: Optional[str]) -> Optional[datetime]:
+    """Convierte una fecha ISO (2024-01-31 o 2024-01-31T10:00) en datetime, None si está vacía"""
+    return datetime.fromisoformat(value) if value else None
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Exporta las conversaciones con sus usuarios para análisis")
+    parser.add_argument("--format", choices=EXPORT_FORMATS, default="csv", help="Formato de salida")
+    parser.add_argument("--output", default="-", help="Archivo de destino, - para la salida estándar")
+    parser.add_argument("--start", help="Fecha mínima (incluida), por ejemplo 2024-01-01")
+    parser.add_argument("--end", help="Fecha máxima (excluida)")
+    parser.add_argument("--intent", action="append", default=[], help="Intent a incluir, se puede repetir")
+    parser.add_argument("--chunk-size", type=int, default=EXPORT_CHUNK_ROWS, help="Filas leídas por bloque")
+    args = parser.parse_args()
+    export_conversations(
+        args.output,
+        args.format,
+        start=parse_date(args.start),
+        end=parse_date(args.end),
+        intents=args.intent,
+        chunk_size=args.chunk_size
+    )
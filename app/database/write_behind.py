@@ -0,0 +1,217 @@
+import atexit
+import logging
+import queue
+import threading
+import time
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+from app.config.config import (
+    WRITE_BEHIND_ENABLED,
+    WRITE_BEHIND_BATCH_ROWS,
+    WRITE_BEHIND_FLUSH_MS,
+    WRITE_BEHIND_MAX_PENDING,
+    WRITE_BEHIND_PUT_TIMEOUT
+)
+from app.database.db_handler import save_conversations
+
+logger = logging.getLogger(__name__)
+
+# Marca que detiene el hilo de escritura
+_STOP = object()
+
+class WriteBehindQueue:
+    """
+    Cola de escritura diferida de conversaciones.
+
+    Las peticiones solo encolan el turno y un hilo en segundo plano los guarda
+    en lotes con un único INSERT y un commit por lote. La cola está acotada:
+    si se llena la petición espera (contrapresión) y, si la espera se alarga,
+    guarda su turno directamente para no perderlo.
+    """
+
+    def __init__(
+        self,
+        batch_rows: int = WRITE_BEHIND_BATCH_ROWS,
+        flush_ms: int = WRITE_BEHIND_FLUSH_MS,
+        max_pending: int = WRITE_BEHIND_MAX_PENDING,
+        put_timeout: float = WRITE_BEHIND_PUT_TIMEOUT
+    ):
+        """
+        Args:
+            batch_rows (int): Filas por lote como máximo
+            flush_ms (int): Tiempo máximo que espera una fila antes de escribirse
+            max_pending (int): Filas pendientes como máximo
+            put_timeout (float): Segundos que espera una petición con la cola llena
+        """
+        self.batch_rows = batch_rows
+        self.flush_seconds = flush_ms / 1000
+        self.put_timeout = put_timeout
+        self._queue = queue.Queue(maxsize=max_pending)
+        self._thread: Optional[threading.Thread] = None
+        self._start_lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        # Filas encoladas y todavía sin escribir por sesión, para esperar solo las de una sesión
+        self._session_rows: Dict[str, int] = {}
+        self._sessions_done = threading.Condition()
+        self.counters = {
+            "enqueued": 0,
+            "written": 0,
+            "batches": 0,
+            "failed": 0,
+            "direct_writes": 0  # Turnos guardados directamente por tener la cola llena
+        }
+
+    def start(self) -> "WriteBehindQueue":
+        with self._start_lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="write-behind", daemon=True)
+                self._thread.start()
+                # Escribir lo pendiente al terminar el proceso
+                atexit.register(self.close)
+        return self
+
+    def save_conversation(self, user_id, message, response, intent, session_id=None, label_source=None) -> None:
+        """
+        Encola un turno para guardarlo en segundo plano, mismos argumentos que
+        db_handler.save_conversation
+        """
+        row = {
+            "user_id": user_id,
+            "session_id": session_id,
+            "message": message,
+            "response": response,
+            "intent": intent,
+            "label_source": label_source,
+            "created_at": datetime.now()
+        }
+        self.start()
+        self._track([row], 1)
+        try:
+            self._queue.put(row, timeout=self.put_timeout)
+        except queue.Full:
+            try:
+                save_conversations([row])
+            finally:
+                self._track([row], -1)
+            self._count("direct_writes")
+            return
+        self._count("enqueued")
+
+    def flush(self) -> None:
+        """Espera a que se escriban todas las filas encoladas hasta ahora"""
+        if self._thread is not None:
+            self._queue.join()
+
+    def flush_session(self, session_id: str, timeout: Optional[float] = None) -> bool:
+        """
+        Espera a que se escriban las filas encoladas de una sesión, sin esperar
+        a las de las demás. Si la sesión no tiene filas pendientes vuelve enseguida.
+
+        Args:
+            session_id (str): Identificador de la sesión
+            timeout (float): Segundos máximos de espera, None = sin límite
+
+        Returns:
+            bool: True si ya no quedan filas pendientes de la sesión
+        """
+        with self._sessions_done:
+            return self._sessions_done.wait_for(lambda: session_id not in self._session_rows, timeout)
+
+    def _track(self, rows: List[Dict], delta: int) -> None:
+        with self._sessions_done:
+            for row in rows:
+                session_id = row.get("session_id")
+                if session_id is None:
+                    continue
+                count = self._session_rows.get(session_id, 0) + delta
+                if count > 0:
+                    self._session_rows[session_id] = count
+                else:
+                    self._session_rows.pop(session_id, None)
+            if delta < 0:
+                self._sessions_done.notify_all()
+
+    def close(self) -> None:
+        """Escribe las filas pendientes y detiene el hilo"""
+        with self._start_lock:
+            thread, self._thread = self._thread, None
+        if thread is None:
+            return
+        self._queue.put(_STOP)
+        thread.join()
+
+    def __len__(self) -> int:
+        return self._queue.qsize()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._stats_lock:
+            return {**self.counters, "pending": len(self)}
+
+    def _count(self, key: str, amount: int = 1) -> None:
+        with self._stats_lock:
+            self.counters[key] += amount
+
+    def _run(self) -> None:
+        stopping = False
+        while not stopping:
+            item = self._queue.get()
+            if item is _STOP:
+                self._queue.task_done()
+                break
+            batch: List[Dict] = [item]
+            # Juntar filas hasta completar el lote o hasta que venza el plazo de la primera
+            deadline = time.monotonic() + self.flush_seconds
+            while len(batch) < self.batch_rows:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    item = self._queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                if item is _STOP:
+                    self._queue.task_done()
+                    stopping = True
+                    break
+                batch.append(item)
+            self._write(batch)
+            for _ in batch:
+                self._queue.task_done()
+        # Escribir lo que quede en la cola antes de terminar
+        remaining_rows = []
+        while True:
+            try:
+                item = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is _STOP:
+                self._queue.task_done()
+            else:
+                remaining_rows.append(item)
+        for start in range(0, len(remaining_rows), self.batch_rows):
+            self._write(remaining_rows[start:start + self.batch_rows])
+        for _ in remaining_rows:
+            self._queue.task_done()
+
+    def _write(self, batch: List[Dict]) -> None:
+        try:
+            save_conversations(batch)
+        except Exception:
+            logger.exception("No se pudieron guardar %d turnos de conversación", len(batch))
+            self._count("failed", len(batch))
+            return
+        finally:
+            self._track(batch, -1)
+        self._count("written", len(batch))
+        self._count("batches")
+
+def create_write_behind(enabled: bool = WRITE_BEHIND_ENABLED) -> Optional[WriteBehindQueue]:
+    """
+    Crea la cola de escritura diferida si está activada en la configuración
+
+    Returns:
+        WriteBehindQueue: Cola iniciada o None si los turnos se guardan directamente
+    """
+    if not enabled:
+        return None
+    return WriteBehindQueue().start()
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Text, DateTime, create_engine
+from sqlalchemy import Column, Index, Integer, String, Text, DateTime, LargeBinary, create_engine
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 from datetime import datetime
@@ -15,7 +15,7 @@ class User(Base):
     
     id = Column(Integer, primary_key=True)
     name = Column(String(100))
-    email = Column(String(100))
+    email = Column(String(100), unique=True)  # Único para poder guardar el usuario con un upsert
     created_at = Column(DateTime, default=datetime.now)
     updated_at = Column(DateTime, default=datetime.now, onupdate=datetime.now)
 
@@ -24,10 +24,33 @@ class Conversation(Base):
     
     id = Column(Integer, primary_key=True)
     user_id = Column(Integer)
+    session_id = Column(String(64), index=True)  # Sesión del chat, para recuperar el historial
     message = Column(Text)
     response = Column(Text)
     intent = Column(String(50))  # Almacena el intent detectado
+    label_source = Column(String(10))  # Quién asignó el intent: "local", "llm" o "human"
     created_at = Column(DateTime, default=datetime.now)
+    
+    __table_args__ = (
+        # Historial de un usuario en orden cronológico con paginación por clave
+        Index('ix_conversations_user_created', 'user_id', 'created_at', 'id'),
+    )
+
+class ConversationSession(Base):
+    __tablename__ = 'sessions'
+    
+    session_id = Column(String(64), primary_key=True)
+    version = Column(Integer, nullable=False, default=1)  # Versión para el control optimista de concurrencia
+    state = Column(LargeBinary(length=16777215))  # Estado serializado (MEDIUMBLOB en MySQL)
+    updated_at = Column(DateTime, default=datetime.now, onupdate=datetime.now, index=True)
+
+class IntentStat(Base):
+    __tablename__ = 'intent_stats'
+    
+    # Conversaciones por hora e intent, se actualiza al guardar cada turno
+    hour_bucket = Column(DateTime, primary_key=True)
+    intent = Column(String(50), primary_key=True)
+    count = Column(Integer, nullable=False, default=0)
 
 # Configuración de la base de datos
 engine = create_engine(DATABASE_URL)
@@ -47,7 +47,7 @@ document.addEventListener('DOMContentLoaded', () => {
         
         messageDiv.innerHTML = `
             <div class="message-content">
-                ${content}
+                <span class="message-text">${content}</span>
                 <div class="message-time">${timeString}</div>
             </div>
         `;
@@ -56,6 +56,8 @@ document.addEventListener('DOMContentLoaded', () => {
         
         // Scroll al último mensaje
         chatMessages.scrollTop = chatMessages.scrollHeight;
+        
+        return messageDiv.querySelector('.message-text');
     }
     
     // Función para mostrar indicador de escritura
@@ -84,25 +86,90 @@ document.addEventListener('DOMContentLoaded', () => {
         }
     }
     
-    // Función para enviar mensaje al backend
+    // Función para leer una respuesta Server-Sent Events, llama a onEvent(evento, datos) por cada evento
+    async function readEventStream(body, onEvent) {
+        const reader = body.getReader();
+        const decoder = new TextDecoder();
+        let buffer = '';
+        
+        while (true) {
+            const { value, done } = await reader.read();
+            if (done) {
+                break;
+            }
+            buffer += decoder.decode(value, { stream: true });
+            
+            // Los eventos están separados por una línea en blanco
+            let boundary;
+            while ((boundary = buffer.indexOf('\n\n')) !== -1) {
+                const rawEvent = buffer.slice(0, boundary);
+                buffer = buffer.slice(boundary + 2);
+                
+                let eventName = 'message';
+                let data = '';
+                for (const line of rawEvent.split('\n')) {
+                    if (line.startsWith('event: ')) {
+                        eventName = line.slice(7);
+                    } else if (line.startsWith('data: ')) {
+                        data += line.slice(6);
+                    }
+                }
+                onEvent(eventName, data ? JSON.parse(data) : {});
+            }
+        }
+    }
+    
+    // Función para enviar mensaje al backend, la respuesta se muestra a medida que llegan los tokens
     function sendMessage(message) {
         // Mostrar indicador de escritura
         showTypingIndicator();
         
-        fetch('/send_message', {
+        let botText = null;
+        let streamed = '';
+        
+        fetch('/send_message/stream', {
             method: 'POST',
             headers: {
                 'Content-Type': 'application/json'
             },
             body: JSON.stringify({ message })
         })
-        .then(response => response.json())
-        .then(data => {
-            // Ocultar indicador de escritura
-            hideTypingIndicator();
-            
-            // Mostrar respuesta del bot
-            appendMessage('bot', data.response);
+        .then(response => {
+            if (!response.ok) {
+                throw new Error(`HTTP ${response.status}`);
+            }
+            return readEventStream(response.body, (eventName, data) => {
+                if (eventName === 'token') {
+                    // Con el primer token se reemplaza el indicador de escritura por el mensaje
+                    if (botText === null) {
+                        hideTypingIndicator();
+                        botText = appendMessage('bot', '');
+                    }
+                    streamed += data.content;
+                    botText.textContent = streamed;
+                    chatMessages.scrollTop = chatMessages.scrollHeight;
+                } else if (eventName === 'reset') {
+                    // El servidor repite el turno, se descarta el texto recibido
+                    streamed = '';
+                    if (botText !== null) {
+                        botText.textContent = '';
+                    }
+                } else if (eventName === 'done') {
+                    hideTypingIndicator();
+                    // Los mensajes agrupados con otro turno no tienen respuesta propia
+                    if (data.coalesced) {
+                        return;
+                    }
+                    // Las respuestas sin tokens (plantillas) llegan completas en el evento final
+                    if (botText === null) {
+                        appendMessage('bot', data.response);
+                    } else {
+                        botText.textContent = data.response;
+                    }
+                } else if (eventName === 'error') {
+                    throw new Error(data.message);
+                }
+            });
         })
         .catch(error => {
             console.error('Error:', error);
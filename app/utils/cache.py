@@ -0,0 +1,104 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, Optional
+
+class TTLCache:
+    """
+    Caché en memoria acotada por número de entradas y por antigüedad.
+    Con la caché llena se desalojan las entradas usadas hace más tiempo.
+    """
+
+    def __init__(
+        self,
+        max_entries: Optional[int] = None,
+        ttl_seconds: Optional[float] = None,
+        on_evict: Optional[Callable[[Hashable, Any], None]] = None
+    ):
+        """
+        Args:
+            max_entries (int): Número máximo de entradas
+            ttl_seconds (float): Tiempo desde que se guardó una entrada tras el que expira
+            on_evict (Callable): Función llamada con (clave, valor) al desalojar o expirar una entrada
+        """
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.on_evict = on_evict
+        self._entries = OrderedDict()  # clave -> (valor, momento en que se guardó)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = {"ttl": 0, "max_entries": 0}
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        evicted = []
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and self._expired(entry[1], time.monotonic()):
+                self._remove(key, "ttl", evicted)
+                entry = None
+            if entry is None:
+                self.misses += 1
+                value = default
+            else:
+                self.hits += 1
+                self._entries.move_to_end(key)
+                value = entry[0]
+        self._notify(evicted)
+        return value
+
+    def put(self, key: Hashable, value: Any, stored_at: Optional[float] = None) -> None:
+        # stored_at (time.monotonic()) permite que un valor cargado de otro almacén conserve su antigüedad
+        evicted = []
+        with self._lock:
+            self._entries.pop(key, None)
+            self._entries[key] = (value, time.monotonic() if stored_at is None else stored_at)
+            self._evict(evicted)
+        self._notify(evicted)
+
+    def delete(self, key: Hashable) -> None:
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def stats(self) -> Dict[str, Any]:
+        total = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+            "evictions": dict(self.evictions)
+        }
+
+    def _expired(self, stored_at: float, now: float) -> bool:
+        return self.ttl_seconds is not None and now - stored_at > self.ttl_seconds
+
+    def _remove(self, key: Hashable, reason: str, evicted: list) -> None:
+        value, _ = self._entries.pop(key)
+        self.evictions[reason] += 1
+        evicted.append((key, value))
+
+    def _evict(self, evicted: list) -> None:
+        # Las entradas expiradas se retiran al recorrer por orden de uso, las que
+        # quedan detrás de una entrada vigente se retiran al leerlas
+        now = time.monotonic()
+        while self._entries:
+            key, (_, stored_at) = next(iter(self._entries.items()))
+            if not self._expired(stored_at, now):
+                break
+            self._remove(key, "ttl", evicted)
+        while self.max_entries is not None and len(self._entries) > self.max_entries:
+            self._remove(next(iter(self._entries)), "max_entries", evicted)
+
+    def _notify(self, evicted: list) -> None:
+        if self.on_evict is None:
+            return
+        for key, value in evicted:
+            self.on_evict(key, value)
@@ -0,0 +1,39 @@
+import asyncio
+from contextlib import ExitStack
+from typing import Callable, ContextManager, List
+
+# Funciones que devuelven un context manager que envuelve cada llamada en el hilo
+# de run_in_thread (por ejemplo el perfilador, para muestrear ese hilo)
+_thread_hooks: List[Callable[[], ContextManager]] = []
+
+def register_thread_hook(hook: Callable[[], ContextManager]) -> None:
+    """
+    Registra un hook que se ejecuta en el hilo de cada llamada a run_in_thread.
+    El hook se llama con el contexto (contextvars) de quien llamó a run_in_thread.
+
+    Args:
+        hook (Callable): Función sin argumentos que devuelve un context manager
+    """
+    _thread_hooks.append(hook)
+
+def _run_with_hooks(function: Callable, args, kwargs):
+    if not _thread_hooks:
+        return function(*args, **kwargs)
+    with ExitStack() as stack:
+        for hook in _thread_hooks:
+            stack.enter_context(hook())
+        return function(*args, **kwargs)
+
+async def run_in_thread(function: Callable, *args, **kwargs):
+    """
+    Igual que asyncio.to_thread, pero la llamada se envuelve con los hooks registrados
+
+    Args:
+        function (Callable): Función bloqueante a ejecutar en un hilo
+        *args: Argumentos posicionales de la función
+        **kwargs: Argumentos con nombre de la función
+
+    Returns:
+        Resultado de la función
+    """
+    return await asyncio.to_thread(_run_with_hooks, function, args, kwargs)
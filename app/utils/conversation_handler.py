@@ -1,10 +1,42 @@
-from typing import Dict, TypedDict, List, Annotated, Literal
-import operator
+from typing import AsyncIterator, Dict, Optional, TypedDict, Annotated
+import asyncio
+import json
+import time
 from langchain_openai import ChatOpenAI
 from langchain.prompts import ChatPromptTemplate
 from langgraph.graph import StateGraph, END
-from app.utils.intent_classifier import classify_intent
-from app.config.config import OPENAI_API_KEY
+from langgraph.config import get_stream_writer
+from langgraph.constants import TAG_NOSTREAM
+from app.utils.intent_classifier import (
+    INTENTS,
+    aclassify_intent_with_llm,
+    label_source,
+    local_intent,
+    record_fallback,
+    parse_intent
+)
+from app.utils.extractors import EMAIL_RE, extract_name, extract_email
+from app.utils.response_templates import render_step_template
+from app.utils.response_cache import response_cache
+from app.utils import knowledge_base
+from app.utils.transcript import Transcript, count_tokens, truncate_tokens
+from app.utils.message_log import MessageLog, append_messages
+from app.utils.metrics import (
+    timed_node,
+    turn_duration,
+    llm_metrics,
+    speculative_replies,
+    speculative_wasted_tokens
+)
+from app.config.config import (
+    OPENAI_API_KEY,
+    HISTORY_MAX_MESSAGES,
+    SUMMARY_BATCH_MESSAGES,
+    HISTORY_TOKEN_BUDGET,
+    HISTORY_TOKEN_BUDGETS,
+    CONVERSATION_MODE,
+    SPECULATIVE_REPLY
+)
 from rich.console import Console
 from langsmith import traceable
 
@@ -16,19 +48,24 @@ def merge_dicts(dict1: Dict, dict2: Dict) -> Dict:
     merged.update(dict2)
     return merged
 
-# Función para fusionar listas
-def merge_lists(list1: List, list2: List) -> List:
-    return list1 + list2
-
 # Definir el estado del grafo
 class ConversationState(TypedDict):
     # Usar Annotated con la función merge_dicts para user_info
     user_info: Annotated[Dict, merge_dicts]
-    # Usar Annotated con la función merge_lists para messages
-    messages: Annotated[List[Dict], merge_lists]
+    # Registro de mensajes de solo agregar, los nodos devuelven solo los mensajes nuevos
+    messages: Annotated[MessageLog, append_messages]
     collected_data: Dict
     intent: str
+    # Quién clasificó el mensaje del turno ("local" o "llm"), None si el turno no lo clasificó
+    intent_source: Optional[str]
     current_step: str
+    # Historial renderizado de forma incremental a partir de messages
+    transcript: Transcript
+    # Resumen de los mensajes que ya no se envían textualmente en los prompts
+    summary: str
+    summarized_count: int
+    # ID del usuario en la base de datos, se resuelve una vez por sesión
+    user_id: int
 
 llm = ChatOpenAI(api_key=OPENAI_API_KEY, model="gpt-3.5-turbo")
 
@@ -92,14 +129,122 @@ prompts = {
         Nombre: {name}
         Email: {email}
         """
+    ),
+    "single_shot": ChatPromptTemplate.from_template(
+        """Eres un asistente de ventas virtual amigable que atiende a clientes por WhatsApp.
+        
+        Información del usuario:
+        Nombre: {name}
+        Email: {email}
+        
+        Categorías de lo que puede pedir el cliente: {intents}
+        {intent_hint}
+        
+        Historial de conversación:
+        {conversation_history}
+        
+        Analiza el último mensaje del cliente y responde solo con un objeto JSON con estas claves:
+        - "name": el nombre del cliente si lo dice en el mensaje, si no null
+        - "email": el correo electrónico del cliente si lo dice en el mensaje, si no null
+        - "intent": la categoría exacta que corresponde al mensaje
+        - "reply": tu respuesta al cliente
+        
+        Si todavía falta el nombre o el correo del cliente, agradécele lo que haya compartido y pídele el dato que falta.
+        Si ya tienes ambos, ayúdale con lo que necesita: si quiere realizar un nuevo pedido, ayúdale a hacerlo;
+        si necesita información sobre productos, proporciona detalles generales; si tiene una queja, muestra empatía y ofrece soluciones.
+        Escribe la respuesta de manera natural, como si fuera una conversación por WhatsApp.
+        """
+    ),
+    "summarize_history": ChatPromptTemplate.from_template(
+        """Eres un asistente que resume conversaciones de atención al cliente.
+        Actualiza el resumen con los nuevos mensajes. Conserva los datos del cliente,
+        lo que ha pedido y lo que se le ha respondido.
+        
+        Responde solo con el resumen, en no más de 5 oraciones.
+        
+        Resumen actual:
+        {summary}
+        
+        Nuevos mensajes:
+        {messages}
+        """
     )
 }
 
-def build_conversation_history(state: ConversationState) -> str:
-    return "\n".join([f"{m['role']}: {m['content']}" for m in state["messages"]])
+# Tokens de historial enviados por prompt
+history_stats = {}
+
+def get_transcript(state: ConversationState) -> Transcript:
+    transcript = state.get("transcript")
+    if transcript is None:
+        transcript = Transcript()
+    # Solo se renderizan los mensajes agregados desde la última llamada
+    return transcript.sync(state["messages"])
+
+# Tokens que se envían como mínimo del último mensaje aunque el resumen agote el presupuesto
+LAST_MESSAGE_MIN_TOKENS = 64
 
-def request_missing_data(state: ConversationState, data_type: str) -> Dict:
-    conversation_history = build_conversation_history(state)
+def build_conversation_history(state: ConversationState, prompt_name: str = "default") -> str:
+    """
+    Construye el historial para un prompt: el resumen de los mensajes antiguos
+    más los mensajes recientes que caben en el presupuesto de tokens del prompt
+    
+    Args:
+        state (ConversationState): Estado de la conversación
+        prompt_name (str): Prompt en el que se usará el historial
+        
+    Returns:
+        str: Historial de conversación
+    """
+    transcript = get_transcript(state)
+    budget = HISTORY_TOKEN_BUDGETS.get(prompt_name, HISTORY_TOKEN_BUDGET)
+    
+    summary = state.get("summary", "")
+    summary_text = f"Resumen de la conversación anterior: {summary}\n" if summary else ""
+    summary_tokens = count_tokens(summary_text) if summary else 0
+    
+    first = state.get("summarized_count", 0)
+    history_budget = max(budget - summary_tokens, 0)
+    start = transcript.fit_start(first, history_budget)
+    history = transcript.slice(start)
+    history_tokens = transcript.tokens(start)
+    if history_tokens > history_budget:
+        # El último mensaje no cabe solo en el presupuesto: se envía recortado, nunca se omite
+        history = truncate_tokens(history, max(history_budget, LAST_MESSAGE_MIN_TOKENS))
+        history_tokens = count_tokens(history)
+    
+    stats = history_stats.setdefault(prompt_name, {"calls": 0, "tokens": 0, "max_tokens": 0, "dropped_messages": 0})
+    tokens = summary_tokens + history_tokens
+    stats["calls"] += 1
+    stats["tokens"] += tokens
+    stats["max_tokens"] = max(stats["max_tokens"], tokens)
+    stats["dropped_messages"] += max(start - first, 0)
+    
+    return summary_text + history
+
+def get_history_stats() -> Dict:
+    """
+    Devuelve los tokens de historial enviados por prompt
+    
+    Returns:
+        Dict: Llamadas, tokens totales, máximo por llamada y mensajes descartados por presupuesto
+    """
+    return {name: dict(stats) for name, stats in history_stats.items()}
+
+def needs_summary(state: ConversationState) -> bool:
+    pending = len(state["messages"]) - HISTORY_MAX_MESSAGES - state.get("summarized_count", 0)
+    return pending >= SUMMARY_BATCH_MESSAGES
+
+async def request_missing_data(state: ConversationState, data_type: str) -> Dict:
+    next_step = "get_name" if data_type == "nombre" else "get_email"
+    content = render_step_template("request_name" if data_type == "nombre" else "request_email")
+    if content is not None:
+        return {
+            "messages": [{"role": "assistant", "content": content}],
+            "current_step": next_step
+        }
+    
+    conversation_history = build_conversation_history(state, "request_missing_data")
     prompt_template = ChatPromptTemplate.from_template(
         f"""Eres un asistente de ventas virtual amigable.
         Necesito tu {data_type} para continuar con el servicio.
@@ -112,48 +257,29 @@ def request_missing_data(state: ConversationState, data_type: str) -> Dict:
         {{conversation_history}}
         """
     )
-    response = llm.invoke(prompt_template.format(conversation_history=conversation_history))
+    response = await llm.ainvoke(prompt_template.format(conversation_history=conversation_history))
     console.log('[red] -> Respuesta del asistente: [/red]', response.content)
     # Devolver solo los cambios, no un estado completo
     return {
         "messages": [{"role": "assistant", "content": response.content}],
-        "current_step": "get_name" if data_type == "nombre" else "get_email"
+        "current_step": next_step
     }
 
 @traceable
-def greeting(state: ConversationState) -> Dict:
+async def greeting(state: ConversationState) -> Dict:
     console.log('Estado inicial de la conversación:', state)
-    conversation_history = build_conversation_history(state)
-    response = llm.invoke(prompts["greeting"].format(conversation_history=conversation_history))
-    # Retornar solo los cambios al estado
+    content = render_step_template("greeting")
+    if content is None:
+        conversation_history = build_conversation_history(state, "greeting")
+        content = (await llm.ainvoke(prompts["greeting"].format(conversation_history=conversation_history))).content
+    # Retornar solo los cambios al estado, el saludo ya pide nombre y correo
+    # así que el siguiente mensaje se procesa en get_name
     return {
-        "messages": [{"role": "assistant", "content": response.content}],
-        "current_step": "validate_user_info"
+        "messages": [{"role": "assistant", "content": content}],
+        "current_step": "get_name"
     }
 
-@traceable
-def validate_user_info(state: ConversationState) -> Dict:
-    console.log('Entrando en la validacion de user info')
-    name = state["user_info"].get("name", "Unknown")
-    email = state["user_info"].get("email", "unknown@example.com")
-    
-    if name == "Unknown":
-        console.log('Nombre no encontrado, pidiendo nombre')
-        return request_missing_data(state, "nombre")
-    
-    if email == "unknown@example.com" or not ("@" in email and "." in email):
-        console.log('Email no encontrado o inválido, pidiendo email')
-        return request_missing_data(state, "correo electrónico")
-    
-    console.log('Nombre y email válidos, continuando')
-    # Si todo está validado, continúa al siguiente paso
-    return {
-        "current_step": "determine_intent"
-    }
-
-@traceable
-def get_name(state: ConversationState) -> Dict:
-    user_message = state["messages"][-1]["content"]
+async def extract_name_with_llm(message: str) -> str:
     extract_prompt = ChatPromptTemplate.from_template(
         """Extrae el nombre del siguiente mensaje:
         
@@ -162,152 +288,499 @@ def get_name(state: ConversationState) -> Dict:
         Solo devuelve el nombre sin explicaciones ni comillas. Si no hay un nombre claro, devuelve 'Unknown'."""
     )
     name_chain = extract_prompt | llm
-    name = name_chain.invoke({"message": user_message}).content.strip()
+    return (await name_chain.ainvoke({"message": message})).content.strip()
+
+async def extract_email_with_llm(message: str) -> str:
+    extract_prompt = ChatPromptTemplate.from_template(
+        """Extrae el email del siguiente mensaje:
+        
+        Mensaje: {message}
+        
+        Solo devuelve el email sin explicaciones ni comillas. Si no hay un email claro, devuelve 'unknown@example.com'."""
+    )
+    email_chain = extract_prompt | llm
+    return (await email_chain.ainvoke({"message": message})).content.strip()
+
+@traceable
+async def get_name(state: ConversationState) -> Dict:
+    user_message = state["messages"][-1]["content"]
+    # Primero se intenta con las heurísticas locales, el LLM solo si el caso es ambiguo
+    name, ambiguous = extract_name(user_message)
+    if name is None:
+        name = await extract_name_with_llm(user_message) if ambiguous else "Unknown"
     
     if name == "Unknown":
         # Volver a pedir nombre
-        return request_missing_data(state, "nombre")
+        return await request_missing_data(state, "nombre")
+    
+    # Si el cliente dio también su email en el mismo mensaje se salta el paso get_email
+    email, _ = extract_email(user_message)
+    if email:
+        return await confirm_email(state, {"name": name, "email": email})
     
-    conversation_history = build_conversation_history(state)
-    response = llm.invoke(prompts["get_name"].format(name=name, conversation_history=conversation_history))
+    content = render_step_template("get_name", name=name)
+    if content is None:
+        conversation_history = build_conversation_history(state, "get_name")
+        content = (await llm.ainvoke(prompts["get_name"].format(name=name, conversation_history=conversation_history))).content
     
     # Retornar solo los cambios
     return {
         "user_info": {"name": name},
-        "messages": [{"role": "assistant", "content": response.content}],
-        "current_step": "validate_user_info"
+        "messages": [{"role": "assistant", "content": content}],
+        "current_step": "get_email"
     }
 
 @traceable
-def get_email(state: ConversationState) -> Dict:
+async def get_email(state: ConversationState) -> Dict:
     user_message = state["messages"][-1]["content"]
-    extract_prompt = ChatPromptTemplate.from_template(
-        """Extrae el email del siguiente mensaje:
-        
-        Mensaje: {message}
-        
-        Solo devuelve el email sin explicaciones ni comillas. Si no hay un email claro, devuelve 'unknown@example.com'."""
-    )
-    email_chain = extract_prompt | llm
-    email = email_chain.invoke({"message": user_message}).content.strip()
+    email, ambiguous = extract_email(user_message)
+    if email is None:
+        email = await extract_email_with_llm(user_message) if ambiguous else "unknown@example.com"
     
     if email == "unknown@example.com" or not ("@" in email and "." in email):
-        return request_missing_data(state, "correo electrónico")
+        return await request_missing_data(state, "correo electrónico")
     
-    conversation_history = build_conversation_history(state)
-    response = llm.invoke(prompts["get_email"].format(email=email, conversation_history=conversation_history))
+    return await confirm_email(state, {"email": email})
+
+async def confirm_email(state: ConversationState, user_info: Dict) -> Dict:
+    content = render_step_template("get_email", email=user_info["email"])
+    if content is None:
+        conversation_history = build_conversation_history(state, "get_email")
+        content = (await llm.ainvoke(prompts["get_email"].format(email=user_info["email"], conversation_history=conversation_history))).content
     
     # Retornar solo los cambios
     return {
-        "user_info": {"email": email},
-        "messages": [{"role": "assistant", "content": response.content}],
-        "current_step": "validate_user_info"
+        "user_info": user_info,
+        "messages": [{"role": "assistant", "content": content}],
+        "current_step": "determine_intent"
     }
 
 @traceable
-def determine_intent(state: ConversationState) -> Dict:
+async def determine_intent(state: ConversationState) -> Dict:
     user_message = state["messages"][-1]["content"]
-    intent = classify_intent(user_message)
+    intent, prediction = local_intent(user_message)
+    if intent is None:
+        intent = record_fallback(prediction, await aclassify_intent_with_llm(user_message))
     return {
         "intent": intent,
+        "intent_source": label_source(prediction, intent),
         "current_step": "provide_service"
     }
 
-@traceable
-def provide_service(state: ConversationState) -> Dict:
+def service_prompt(state: ConversationState, intent: str) -> str:
     name = state["user_info"].get("name", "Unknown")
     email = state["user_info"].get("email", "unknown@example.com")
     
-    conversation_history = build_conversation_history(state)
+    conversation_history = build_conversation_history(state, "provide_service")
     
-    response = llm.invoke(prompts["provide_service"].format(
-        intent=state["intent"],
+    return prompts["provide_service"].format(
+        intent=intent,
         name=name,
         email=email,
         conversation_history=conversation_history
-    ))
+    )
+
+@traceable
+async def provide_service(state: ConversationState) -> Dict:
+    user_message = state["messages"][-1]["content"]
+    # Horarios, promociones y reservaciones se responden con la base de conocimiento y las
+    # preguntas frecuentes parecidas a una ya respondida con la caché, sin llamar al LLM
+    content = knowledge_base.answer(state["intent"], user_message, state["user_info"])
+    if content is None:
+        content = response_cache.get(state["intent"], user_message, state["user_info"])
+    if content is None:
+        content = (await llm.ainvoke(service_prompt(state, state["intent"]))).content
+        response_cache.put(state["intent"], user_message, content, state["user_info"])
     
     # Retornar solo los cambios
     return {
-        "messages": [{"role": "assistant", "content": response.content}],
+        "messages": [{"role": "assistant", "content": content}],
         "current_step": "determine_intent"  # Para continuar la conversación
     }
 
+# Resultado de las respuestas especulativas
+speculation_stats = {
+    "hits": 0,                      # La respuesta especulativa se usó
+    "misses": 0,                    # El intent no coincidió y se regeneró la respuesta
+    "wasted_prompt_tokens": 0,      # Tokens de prompt de las respuestas descartadas
+    "wasted_completion_tokens": 0   # Tokens generados de las descartadas (si ya habían terminado)
+}
+
+def get_speculation_stats() -> Dict:
+    """
+    Devuelve los contadores de las respuestas especulativas
+    
+    Returns:
+        Dict: Aciertos, fallos, tasa de acierto y tokens desperdiciados
+    """
+    total = speculation_stats["hits"] + speculation_stats["misses"]
+    return {**speculation_stats, "hit_rate": speculation_stats["hits"] / total if total else 0.0}
+
+def _discard_speculation(task: asyncio.Task, prompt: str) -> None:
+    completion_tokens = 0
+    if task.done() and not task.cancelled() and task.exception() is None:
+        completion_tokens = count_tokens(task.result().content)
+    task.cancel()
+    prompt_tokens = count_tokens(prompt)
+    speculation_stats["misses"] += 1
+    speculation_stats["wasted_prompt_tokens"] += prompt_tokens
+    speculation_stats["wasted_completion_tokens"] += completion_tokens
+    speculative_replies.inc("miss")
+    speculative_wasted_tokens.inc("prompt", amount=prompt_tokens)
+    if completion_tokens:
+        speculative_wasted_tokens.inc("completion", amount=completion_tokens)
+
+@traceable
+async def speculative_service(state: ConversationState) -> Dict:
+    """
+    determine_intent y provide_service en paralelo: si el clasificador local duda,
+    la respuesta para el intent probable (el del turno anterior o la mejor predicción
+    local) se genera mientras el LLM clasifica el mensaje. Si el intent coincide se
+    usa esa respuesta, si no se cancela y se genera la del intent correcto.
+    """
+    user_message = state["messages"][-1]["content"]
+    intent, prediction = local_intent(user_message)
+    guess = state.get("intent") or (prediction[0] if prediction else None)
+    # Si la base de conocimiento responde el intent probable no hace falta adelantar la respuesta
+    if intent is not None or guess is None or knowledge_base.covers(guess, user_message):
+        if intent is None:
+            intent = record_fallback(prediction, await aclassify_intent_with_llm(user_message))
+        return {
+            "intent": intent,
+            "intent_source": label_source(prediction, intent),
+            **await provide_service({**state, "intent": intent})
+        }
+    
+    prompt = service_prompt(state, guess)
+    reply_task = asyncio.create_task(llm.ainvoke(prompt))
+    try:
+        # La clasificación no forma parte de la respuesta, no se transmite al cliente
+        intent = record_fallback(
+            prediction,
+            await aclassify_intent_with_llm(user_message, config={"tags": [TAG_NOSTREAM]})
+        )
+    except BaseException:
+        reply_task.cancel()
+        raise
+    
+    if intent != guess:
+        _discard_speculation(reply_task, prompt)
+        # Los clientes que reciben la respuesta token a token descartan el texto especulativo
+        get_stream_writer()({"type": "reset"})
+        return {
+            "intent": intent,
+            "intent_source": label_source(prediction, intent),
+            **await provide_service({**state, "intent": intent})
+        }
+    
+    response = await reply_task
+    speculation_stats["hits"] += 1
+    speculative_replies.inc("hit")
+    response_cache.put(intent, user_message, response.content, state["user_info"])
+    return {
+        "intent": intent,
+        "intent_source": label_source(prediction, intent),
+        "messages": [{"role": "assistant", "content": response.content}],
+        "current_step": "determine_intent"
+    }
+
+def parse_turn_output(content: str) -> Dict:
+    """
+    Interpreta la respuesta JSON de la llamada single-shot
+    
+    Args:
+        content (str): Contenido de la respuesta del LLM
+        
+    Returns:
+        Dict: name, email, intent y reply; si la respuesta no es JSON se usa como reply
+    """
+    start, end = content.find("{"), content.rfind("}")
+    try:
+        output = json.loads(content[start:end + 1]) if start != -1 else None
+    except ValueError:
+        output = None
+    if not isinstance(output, dict):
+        return {"name": None, "email": None, "intent": None, "reply": content.strip()}
+    return {
+        key: output[key].strip() if isinstance(output.get(key), str) and output[key].strip() else None
+        for key in ("name", "email", "intent", "reply")
+    }
+
+def _needs_extraction_call(user_info: Dict, message: str) -> bool:
+    # Igual que get_name/get_email: solo se consulta al LLM si las heurísticas dudan
+    if "name" not in user_info:
+        name, ambiguous = extract_name(message)
+    else:
+        name, ambiguous = extract_email(message)
+    return name is None and ambiguous
+
+def _clean_extracted_name(name: Optional[str]) -> Optional[str]:
+    if not name or name.lower() == "unknown" or len(name) > 60 or EMAIL_RE.search(name):
+        return None
+    return name
+
+@traceable
+async def single_shot(state: ConversationState) -> Dict:
+    """
+    Paso del modo single-shot: extracción de datos, clasificación y respuesta en una
+    sola llamada al LLM con salida JSON. Los cambios al estado se aplican aquí.
+    Si el flujo normal no necesita más de una llamada (heurísticas seguras o
+    clasificador local confiado) se usa ese flujo.
+    """
+    user_message = state["messages"][-1]["content"]
+    user_info = state["user_info"]
+    onboarding = "name" not in user_info or "email" not in user_info
+    prediction = None
+    if onboarding:
+        if not _needs_extraction_call(user_info, user_message):
+            return await (get_name if "name" not in user_info else get_email)(state)
+    else:
+        intent, prediction = local_intent(user_message)
+        if intent is not None:
+            return {
+                "intent": intent,
+                "intent_source": label_source(prediction, intent),
+                **await provide_service({**state, "intent": intent})
+            }
+    
+    conversation_history = build_conversation_history(state, "single_shot")
+    # Modo JSON de OpenAI; la llamada no se transmite token a token porque su contenido es JSON
+    structured_llm = llm.bind(response_format={"type": "json_object"}).with_config(tags=[TAG_NOSTREAM])
+    response = await structured_llm.ainvoke(prompts["single_shot"].format(
+        name=user_info.get("name", "(desconocido)"),
+        email=user_info.get("email", "(desconocido)"),
+        intents=", ".join(INTENTS),
+        intent_hint="" if onboarding else "El cliente ya se identificó, clasifica su mensaje y ayúdale.",
+        conversation_history=conversation_history
+    ))
+    output = parse_turn_output(response.content)
+    
+    if not onboarding:
+        intent = record_fallback(prediction, parse_intent(output["intent"] or ""))
+        if output["reply"] is None:
+            # Sin respuesta utilizable se responde con el flujo normal
+            return {
+                "intent": intent,
+                "intent_source": label_source(prediction, intent),
+                **await provide_service({**state, "intent": intent})
+            }
+        return {
+            "intent": intent,
+            "intent_source": label_source(prediction, intent),
+            "messages": [{"role": "assistant", "content": output["reply"]}],
+            "current_step": "determine_intent"
+        }
+    
+    # Los datos se validan localmente, las heurísticas tienen prioridad sobre el LLM
+    info = {}
+    if "name" not in user_info:
+        name = extract_name(user_message)[0] or _clean_extracted_name(output["name"])
+        if name:
+            info["name"] = name
+    if "email" not in user_info:
+        email = extract_email(user_message)[0]
+        if email is None and output["email"] and EMAIL_RE.fullmatch(output["email"]):
+            email = output["email"]
+        if email:
+            info["email"] = email
+    known = {**user_info, **info}
+    
+    if output["reply"] is None:
+        if "name" not in known:
+            return {"user_info": info, **await request_missing_data(state, "nombre")}
+        if "email" not in known:
+            return {"user_info": info, **await request_missing_data(state, "correo electrónico")}
+        return await confirm_email(state, info)
+    
+    return {
+        "user_info": info,
+        "messages": [{"role": "assistant", "content": output["reply"]}],
+        "current_step": "get_name" if "name" not in known else "get_email" if "email" not in known else "determine_intent"
+    }
+
 @traceable
-def should_continue(state: ConversationState) -> Literal["continue_conversation", "end_conversation"]:
-    last_user_messages = [m for m in state["messages"] if m["role"] == "user"]
-    if not last_user_messages:
-        return "continue_conversation"
-    last_message = last_user_messages[-1]["content"].lower()
-    end_keywords = ["adios", "adiós", "chao", "hasta luego", "terminar", 
-                    "finalizar", "gracias por tu ayuda", "gracias por todo", 
-                    "eso es todo", "eso sería todo"]
-    if any(keyword in last_message for keyword in end_keywords):
-        return "end_conversation"
-    bot_messages_count = len([m for m in state["messages"] if m["role"] == "assistant"])
-    if bot_messages_count > 10:
-        return "end_conversation"
-    return "continue_conversation"
+async def summarize_history(state: ConversationState) -> Dict:
+    console.log('Actualizando el resumen del historial')
+    transcript = get_transcript(state)
+    start = state.get("summarized_count", 0)
+    end = len(state["messages"]) - HISTORY_MAX_MESSAGES
+    response = await llm.ainvoke(prompts["summarize_history"].format(
+        summary=state.get("summary") or "(sin resumen)",
+        messages=transcript.slice(start, end)
+    ))
+    # Retornar solo los cambios
+    return {
+        "summary": response.content.strip(),
+        "summarized_count": end
+    }
+
+# Pasos desde los que se puede retomar una conversación
+STEPS = [
+    "greeting",
+    "get_name",
+    "get_email",
+    "determine_intent",
+    "provide_service"
+]
 
 @traceable
 def router(state: ConversationState) -> str:
-    return state["current_step"]
+    step = state.get("current_step") or "greeting"
+    return step if step in STEPS else "greeting"
 
 @traceable
-def create_conversation_graph():
+def entry_router(state: ConversationState) -> str:
+    # Antes de retomar el paso guardado se resumen los mensajes que salieron de la ventana
+    if needs_summary(state):
+        return "summarize_history"
+    return router(state)
+
+# Modos del grafo: el flujo de varias llamadas o una llamada single-shot por turno
+CONVERSATION_MODES = ["multi_call", "single_shot"]
+
+@traceable
+def create_conversation_graph(mode: str = CONVERSATION_MODE, speculative: bool = SPECULATIVE_REPLY):
+    if mode not in CONVERSATION_MODES:
+        raise ValueError(f"Modo de conversación desconocido: {mode}")
+    
     workflow = StateGraph(ConversationState)
-    workflow.add_node("greeting", greeting)
-    workflow.add_node("validate_user_info", validate_user_info)
-
-    workflow.add_node("get_name", get_name)
-    workflow.add_node("get_email", get_email)
-    workflow.add_node("determine_intent", determine_intent)
-    workflow.add_node("provide_service", provide_service)
-    
-    # AQUI SE DEFINE CUAL ES EL NODO INICIAL
-    workflow.set_entry_point("greeting")
-    # DESPUES DE EJECUTAR GREETING, SE VA A VALIDAR LA INFO DEL USUARIO
-    workflow.add_edge("greeting", "validate_user_info")
-
-    # workflow.add_edge("validate_user_info", "get_name")
-    # workflow.add_edge("validate_user_info", "get_email")
-    # workflow.add_edge("validate_user_info", "determine_intent")
-    # workflow.add_edge("get_name", "validate_user_info")
-    # workflow.add_edge("get_email", "validate_user_info")
-    # workflow.add_edge("determine_intent", "provide_service")
-    workflow.add_conditional_edges(
-        "provide_service",
-        should_continue,
-        {
-            "continue_conversation": "determine_intent",
-            "end_conversation": END,
-            "get_name": END,
-            "get_email": END,
-        }
+    workflow.add_node("greeting", timed_node("greeting", greeting))
+    
+    if mode == "single_shot":
+        # Los pasos de onboarding y de servicio se atienden con una sola llamada al LLM
+        workflow.add_node("single_shot", timed_node("single_shot", single_shot))
+        targets = {step: "single_shot" for step in ("get_name", "get_email", "determine_intent", "provide_service")}
+        service_node = "single_shot"
+    else:
+        workflow.add_node("get_name", timed_node("get_name", get_name))
+        workflow.add_node("get_email", timed_node("get_email", get_email))
+        workflow.add_node("provide_service", timed_node("provide_service", provide_service))
+        targets = {step: step for step in ("get_name", "get_email", "determine_intent", "provide_service")}
+        service_node = "provide_service"
+        workflow.add_edge("get_name", END)
+        workflow.add_edge("get_email", END)
+        if speculative:
+            # La clasificación y la respuesta se hacen en paralelo en un solo nodo
+            workflow.add_node("speculative_service", timed_node("speculative_service", speculative_service))
+            targets["determine_intent"] = "speculative_service"
+            workflow.add_edge("speculative_service", END)
+        else:
+            workflow.add_node("determine_intent", timed_node("determine_intent", determine_intent))
+            workflow.add_edge("determine_intent", "provide_service")
+    workflow.add_node("summarize_history", timed_node("summarize_history", summarize_history))
+    targets["greeting"] = "greeting"
+    
+    # AQUI SE DEFINE CUAL ES EL NODO INICIAL: se retoma en el paso guardado en la sesión
+    workflow.set_conditional_entry_point(
+        entry_router,
+        {**targets, "summarize_history": "summarize_history"}
     )
+    workflow.add_conditional_edges("summarize_history", router, targets)
+
+    # Los pasos que responden al usuario terminan el turno y dejan current_step
+    # apuntando al nodo que procesará el siguiente mensaje
+    workflow.add_edge("greeting", END)
+    workflow.add_edge(service_node, END)
     return workflow.compile()
 
 conversation_graph = create_conversation_graph()
 
-@traceable
-def process_message(message: str, state: ConversationState = None) -> Dict:
-    if state is None:
-        state = {
-            "user_info": {},
-            "messages": [],
-            "collected_data": {},
-            "intent": "",
-            "current_step": "greeting"
-        }
+def create_initial_state(**values) -> ConversationState:
+    """
+    Crea el estado de una conversación nueva
     
-    # Agregar el mensaje del usuario al estado
-    if "messages" in state:
-        state["messages"].append({"role": "user", "content": message})
-    else:
-        state["messages"] = [{"role": "user", "content": message}]
+    Args:
+        **values: Valores que reemplazan a los iniciales
+        
+    Returns:
+        ConversationState: Estado inicial
+    """
+    state = {
+        "user_info": {},
+        "messages": MessageLog(),
+        "collected_data": {},
+        "intent": "",
+        "intent_source": None,
+        "current_step": "greeting",
+        "transcript": Transcript(),
+        "summary": "",
+        "summarized_count": 0,
+        "user_id": None
+    }
+    state.update(values)
+    return state
+
+# Nodos cuya respuesta del LLM se envía al cliente token a token, el resto de las
+# llamadas (extracción, clasificación, resumen) no forman parte de la respuesta.
+# Las llamadas JSON de single_shot y la clasificación de speculative_service llevan
+# la etiqueta nostream; si se descarta una respuesta especulativa se emite un evento reset
+STREAMED_NODES = {"greeting", "provide_service", "single_shot", "speculative_service"}
+
+def prepare_graph_input(message: str, state: ConversationState = None) -> ConversationState:
+    if state is None:
+        state = create_initial_state()
     
-    result = conversation_graph.invoke(state)
+    # Agregar el mensaje del usuario sin copiar la lista ni modificar el estado recibido
+    messages = MessageLog.from_messages(state.get("messages")).appended([{"role": "user", "content": message}])
+    transcript = state.get("transcript")
+    if transcript is None:
+        transcript = Transcript()
+    # intent_source se limpia para que un turno que no clasifica el mensaje no herede la etiqueta anterior
+    return {**state, "messages": messages, "transcript": transcript, "intent_source": None}
+
+def finish_turn(result: ConversationState) -> Dict:
+    # Dejar el historial al día con la respuesta del turno
+    result["transcript"].sync(result["messages"])
     return {
         "response": result["messages"][-1]["content"],
         "state": result
-    }
\ No newline at end of file
+    }
+
+# Configuración de cada ejecución del grafo: el callback de métricas cuenta las llamadas al LLM
+GRAPH_CONFIG = {"callbacks": [llm_metrics]}
+
+@traceable
+async def aprocess_message(message: str, state: ConversationState = None) -> Dict:
+    started = time.perf_counter()
+    result = await conversation_graph.ainvoke(prepare_graph_input(message, state), config=GRAPH_CONFIG)
+    turn_duration.observe(time.perf_counter() - started)
+    return finish_turn(result)
+
+async def astream_message(message: str, state: ConversationState = None) -> AsyncIterator[Dict]:
+    """
+    Procesa un mensaje emitiendo los tokens de la respuesta a medida que el LLM los genera
+    
+    Args:
+        message (str): Mensaje del usuario
+        state (ConversationState): Estado actual de la conversación
+        
+    Yields:
+        Dict: Eventos {"type": "token", "content": ...}, {"type": "reset"} si se
+            descarta el texto enviado y al final {"type": "done", "response": ..., "state": ...}
+    """
+    started = time.perf_counter()
+    result = None
+    async for mode, chunk in conversation_graph.astream(
+        prepare_graph_input(message, state),
+        config=GRAPH_CONFIG,
+        stream_mode=["messages", "values", "custom"]
+    ):
+        if mode == "values":
+            result = chunk
+            continue
+        if mode == "custom":
+            # Eventos emitidos por los nodos, por ejemplo reset al descartar una respuesta especulativa
+            yield chunk
+            continue
+        message_chunk, metadata = chunk
+        if metadata.get("langgraph_node") in STREAMED_NODES and message_chunk.content:
+            yield {"type": "token", "content": message_chunk.content}
+    turn_duration.observe(time.perf_counter() - started)
+    yield {"type": "done", **finish_turn(result)}
+
+def process_message(message: str, state: ConversationState = None) -> Dict:
+    """
+    Versión síncrona de aprocess_message, ejecuta el turno en un bucle de eventos propio.
+    No se puede llamar desde un bucle de eventos en ejecución, ahí se usa aprocess_message.
+    """
+    return asyncio.run(aprocess_message(message, state))
@@ -0,0 +1,140 @@
+import re
+from typing import Optional, Tuple
+from app.utils.intent_model import SEED_EXAMPLES, normalize_text
+
+# Email "casi RFC 5322": parte local con los caracteres permitidos y dominio con TLD alfabético
+EMAIL_RE = re.compile(
+    r"(?<![\w.!#$%&'*+/=?^`{|}~-])"
+    r"([A-Za-z0-9!#$%&'*+/=?^_`{|}~-]+(?:\.[A-Za-z0-9!#$%&'*+/=?^_`{|}~-]+)*"
+    r"@"
+    r"(?:[A-Za-z0-9](?:[A-Za-z0-9-]{0,61}[A-Za-z0-9])?\.)+[A-Za-z]{2,})"
+)
+
+# Indicios de que el mensaje intenta dar un email aunque no sea válido
+EMAIL_HINT_RE = re.compile(r"@|\barroba\b|\bgmail\b|\bhotmail\b|\boutlook\b|\byahoo\b|\bcorreo\b", re.IGNORECASE)
+
+NAME_WORD = r"[A-Za-zÁÉÍÓÚÜÑáéíóúüñ][A-Za-zÁÉÍÓÚÜÑáéíóúüñ'-]*"
+
+# Frases con las que el cliente suele presentarse,
+# junto con si el nombre debe ir en mayúscula para aceptarlo ("soy feliz" no es un nombre)
+NAME_PATTERNS = [
+    (re.compile(rf"\b(?:me\s+llamo|mi\s+nombre\s+es|ll[aá]mame|puedes\s+llamarme)\s+({NAME_WORD}(?:\s+{NAME_WORD}){{0,3}})", re.IGNORECASE), False),
+    (re.compile(rf"\b(?:yo\s+)?soy\s+({NAME_WORD}(?:\s+{NAME_WORD}){{0,3}})", re.IGNORECASE), True),
+]
+
+# Saludos que se ignoran cuando el mensaje solo contiene el nombre
+GREETINGS = {"hola", "buenas", "hey", "saludos"}
+
+# Partículas permitidas dentro de un nombre compuesto
+NAME_PARTICLES = {"de", "del", "la", "las", "los", "y"}
+
+# Verbos con los que el cliente habla de sí mismo sin dar su nombre ("soy de México", "vengo de Lima")
+NAME_VERBS = {"soy", "vengo", "estoy", "vivo", "escribo", "hablo", "trabajo", "llamo", "busco"}
+
+# Palabras que nunca forman parte de un nombre
+NAME_STOPWORDS = NAME_VERBS | {
+    "hola", "buenas", "buenos", "buen", "dia", "dias", "tardes", "noches", "gracias",
+    "si", "no", "ok", "okay", "vale", "claro", "bien", "mal", "que", "quiero", "necesito",
+    "tengo", "un", "una", "el", "mi", "tu", "su", "cliente", "nuevo", "nueva", "aqui",
+    "correo", "email", "nombre", "es", "con", "por", "para", "favor", "muy", "ya",
+    "hey", "saludos", "pues", "bueno", "perdon", "disculpa", "a", "e", "o", "en",
+    # Conjunciones y palabras con las que sigue la frase después del nombre ("Carlos pero dime Charly")
+    "pero", "aunque", "sino", "ni", "porque", "como", "cuando", "dime", "dicen", "tambien", "solo"
+}
+
+# Palabras comunes que en un mensaje de una sola palabra no se aceptan como nombre sin
+# consultar al LLM: las de los ejemplos de intents más respuestas y saludos frecuentes
+COMMON_WORDS = (
+    {word for messages in SEED_EXAMPLES.values() for message in messages for word in normalize_text(message).split()}
+    | {
+        "perfecto", "adios", "ayuda", "horarios", "precio", "listo", "genial", "excelente",
+        "entendido", "dale", "exacto", "correcto", "chao", "hasta", "luego", "info", "informacion",
+        "pregunta", "consulta", "duda", "reservaciones", "pedidos", "ordenes", "envio", "envios",
+        "devolucion", "factura", "catalogo", "menu", "tienda", "ubicacion", "direccion", "telefono"
+    }
+) - NAME_PARTICLES
+
+def extract_email(message: str) -> Tuple[Optional[str], bool]:
+    """
+    Extrae un email del mensaje sin usar el LLM
+
+    Args:
+        message (str): Mensaje del usuario
+
+    Returns:
+        Tuple[Optional[str], bool]: Email encontrado (o None) y si el caso es ambiguo
+        y conviene consultar al LLM
+    """
+    emails = EMAIL_RE.findall(message or "")
+    if len({email.lower() for email in emails}) == 1:
+        return emails[0], False
+    if emails:
+        # Varios emails distintos en el mismo mensaje
+        return None, True
+    return None, bool(EMAIL_HINT_RE.search(message or ""))
+
+def _clean_name(words) -> Optional[str]:
+    name_words = []
+    for word in words:
+        normalized = normalize_text(word)
+        if normalized in NAME_PARTICLES:
+            if not name_words:
+                break
+            name_words.append(word.lower())
+            continue
+        if normalized in NAME_STOPWORDS or not normalized:
+            break
+        name_words.append(word[0].upper() + word[1:].lower())
+    # No terminar el nombre con una partícula ("Ana de")
+    while name_words and name_words[-1] in NAME_PARTICLES:
+        name_words.pop()
+    return " ".join(name_words) or None
+
+def extract_name(message: str) -> Tuple[Optional[str], bool]:
+    """
+    Extrae el nombre del mensaje sin usar el LLM. Reconoce frases como
+    "me llamo ...", "mi nombre es ...", "soy ..." o un mensaje que solo
+    contiene el nombre.
+
+    Args:
+        message (str): Mensaje del usuario
+
+    Returns:
+        Tuple[Optional[str], bool]: Nombre encontrado (o None) y si el caso es ambiguo
+        y conviene consultar al LLM
+    """
+    text = EMAIL_RE.sub(" ", message or "").strip()
+    if not normalize_text(text):
+        return None, False
+
+    for pattern, requires_capital in NAME_PATTERNS:
+        match = pattern.search(text)
+        if match and (match.group(1)[0].isupper() or not requires_capital):
+            words = match.group(1).split()
+            name = _clean_name(words)
+            if name:
+                used = words[:len(name.split())]
+                if len(used) > 1 and any(w[0].islower() and normalize_text(w) not in NAME_PARTICLES for w in used):
+                    # "me llamo ana del barrio": varias palabras en minúscula, decide el LLM
+                    return None, True
+                return name, False
+
+    # Mensaje que solo contiene el nombre, quitando saludos y puntuación ("Hola, Ana López")
+    words = [w for w in re.findall(NAME_WORD, text) if normalize_text(w) not in GREETINGS]
+    if all(normalize_text(w) in NAME_STOPWORDS for w in words):
+        return None, False
+    if len(words) > 4 or re.search(r"\d", text):
+        return None, True
+    if any(normalize_text(w) in NAME_STOPWORDS | COMMON_WORDS for w in words):
+        # "Perfecto", "Soy de México", "precios": palabras que no son un nombre
+        return None, True
+    if len(words) == 1:
+        # Una sola palabra solo es un nombre seguro si va en mayúscula ("Ana"), "ana" se consulta al LLM
+        if words[0][0].isupper() and len(words[0]) > 1:
+            return _clean_name(words), False
+        return None, True
+    if all(w[0].isupper() or normalize_text(w) in NAME_PARTICLES for w in words):
+        name = _clean_name(words)
+        if name and len(name.split()) == len(words):
+            return name, False
+    return None, True
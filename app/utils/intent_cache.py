@@ -0,0 +1,172 @@
+import atexit
+import logging
+import queue
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, Optional
+from app.config.config import INTENT_CACHE_MAX_ENTRIES, INTENT_CACHE_TTL_SECONDS, INTENT_CACHE_PATH
+from app.utils.cache import TTLCache
+from app.utils.intent_model import normalize_text
+from app.utils.metrics import intent_cache_lookups
+
+logger = logging.getLogger(__name__)
+
+# Cada cuánto se borran del archivo las clasificaciones expiradas
+PURGE_INTERVAL_SECONDS = 3600
+# Clasificaciones escritas en el archivo por transacción como máximo
+WRITE_BATCH_ROWS = 100
+
+class IntentCache:
+    """
+    Memoria de las clasificaciones hechas por el LLM. Los mensajes se normalizan
+    (minúsculas, sin acentos, signos ni espacios repetidos), así "Hola!" y "hola"
+    comparten entrada. Opcionalmente se guardan en un archivo SQLite para que
+    sobrevivan a los reinicios; las escrituras las hace en lotes un hilo en
+    segundo plano y un error del archivo solo se registra, nunca llega al turno.
+    """
+
+    def __init__(
+        self,
+        max_entries: int = INTENT_CACHE_MAX_ENTRIES,
+        ttl_seconds: float = INTENT_CACHE_TTL_SECONDS,
+        path: str = INTENT_CACHE_PATH
+    ):
+        """
+        Args:
+            max_entries (int): Mensajes guardados en memoria como máximo
+            ttl_seconds (float): Tiempo tras el que se vuelve a clasificar un mensaje
+            path (str): Archivo SQLite donde persistir las clasificaciones, vacío = solo memoria
+        """
+        self.ttl_seconds = ttl_seconds
+        self._memory = TTLCache(max_entries, ttl_seconds)
+        self._lock = threading.Lock()
+        self._db = None
+        self._writes = queue.Queue()
+        self._writer: Optional[threading.Thread] = None
+        self._purged_at = 0.0
+        if path:
+            try:
+                self._db = sqlite3.connect(path, check_same_thread=False)
+                self._db.execute(
+                    "CREATE TABLE IF NOT EXISTS intent_cache ("
+                    "message TEXT PRIMARY KEY, intent TEXT NOT NULL, created_at REAL NOT NULL)"
+                )
+                self._db.commit()
+                self._purge_expired()
+            except sqlite3.Error:
+                logger.exception("No se pudo abrir la caché de intents %s, se usa solo memoria", path)
+                self._db = None
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, message: str) -> Optional[str]:
+        """
+        Devuelve el intent guardado para el mensaje normalizado
+
+        Args:
+            message (str): Mensaje del usuario
+
+        Returns:
+            Optional[str]: Intent o None si no está guardado o expiró
+        """
+        key = normalize_text(message or "")
+        if not key:
+            return None
+        intent = self._memory.get(key)
+        if intent is None and self._db is not None:
+            row = self._load(key)
+            if row is not None:
+                intent, created_at = row
+                # Se conserva la antigüedad de la fila para que no reciba un TTL nuevo
+                self._memory.put(key, intent, stored_at=time.monotonic() - (time.time() - created_at))
+        with self._lock:
+            if intent is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        intent_cache_lookups.inc("miss" if intent is None else "hit")
+        return intent
+
+    def put(self, message: str, intent: str) -> None:
+        key = normalize_text(message or "")
+        if not key:
+            return
+        self._memory.put(key, intent)
+        if self._db is not None:
+            self._start_writer()
+            self._writes.put((key, intent, time.time()))
+
+    def flush(self) -> None:
+        """Espera a que se escriban en el archivo las clasificaciones pendientes"""
+        if self._writer is not None:
+            self._writes.join()
+
+    def clear(self) -> None:
+        self._memory.clear()
+        if self._db is not None:
+            self.flush()
+            self._execute("DELETE FROM intent_cache")
+
+    def stats(self) -> Dict[str, Any]:
+        total = self.hits + self.misses
+        return {
+            "entries": len(self._memory),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+            "persistent": self._db is not None
+        }
+
+    def _load(self, key: str) -> Optional[tuple]:
+        try:
+            with self._lock:
+                row = self._db.execute(
+                    "SELECT intent, created_at FROM intent_cache WHERE message = ?", (key,)
+                ).fetchone()
+        except sqlite3.Error:
+            logger.exception("No se pudo leer la caché de intents")
+            return None
+        if row is None:
+            return None
+        if self.ttl_seconds is not None and time.time() - row[1] > self.ttl_seconds:
+            return None
+        return row
+
+    def _execute(self, sql: str, params=(), many: bool = False) -> None:
+        try:
+            with self._lock:
+                if many:
+                    self._db.executemany(sql, params)
+                else:
+                    self._db.execute(sql, params)
+                self._db.commit()
+        except sqlite3.Error:
+            logger.exception("No se pudo escribir en la caché de intents")
+
+    def _purge_expired(self) -> None:
+        self._purged_at = time.monotonic()
+        if self.ttl_seconds is not None:
+            self._execute("DELETE FROM intent_cache WHERE created_at < ?", (time.time() - self.ttl_seconds,))
+
+    def _start_writer(self) -> None:
+        with self._lock:
+            if self._writer is None:
+                self._writer = threading.Thread(target=self._run, name="intent-cache", daemon=True)
+                self._writer.start()
+                # Escribir lo pendiente al terminar el proceso
+                atexit.register(self.flush)
+
+    def _run(self) -> None:
+        while True:
+            rows = [self._writes.get()]
+            while len(rows) < WRITE_BATCH_ROWS:
+                try:
+                    rows.append(self._writes.get_nowait())
+                except queue.Empty:
+                    break
+            self._execute("INSERT OR REPLACE INTO intent_cache (message, intent, created_at) VALUES (?, ?, ?)", rows, many=True)
+            if time.monotonic() - self._purged_at > PURGE_INTERVAL_SECONDS:
+                self._purge_expired()
+            for _ in rows:
+                self._writes.task_done()
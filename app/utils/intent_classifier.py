@@ -1,6 +1,8 @@
 from langchain_openai import ChatOpenAI
 from langchain.prompts import ChatPromptTemplate
-from app.config.config import OPENAI_API_KEY
+from app.config.config import OPENAI_API_KEY, INTENT_CONFIDENCE_THRESHOLD, INTENT_MIN_MARGIN, INTENT_TRAINING_LIMIT
+from app.utils.intent_model import IntentModel, seed_examples
+from app.utils.intent_cache import IntentCache
 
 # Intents disponibles
 INTENTS = [
@@ -16,12 +18,72 @@ INTENTS = [
     "not_applicable"
 ]
 
+# Origen de la etiqueta de intent guardada con cada turno. Solo se entrena con las del
+# LLM (incluidas las de la caché de sus clasificaciones) y las corregidas a mano, nunca
+# con las predicciones del propio modelo local
+LABEL_SOURCE_LOCAL = "local"
+LABEL_SOURCE_LLM = "llm"
+LABEL_SOURCE_HUMAN = "human"
+TRAINING_LABEL_SOURCES = [LABEL_SOURCE_LLM, LABEL_SOURCE_HUMAN]
+
 # Inicializar el modelo de chat
 llm = ChatOpenAI(api_key=OPENAI_API_KEY, model="gpt-3.5-turbo")
 
+# Clasificador local, se entrena con los ejemplos base y luego con la base de datos
+local_model = IntentModel(INTENTS).fit(seed_examples(), calibrate=True)
+
+# Clasificaciones del LLM ya hechas, por mensaje normalizado
+intent_cache = IntentCache()
+
+# Contadores del clasificador local
+stats = {
+    "local_hits": 0,      # Mensajes resueltos sin llamar al LLM
+    "llm_fallbacks": 0,   # Mensajes con confianza baja enviados al LLM
+    "agreements": 0,      # Fallbacks en los que el LLM coincidió con el modelo local
+    "disagreements": 0    # Fallbacks en los que el LLM no coincidió
+}
+
+def train_local_model(limit=INTENT_TRAINING_LIMIT):
+    """
+    Reentrena el clasificador local con los mensajes de la tabla conversations
+    clasificados por el LLM o corregidos a mano
+    
+    Args:
+        limit (int): Número máximo de mensajes a usar
+        
+    Returns:
+        int: Número de ejemplos usados en el entrenamiento
+    """
+    from app.database.db_handler import get_labeled_messages
+    
+    global local_model
+    examples = seed_examples() + get_labeled_messages(INTENTS, TRAINING_LABEL_SOURCES, limit=limit)
+    local_model = IntentModel(INTENTS).fit(examples, calibrate=True)
+    return local_model.n_samples
+
+def get_classifier_stats():
+    """
+    Devuelve los contadores del clasificador local
+    
+    Returns:
+        Dict: Contadores, tasa de aciertos locales, tasa de acuerdo con el LLM
+            y aciertos de la caché de clasificaciones
+    """
+    total = stats["local_hits"] + stats["llm_fallbacks"]
+    compared = stats["agreements"] + stats["disagreements"]
+    return {
+        **stats,
+        "hit_rate": stats["local_hits"] / total if total else 0.0,
+        "agreement_rate": stats["agreements"] / compared if compared else 0.0,
+        "training_samples": local_model.n_samples,
+        "cache": intent_cache.stats()
+    }
+
 def classify_intent(message):
     """
     Clasifica la intención del usuario basado en el mensaje.
+    Primero se usa el clasificador local y, si su confianza es baja, la
+    clasificación guardada de un mensaje igual; solo si no hay se consulta al LLM.
     
     Args:
         message (str): Mensaje del usuario
@@ -29,22 +91,118 @@ def classify_intent(message):
     Returns:
         str: Intent clasificado
     """
-    prompt = ChatPromptTemplate.from_template(
-        """Clasifica el siguiente mensaje de un cliente en una de estas categorías:
-        {intents}
+    intent, prediction = local_intent(message)
+    if intent is not None:
+        return intent
+    return record_fallback(prediction, classify_intent_with_llm(message))
+
+async def aclassify_intent(message):
+    """
+    Versión asíncrona de classify_intent
+    
+    Args:
+        message (str): Mensaje del usuario
         
-        Mensaje del cliente: {message}
+    Returns:
+        str: Intent clasificado
+    """
+    intent, prediction = local_intent(message)
+    if intent is not None:
+        return intent
+    return record_fallback(prediction, await aclassify_intent_with_llm(message))
+
+def local_intent(message):
+    """
+    Clasifica el mensaje sin llamar al LLM: con el modelo local o con la
+    clasificación guardada de un mensaje igual
+    
+    Args:
+        message (str): Mensaje del usuario
         
-        Solo devuelve el nombre exacto de la categoría sin explicaciones ni comillas.
-        """
-    )
+    Returns:
+        Tuple: Intent si la confianza es suficiente o el mensaje ya se clasificó (si no None)
+            y la predicción del modelo, que se pasa a record_fallback con el intent del LLM
+    """
+    prediction = local_model.predict(message)
+    if is_confident(prediction):
+        stats["local_hits"] += 1
+        return prediction[0], prediction
+    cached = intent_cache.get(message)
+    return (cached if cached in INTENTS else None), prediction
+
+def is_confident(prediction):
+    # Confianza suficiente y clara ventaja sobre el segundo intent más probable
+    return bool(prediction) and prediction[1] >= INTENT_CONFIDENCE_THRESHOLD and prediction[2] >= INTENT_MIN_MARGIN
+
+def label_source(prediction, intent):
+    """
+    Origen del intent obtenido para un mensaje
+
+    Args:
+        prediction (Tuple): Predicción del modelo local (intent, confianza, margen) o None
+        intent (str): Intent final del mensaje
+
+    Returns:
+        str: LABEL_SOURCE_LOCAL si lo decidió el modelo local, si no LABEL_SOURCE_LLM
+    """
+    if is_confident(prediction) and prediction[0] == intent:
+        return LABEL_SOURCE_LOCAL
+    return LABEL_SOURCE_LLM
+
+def record_fallback(prediction, intent):
+    stats["llm_fallbacks"] += 1
+    if prediction:
+        stats["agreements" if prediction[0] == intent else "disagreements"] += 1
+    return intent
+
+classification_prompt = ChatPromptTemplate.from_template(
+    """Clasifica el siguiente mensaje de un cliente en una de estas categorías:
+    {intents}
     
-    chain = prompt | llm
-    result = chain.invoke({"intents": ", ".join(INTENTS), "message": message})
-    intent = result.content.strip().lower()
+    Mensaje del cliente: {message}
+    
+    Solo devuelve el nombre exacto de la categoría sin explicaciones ni comillas.
+    """
+)
+
+def parse_intent(content):
+    intent = content.strip().lower()
     
     # Asegurarse que el intent pertenece a la lista de intents válidos
     if intent not in INTENTS:
         intent = "not_applicable"
         
-    return intent
\ No newline at end of file
+    return intent
+
+def classify_intent_with_llm(message):
+    """
+    Clasifica la intención del usuario usando el LLM.
+    
+    Args:
+        message (str): Mensaje del usuario
+        
+    Returns:
+        str: Intent clasificado
+    """
+    chain = classification_prompt | llm
+    result = chain.invoke({"intents": ", ".join(INTENTS), "message": message})
+    intent = parse_intent(result.content)
+    intent_cache.put(message, intent)
+    return intent
+
+async def aclassify_intent_with_llm(message, config=None):
+    """
+    Versión asíncrona de classify_intent_with_llm
+    
+    Args:
+        message (str): Mensaje del usuario
+        config (Dict): Configuración de la llamada (etiquetas, callbacks)
+        
+    Returns:
+        str: Intent clasificado
+    """
+    chain = classification_prompt | llm
+    result = await chain.ainvoke({"intents": ", ".join(INTENTS), "message": message}, config=config)
+    intent = parse_intent(result.content)
+    intent_cache.put(message, intent)
+    return intent
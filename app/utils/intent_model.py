@@ -0,0 +1,247 @@
+import random
+import re
+import unicodedata
+import zlib
+from typing import Iterable, List, Optional, Tuple
+import numpy as np
+
+# Ejemplos base para que el modelo funcione antes de entrenarlo con la base de datos
+SEED_EXAMPLES = {
+    "hours_info": [
+        "a qué hora abren",
+        "cuál es su horario",
+        "hasta qué hora están abiertos",
+        "abren los domingos",
+        "qué horario tienen el fin de semana",
+        "a qué hora cierran hoy",
+    ],
+    "reservation_info": [
+        "quiero hacer una reservación",
+        "puedo reservar una mesa para mañana",
+        "cómo hago una reserva",
+        "tienen disponibilidad para reservar el sábado",
+        "quiero reservar para cuatro personas",
+    ],
+    "cancel_reservation": [
+        "quiero cancelar mi reservación",
+        "necesito anular mi reserva",
+        "cancelar la reserva del viernes",
+        "ya no voy a poder ir, cancelen mi reservación",
+    ],
+    "quejas": [
+        "tengo una queja",
+        "quiero poner un reclamo",
+        "el servicio fue pésimo",
+        "estoy muy molesto con la atención",
+        "me atendieron muy mal",
+    ],
+    "order_status": [
+        "dónde está mi pedido",
+        "cuál es el estado de mi orden",
+        "mi pedido no ha llegado",
+        "cuándo llega mi orden",
+        "quiero rastrear mi pedido",
+    ],
+    "new_order": [
+        "quiero hacer un pedido",
+        "quiero comprar",
+        "me gustaría ordenar",
+        "quiero pedir dos unidades",
+        "cómo hago una compra",
+    ],
+    "order_feedback": [
+        "el pedido llegó en mal estado",
+        "me encantó mi pedido",
+        "quiero dar mi opinión sobre mi orden",
+        "el producto que recibí estaba incompleto",
+    ],
+    "product_info": [
+        "qué productos tienen",
+        "cuánto cuesta",
+        "precios",
+        "tienen este producto disponible",
+        "qué características tiene",
+        "me das información del producto",
+    ],
+    "discounts": [
+        "tienen descuentos",
+        "hay alguna promoción",
+        "tienen ofertas esta semana",
+        "hay cupones de descuento",
+        "qué promociones hay",
+    ],
+    "not_applicable": [
+        "hola",
+        "gracias",
+        "ok",
+        "buenos días",
+        "jaja",
+        "qué tal",
+    ],
+}
+
+def normalize_text(text: str) -> str:
+    """
+    Normaliza un mensaje: minúsculas, sin acentos ni signos de puntuación
+    y con los espacios colapsados
+
+    Args:
+        text (str): Texto original
+
+    Returns:
+        str: Texto normalizado
+    """
+    text = unicodedata.normalize("NFKD", text.lower())
+    text = "".join(c for c in text if not unicodedata.combining(c))
+    text = re.sub(r"[^\w\s]", " ", text)
+    return " ".join(text.split())
+
+class CharNgramVectorizer:
+    """Vectorizador TF-IDF de n-gramas de caracteres con hashing a un espacio fijo"""
+
+    def __init__(self, ngram_range: Tuple[int, int] = (2, 4), n_features: int = 2 ** 14):
+        self.ngram_range = ngram_range
+        self.n_features = n_features
+        self.idf = np.ones(n_features, dtype=np.float32)
+
+    def _indices(self, text: str) -> np.ndarray:
+        padded = f" {normalize_text(text)} "
+        low, high = self.ngram_range
+        grams = [
+            padded[i:i + n]
+            for n in range(low, high + 1)
+            for i in range(len(padded) - n + 1)
+        ]
+        return np.fromiter(
+            (zlib.crc32(g.encode("utf-8")) % self.n_features for g in grams),
+            dtype=np.int64,
+            count=len(grams)
+        )
+
+    def fit(self, texts: Iterable[str]) -> "CharNgramVectorizer":
+        df = np.zeros(self.n_features, dtype=np.float64)
+        n_docs = 0
+        for text in texts:
+            df[np.unique(self._indices(text))] += 1
+            n_docs += 1
+        self.idf = (np.log((1 + n_docs) / (1 + df)) + 1).astype(np.float32)
+        return self
+
+    def transform_one(self, text: str) -> np.ndarray:
+        tf = np.bincount(self._indices(text), minlength=self.n_features).astype(np.float32)
+        vector = tf * self.idf
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm > 0 else vector
+
+# Temperaturas que se prueban al calibrar la confianza del modelo
+CALIBRATION_TEMPERATURES = (2.0, 3.0, 5.0, 8.0, 10.0, 12.0, 15.0, 20.0, 25.0, 30.0, 40.0)
+# Particiones de los ejemplos para calibrar con mensajes que el modelo no vio al entrenar
+CALIBRATION_FOLDS = 5
+# Ejemplos usados como máximo para calibrar, así calibrar no multiplica el tiempo de entrenamiento
+CALIBRATION_MAX_EXAMPLES = 5000
+
+class IntentModel:
+    """Clasificador local de intents por centroide más cercano"""
+
+    def __init__(self, intents: List[str], temperature: float = 20.0):
+        self.intents = list(intents)
+        self.temperature = temperature
+        self.vectorizer = CharNgramVectorizer()
+        self.centroids = None
+        self.n_samples = 0
+
+    def fit(self, examples: List[Tuple[str, str]], calibrate: bool = False) -> "IntentModel":
+        """
+        Entrena el modelo
+
+        Args:
+            examples (List[Tuple[str, str]]): Pares (mensaje, intent)
+            calibrate (bool): Elegir antes la temperatura con calibrate()
+
+        Returns:
+            IntentModel: El propio modelo entrenado
+        """
+        examples = [(m, i) for m, i in examples if m and i in self.intents]
+        if calibrate:
+            self.calibrate(examples)
+        self.vectorizer.fit(m for m, _ in examples)
+        centroids = np.zeros((len(self.intents), self.vectorizer.n_features), dtype=np.float32)
+        for message, intent in examples:
+            centroids[self.intents.index(intent)] += self.vectorizer.transform_one(message)
+        norms = np.linalg.norm(centroids, axis=1, keepdims=True)
+        norms[norms == 0] = 1
+        self.centroids = centroids / norms
+        self.n_samples = len(examples)
+        return self
+
+    def calibrate(self, examples: List[Tuple[str, str]], folds: int = CALIBRATION_FOLDS) -> float:
+        """
+        Elige la temperatura con la que la confianza se parece más a la tasa de aciertos
+        real: cada partición de los ejemplos se clasifica con un modelo entrenado con las
+        demás y se toma la temperatura con menor log-loss sobre esas predicciones
+
+        Args:
+            examples (List[Tuple[str, str]]): Pares (mensaje, intent)
+            folds (int): Número de particiones
+
+        Returns:
+            float: Temperatura elegida (también queda en self.temperature)
+        """
+        examples = [(m, i) for m, i in examples if m and i in self.intents]
+        # Muestra aleatoria (reproducible) para que las particiones no dependan del orden de los ejemplos
+        examples = random.Random(0).sample(examples, min(len(examples), CALIBRATION_MAX_EXAMPLES))
+        held_out_scores, labels = [], []
+        for fold in range(folds):
+            train = [example for n, example in enumerate(examples) if n % folds != fold]
+            test = [example for n, example in enumerate(examples) if n % folds == fold]
+            if not train or not test:
+                continue
+            model = IntentModel(self.intents).fit(train)
+            for message, intent in test:
+                scores = model.scores(message)
+                if scores is not None and scores.any():
+                    held_out_scores.append(scores)
+                    labels.append(self.intents.index(intent))
+        if not labels:
+            return self.temperature
+        scores = np.array(held_out_scores, dtype=np.float64)
+        scores -= scores.max(axis=1, keepdims=True)
+        rows = np.arange(len(labels))
+
+        def log_loss(temperature: float) -> float:
+            logits = temperature * scores
+            log_probabilities = logits - np.log(np.exp(logits).sum(axis=1, keepdims=True))
+            return float(-log_probabilities[rows, labels].mean())
+
+        self.temperature = min(CALIBRATION_TEMPERATURES, key=log_loss)
+        return self.temperature
+
+    def scores(self, message: str) -> Optional[np.ndarray]:
+        if self.centroids is None:
+            return None
+        return self.centroids @ self.vectorizer.transform_one(message)
+
+    def predict(self, message: str) -> Optional[Tuple[str, float, float]]:
+        """
+        Predice el intent de un mensaje
+
+        Args:
+            message (str): Mensaje del usuario
+
+        Returns:
+            Tuple[str, float, float]: Intent más probable, su confianza (0 a 1) y la diferencia
+            con la confianza del segundo más probable, o None si el modelo no está entrenado
+            o el mensaje no tiene contenido
+        """
+        if not normalize_text(message):
+            return None
+        scores = self.scores(message)
+        if scores is None or not scores.any():
+            return None
+        exp = np.exp(self.temperature * (scores - scores.max()))
+        probabilities = exp / exp.sum()
+        second, best = np.argsort(probabilities)[-2:]
+        return self.intents[best], float(probabilities[best]), float(probabilities[best] - probabilities[second])
+
+def seed_examples() -> List[Tuple[str, str]]:
+    return [(message, intent) for intent, messages in SEED_EXAMPLES.items() for message in messages]
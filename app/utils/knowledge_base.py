@@ -0,0 +1,274 @@
+import json
+import logging
+import os
+import re
+from datetime import date, datetime, timedelta
+from typing import Any, Dict, List, Optional
+from app.config.config import KNOWLEDGE_BASE_PATH
+from app.utils.intent_model import normalize_text
+
+try:
+    import yaml
+except ImportError:  # PyYAML es opcional, solo se necesita si la base de conocimiento es YAML
+    yaml = None
+
+logger = logging.getLogger(__name__)
+
+# Días de la semana normalizados (sin acentos), en el orden de date.weekday()
+WEEKDAYS = ["lunes", "martes", "miercoles", "jueves", "viernes", "sabado", "domingo"]
+WEEKDAY_NAMES = ["lunes", "martes", "miércoles", "jueves", "viernes", "sábado", "domingo"]
+# "mañana" como día, no "en la mañana" o "por la mañana"
+RELATIVE_DAYS = {"hoy": 0, "manana": 1, "pasado manana": 2}
+RELATIVE_DAYS_RE = re.compile(r"\b(?<!la )(pasado manana|manana|hoy)\b")
+# Meses normalizados (sin acentos), en orden
+MONTHS = [
+    "enero", "febrero", "marzo", "abril", "mayo", "junio", "julio",
+    "agosto", "septiembre", "octubre", "noviembre", "diciembre"
+]
+MONTH_NAMES = "|".join(MONTHS + ["setiembre"])
+# Fecha con mes, por ejemplo "el 24 de diciembre" o "25 de diciembre"
+DATE_RE = re.compile(rf"\b(\d{{1,2}}) de ({MONTH_NAMES})\b")
+# Día del mes sin mes, por ejemplo "el 24"
+MONTH_DAY_RE = re.compile(rf"\bel (\d{{1,2}})\b(?! de ({MONTH_NAMES})\b)")
+# Hora de una reservación: "a las 9", "8pm", "20:30", "9 de la noche"
+TIME_RE = re.compile(
+    r"\ba las? \d{1,2}\b|\b\d{1,2}(:\d{2})? ?(am|pm|hrs?|horas)\b|\b\d{1,2}:\d{2}\b"
+    r"|\b\d{1,2} de la (manana|tarde|noche)\b|\bmediodia\b"
+)
+# Número de personas: "somos 4", "para 3", "6 personas", "somos cuatro"
+NUMBER_WORDS = "dos|tres|cuatro|cinco|seis|siete|ocho|nueve|diez|once|doce"
+PARTY_SIZE_RE = re.compile(
+    rf"\b(somos|seremos|para|mesa de) (\d+|{NUMBER_WORDS})\b"
+    rf"|\b(\d+|{NUMBER_WORDS}) (personas|adultos|invitados|comensales|ninos)\b"
+)
+
+_kb: Dict[str, Any] = {}
+_kb_mtime: Optional[float] = None
+
+def _read_file(path: str) -> Dict:
+    with open(path, encoding="utf-8") as f:
+        if path.endswith((".yaml", ".yml")):
+            if yaml is None:
+                raise RuntimeError("La base de conocimiento es YAML y PyYAML no está instalado")
+            return yaml.safe_load(f) or {}
+        return json.load(f)
+
+def _parse_hours(value) -> Optional[tuple]:
+    # ["09:00", "20:00"] o null si ese día no se abre
+    return tuple(value) if value else None
+
+def _parse_date(value) -> Optional[date]:
+    if value is None or isinstance(value, date):
+        return value
+    return date.fromisoformat(str(value))
+
+def build_index(data: Dict) -> Dict[str, Any]:
+    """
+    Convierte el contenido del archivo en las estructuras que se consultan en cada turno
+
+    Args:
+        data (Dict): Contenido de la base de conocimiento
+
+    Returns:
+        Dict: Horario por día de la semana (0 = lunes), horarios especiales por fecha,
+            promociones con sus fechas, reservaciones y plantillas
+    """
+    index: Dict[str, Any] = {"templates": data.get("templates", {})}
+    if "hours" in data:
+        hours = {normalize_text(day): _parse_hours(value) for day, value in data["hours"].items()}
+        index["hours"] = {weekday: hours.get(day) for weekday, day in enumerate(WEEKDAYS)}
+        index["special_hours"] = {
+            _parse_date(day): _parse_hours(value) for day, value in data.get("special_hours", {}).items()
+        }
+    if "discounts" in data:
+        index["discounts"] = [
+            {
+                "title": discount["title"],
+                "details": discount.get("details", ""),
+                "weekdays": {WEEKDAYS.index(normalize_text(day)) for day in discount.get("days", [])},
+                "start": _parse_date(discount.get("start")),
+                "end": _parse_date(discount.get("end"))
+            }
+            for discount in data["discounts"]
+        ]
+    if "reservations" in data:
+        index["reservations"] = dict(data["reservations"])
+    return index
+
+def load_knowledge_base(path: str = KNOWLEDGE_BASE_PATH) -> Dict[str, Any]:
+    """
+    Carga la base de conocimiento (JSON o YAML) si cambió desde la última carga.
+    Si el archivo nuevo no es válido se sigue usando la versión anterior.
+
+    Args:
+        path (str): Ruta del archivo
+
+    Returns:
+        Dict: Base de conocimiento indexada
+    """
+    global _kb, _kb_mtime
+    if not path:
+        return _kb
+    try:
+        mtime = os.path.getmtime(path)
+    except OSError:
+        return _kb
+    if mtime != _kb_mtime:
+        try:
+            _kb = build_index(_read_file(path))
+        except Exception:
+            logger.exception("No se pudo cargar la base de conocimiento %s", path)
+        _kb_mtime = mtime
+    return _kb
+
+def _mentioned_days(message: str, today: date) -> List[date]:
+    text = normalize_text(message)
+    days = []
+    for match in RELATIVE_DAYS_RE.finditer(text):
+        days.append(today + timedelta(days=RELATIVE_DAYS[match.group(1)]))
+    for weekday, day in enumerate(WEEKDAYS):
+        if re.search(rf"\b{day}s?\b", text):
+            # El próximo día de la semana mencionado (hoy si es el mismo)
+            days.append(today + timedelta(days=(weekday - today.weekday()) % 7))
+    for match in DATE_RE.finditer(text):
+        month = 9 if match.group(2) == "setiembre" else MONTHS.index(match.group(2)) + 1
+        day = _next_date(today, month, int(match.group(1)))
+        if day is not None:
+            days.append(day)
+    for match in MONTH_DAY_RE.finditer(text):
+        day = _next_month_day(today, int(match.group(1)))
+        if day is not None:
+            days.append(day)
+    return sorted(set(days))
+
+def _next_date(today: date, month: int, day: int) -> Optional[date]:
+    # Esa fecha este año o, si ya pasó, el próximo
+    for year in (today.year, today.year + 1):
+        try:
+            candidate = date(year, month, day)
+        except ValueError:
+            return None
+        if candidate >= today:
+            return candidate
+    return None
+
+def _next_month_day(today: date, day: int) -> Optional[date]:
+    # El próximo día del mes con ese número (este mes si todavía no pasó)
+    year, month = today.year, today.month
+    for _ in range(2):
+        try:
+            candidate = date(year, month, day)
+        except ValueError:
+            candidate = None
+        if candidate is not None and candidate >= today:
+            return candidate
+        year, month = (year + 1, 1) if month == 12 else (year, month + 1)
+    return None
+
+def _hours_for(kb: Dict, day: date) -> Optional[tuple]:
+    if day in kb["special_hours"]:
+        return kb["special_hours"][day]
+    return kb["hours"][day.weekday()]
+
+def _format(template: str, name: str, **values) -> str:
+    # Sin nombre se quita el hueco y su coma ("¡Sí, {name}!" -> "¡Sí!")
+    if not name:
+        template = re.sub(r",? ?\{name\}", "", template)
+    return template.format(name=name, **values)
+
+def _day_line(templates: Dict, name: str, hours: Optional[tuple]) -> str:
+    if hours is None:
+        return templates["hours_closed"].format(day=name)
+    return templates["hours_day"].format(day=name, open=hours[0], close=hours[1])
+
+def _day_label(day: date, today: date) -> str:
+    # "sábado 24", con el mes si no es el actual ("jueves 24 de diciembre")
+    label = f"{WEEKDAY_NAMES[day.weekday()]} {day.day}"
+    if (day.year, day.month) != (today.year, today.month):
+        label += f" de {MONTHS[day.month - 1]}"
+    return label
+
+def _answer_hours(kb: Dict, message: str, name: str, today: date) -> str:
+    templates = kb["templates"]
+    days = _mentioned_days(message, today)
+    if not days:
+        schedule = "\n".join(
+            f"- {day.capitalize()}: " + (f"{hours[0]} a {hours[1]}" if hours else "cerrado")
+            for day, hours in zip(WEEKDAY_NAMES, (kb["hours"][weekday] for weekday in range(7)))
+        )
+        return _format(templates["hours_week"], name, schedule=schedule)
+    lines = [
+        _day_line(templates, _day_label(day, today), _hours_for(kb, day))
+        for day in days
+    ]
+    return _format(templates["hours_days"], name, schedule=" ".join(lines))
+
+def _answer_discounts(kb: Dict, message: str, name: str, today: date) -> str:
+    templates = kb["templates"]
+    lines = []
+    for discount in kb["discounts"]:
+        if (discount["start"] and today < discount["start"]) or (discount["end"] and today > discount["end"]):
+            continue
+        line = f"- {discount['title']}"
+        if discount["weekdays"]:
+            line += " (los " + ", ".join(WEEKDAY_NAMES[weekday] for weekday in sorted(discount["weekdays"])) + ")"
+        if discount["end"]:
+            line += f", hasta el {discount['end'].day:02d}/{discount['end'].month:02d}"
+        if discount["details"]:
+            line += f". {discount['details']}"
+        lines.append(line)
+    if not lines:
+        return _format(templates["no_discounts"], name)
+    return _format(templates["discounts"], name, discounts="\n".join(lines))
+
+def _answer_reservations(kb: Dict, message: str, name: str, today: date) -> str:
+    return _format(kb["templates"]["reservation_info"], name, **kb["reservations"])
+
+def _is_reservation_question(message: str) -> bool:
+    # Solo las preguntas sobre las condiciones, si el mensaje trae fecha, hora o número
+    # de personas el cliente quiere reservar y responde el LLM
+    text = normalize_text(message)
+    return not (
+        _mentioned_days(message, date.today()) or TIME_RE.search(text) or PARTY_SIZE_RE.search(text)
+    )
+
+# Intents que responde la base de conocimiento: sección que necesita cada uno, función que
+# arma la respuesta y, opcionalmente, qué mensajes de ese intent puede responder
+ANSWERS: Dict[str, tuple] = {
+    "hours_info": ("hours", _answer_hours, None),
+    "discounts": ("discounts", _answer_discounts, None),
+    "reservation_info": ("reservations", _answer_reservations, _is_reservation_question)
+}
+
+def covers(intent: str, message: str = "") -> bool:
+    """Indica si la base de conocimiento responde el intent (y el mensaje, si se indica)"""
+    if intent not in ANSWERS:
+        return False
+    section, _, applies = ANSWERS[intent]
+    if section not in load_knowledge_base():
+        return False
+    return not message or applies is None or applies(message)
+
+def answer(intent: str, message: str, user_info: Dict, today: Optional[date] = None) -> Optional[str]:
+    """
+    Responde con la base de conocimiento los intents que cubre
+
+    Args:
+        intent (str): Intent del mensaje
+        message (str): Mensaje del usuario
+        user_info (Dict): Datos del usuario
+        today (date): Fecha de referencia para "hoy" y las promociones vigentes
+
+    Returns:
+        Optional[str]: Respuesta o None si se debe usar el LLM
+    """
+    if not covers(intent, message):
+        return None
+    kb = load_knowledge_base()
+    section, build_answer, _ = ANSWERS[intent]
+    try:
+        return build_answer(kb, message, user_info.get("name", ""), today or datetime.now().date())
+    except (KeyError, IndexError, ValueError):
+        # Plantilla o dato que falta en el archivo, se responde con el LLM
+        logger.exception("La base de conocimiento no pudo responder %s", intent)
+        return None
@@ -0,0 +1,98 @@
+from collections.abc import Sequence
+from typing import Dict, Iterable, Iterator, List, Optional
+
+class MessageLog(Sequence):
+    """
+    Registro de mensajes de solo agregar.
+
+    Cada MessageLog es una vista inmutable de los primeros mensajes de un
+    almacenamiento compartido: agregar mensajes crea una vista nueva sin copiar
+    la lista (salvo que otra vista ya haya agregado mensajes distintos en esa
+    posición).
+    """
+
+    __slots__ = ("_items", "_length")
+
+    def __init__(self, messages: Iterable[Dict] = ()):
+        self._items: List[Dict] = list(messages)
+        self._length = len(self._items)
+
+    @classmethod
+    def from_messages(cls, messages: Optional[Iterable[Dict]]) -> "MessageLog":
+        """
+        Devuelve el mismo registro si ya es un MessageLog, si no crea uno con los mensajes
+
+        Args:
+            messages (Iterable[Dict]): Mensajes de la conversación
+
+        Returns:
+            MessageLog: Registro de mensajes
+        """
+        if isinstance(messages, cls):
+            return messages
+        return cls(messages or [])
+
+    def appended(self, messages: Iterable[Dict]) -> "MessageLog":
+        """
+        Devuelve un registro nuevo con los mensajes agregados al final
+
+        Args:
+            messages (Iterable[Dict]): Mensajes nuevos
+
+        Returns:
+            MessageLog: Registro con los mensajes agregados
+        """
+        messages = list(messages)
+        if not messages:
+            return self
+        items = self._items
+        end = self._length + len(messages)
+        if len(items) == self._length:
+            items.extend(messages)
+        elif len(items) < end or any(a is not b for a, b in zip(items[self._length:end], messages)):
+            # Otra vista ya agregó mensajes distintos después de esta, se bifurca
+            items = items[:self._length] + messages
+
+        log = MessageLog.__new__(MessageLog)
+        log._items = items
+        log._length = end
+        return log
+
+    def __len__(self) -> int:
+        return self._length
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self._items[i] for i in range(*index.indices(self._length))]
+        if index < 0:
+            index += self._length
+        if not 0 <= index < self._length:
+            raise IndexError("MessageLog index out of range")
+        return self._items[index]
+
+    def __iter__(self) -> Iterator[Dict]:
+        items = self._items
+        for i in range(self._length):
+            yield items[i]
+
+    def __repr__(self) -> str:
+        return f"MessageLog({list(self)!r})"
+
+def append_messages(log: Sequence, messages: Sequence) -> MessageLog:
+    """
+    Reducer del estado para messages: agrega los mensajes nuevos al registro
+    sin copiar la lista completa
+
+    Args:
+        log (Sequence): Registro actual
+        messages (Sequence): Mensajes nuevos
+
+    Returns:
+        MessageLog: Registro con los mensajes agregados
+    """
+    if messages is log:
+        return log
+    if not log and isinstance(messages, MessageLog):
+        # Entrada inicial del grafo: se usa directamente el registro de la sesión
+        return messages
+    return MessageLog.from_messages(log).appended(messages)
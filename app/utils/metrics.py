@@ -0,0 +1,265 @@
+import functools
+import threading
+import time
+from bisect import bisect_left
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from uuid import UUID
+from langchain_core.callbacks import BaseCallbackHandler
+
+# Límites de los buckets de los histogramas de latencia, en segundos
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+def _escape(value: Any) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _format_labels(names: Tuple[str, ...], values: Tuple[str, ...], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+class Metric:
+    """Métrica con etiquetas que se exporta en el formato de texto de Prometheus"""
+
+    kind = "untyped"
+
+    def __init__(self, name: str, description: str, labels: Tuple[str, ...] = ()):
+        self.name = name
+        self.description = description
+        self.labels = tuple(labels)
+        self._lock = threading.Lock()
+
+    def render(self) -> List[str]:
+        return [f"# HELP {self.name} {self.description}", f"# TYPE {self.name} {self.kind}"]
+
+class Counter(Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, description: str, labels: Tuple[str, ...] = ()):
+        super().__init__(name, description, labels)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, *label_values: str, amount: float = 1.0) -> None:
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0.0) + amount
+
+    def render(self) -> List[str]:
+        with self._lock:
+            values = sorted(self._values.items())
+        return super().render() + [
+            f"{self.name}{_format_labels(self.labels, key)} {value}" for key, value in values
+        ]
+
+class Gauge(Metric):
+    """Valor instantáneo calculado al exportar con la función `read`"""
+
+    kind = "gauge"
+
+    def __init__(self, name: str, description: str, read: Callable[[], float]):
+        super().__init__(name, description)
+        self.read = read
+
+    def render(self) -> List[str]:
+        return super().render() + [f"{self.name} {self.read()}"]
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        description: str,
+        labels: Tuple[str, ...] = (),
+        buckets: Tuple[float, ...] = LATENCY_BUCKETS
+    ):
+        super().__init__(name, description, labels)
+        self.buckets = tuple(buckets)
+        # Por etiquetas: [conteo por bucket (el último es +Inf), suma]
+        self._series: Dict[Tuple[str, ...], list] = {}
+
+    def observe(self, value: float, *label_values: str) -> None:
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(label_values)
+            if series is None:
+                series = self._series[label_values] = [[0] * (len(self.buckets) + 1), 0.0]
+            series[0][index] += 1
+            series[1] += value
+
+    def render(self) -> List[str]:
+        with self._lock:
+            series = sorted((key, list(counts), total) for key, (counts, total) in self._series.items())
+        lines = super().render()
+        for key, counts, total in series:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                le = 'le="+Inf"' if bound == float("inf") else f'le="{bound}"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.labels, key, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labels, key)} {total}")
+            lines.append(f"{self.name}_count{_format_labels(self.labels, key)} {cumulative}")
+        return lines
+
+class Registry:
+    def __init__(self):
+        self._metrics: Dict[str, Metric] = {}
+        self._lock = threading.Lock()
+
+    def register(self, metric: Metric) -> Metric:
+        with self._lock:
+            self._metrics[metric.name] = metric
+        return metric
+
+    def render(self) -> str:
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+registry = Registry()
+
+node_duration = registry.register(Histogram(
+    "conversation_node_duration_seconds", "Duración de cada nodo del grafo de conversación", ("node",)
+))
+turn_duration = registry.register(Histogram(
+    "conversation_turn_duration_seconds", "Duración de cada turno completo"
+))
+llm_calls = registry.register(Counter(
+    "llm_calls_total", "Llamadas al LLM por lugar de la llamada", ("site",)
+))
+llm_errors = registry.register(Counter(
+    "llm_errors_total", "Llamadas al LLM que terminaron con error", ("site",)
+))
+llm_duration = registry.register(Histogram(
+    "llm_call_duration_seconds", "Duración de las llamadas al LLM", ("site",)
+))
+llm_tokens = registry.register(Counter(
+    "llm_tokens_total", "Tokens de prompt y de respuesta por lugar de la llamada", ("site", "type")
+))
+speculative_replies = registry.register(Counter(
+    "speculative_replies_total", "Respuestas especulativas por resultado (hit: se usó, miss: se descartó)", ("result",)
+))
+speculative_wasted_tokens = registry.register(Counter(
+    "speculative_wasted_tokens_total", "Tokens estimados de las respuestas especulativas descartadas", ("type",)
+))
+response_cache_lookups = registry.register(Counter(
+    "response_cache_lookups_total", "Búsquedas en la caché de respuestas por intent y resultado", ("intent", "result")
+))
+intent_cache_lookups = registry.register(Counter(
+    "intent_cache_lookups_total", "Búsquedas de clasificaciones del LLM ya hechas por resultado", ("result",)
+))
+db_write_duration = registry.register(Histogram(
+    "db_write_duration_seconds", "Duración de las escrituras en la base de datos", ("operation",)
+))
+
+def register_gauge(name: str, description: str, read: Callable[[], float]) -> None:
+    """
+    Registra un valor que se calcula al exportar las métricas, por ejemplo
+    el número de sesiones activas
+
+    Args:
+        name (str): Nombre de la métrica
+        description (str): Descripción
+        read (Callable): Función que devuelve el valor actual
+    """
+    registry.register(Gauge(name, description, read))
+
+def render_metrics() -> str:
+    """Devuelve todas las métricas en el formato de texto de Prometheus"""
+    return registry.render()
+
+def timed_node(name: str, node: Callable) -> Callable:
+    """
+    Envuelve un nodo asíncrono del grafo para medir su duración
+
+    Args:
+        name (str): Nombre del nodo
+        node (Callable): Función del nodo
+
+    Returns:
+        Callable: Nodo instrumentado
+    """
+    @functools.wraps(node)
+    async def wrapper(*args, **kwargs):
+        started = time.perf_counter()
+        try:
+            return await node(*args, **kwargs)
+        finally:
+            node_duration.observe(time.perf_counter() - started, name)
+    return wrapper
+
+def timed_db_write(operation: str) -> Callable:
+    """Decorador que mide la duración de una escritura en la base de datos"""
+    def decorator(function: Callable) -> Callable:
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                db_write_duration.observe(time.perf_counter() - started, operation)
+        return wrapper
+    return decorator
+
+def _token_usage(response) -> Tuple[int, int]:
+    # OpenAI devuelve el uso en llm_output, otros modelos en usage_metadata del mensaje
+    usage = (response.llm_output or {}).get("token_usage") or {}
+    if usage:
+        return usage.get("prompt_tokens", 0), usage.get("completion_tokens", 0)
+    prompt_tokens = completion_tokens = 0
+    for generations in response.generations:
+        for generation in generations:
+            metadata = getattr(getattr(generation, "message", None), "usage_metadata", None) or {}
+            prompt_tokens += metadata.get("input_tokens", 0)
+            completion_tokens += metadata.get("output_tokens", 0)
+    return prompt_tokens, completion_tokens
+
+class LLMMetricsHandler(BaseCallbackHandler):
+    """
+    Callback de LangChain que cuenta las llamadas al LLM, su duración y sus
+    tokens. El lugar de la llamada es el nodo del grafo que la hizo.
+    """
+
+    def __init__(self):
+        self._started: Dict[UUID, Tuple[float, str]] = {}
+        self._lock = threading.Lock()
+
+    def _start(self, run_id: UUID, metadata: Optional[Dict[str, Any]]) -> None:
+        site = (metadata or {}).get("langgraph_node", "other")
+        with self._lock:
+            self._started[run_id] = (time.perf_counter(), site)
+
+    def on_chat_model_start(self, serialized, messages, *, run_id: UUID, metadata=None, **kwargs) -> None:
+        self._start(run_id, metadata)
+
+    def on_llm_start(self, serialized, prompts, *, run_id: UUID, metadata=None, **kwargs) -> None:
+        self._start(run_id, metadata)
+
+    def _finish(self, run_id: UUID) -> Optional[str]:
+        with self._lock:
+            started = self._started.pop(run_id, None)
+        if started is None:
+            return None
+        started_at, site = started
+        llm_duration.observe(time.perf_counter() - started_at, site)
+        llm_calls.inc(site)
+        return site
+
+    def on_llm_end(self, response, *, run_id: UUID, **kwargs) -> None:
+        site = self._finish(run_id)
+        if site is None:
+            return
+        prompt_tokens, completion_tokens = _token_usage(response)
+        if prompt_tokens:
+            llm_tokens.inc(site, "prompt", amount=prompt_tokens)
+        if completion_tokens:
+            llm_tokens.inc(site, "completion", amount=completion_tokens)
+
+    def on_llm_error(self, error, *, run_id: UUID, **kwargs) -> None:
+        site = self._finish(run_id)
+        if site is not None:
+            llm_errors.inc(site)
+
+llm_metrics = LLMMetricsHandler()
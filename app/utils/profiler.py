@@ -0,0 +1,244 @@
+import contextvars
+import itertools
+import marshal
+import os
+import random
+import sys
+import threading
+import time
+from collections import Counter, deque
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+from app.utils.concurrency import register_thread_hook
+from app.config.config import PROFILE_SAMPLE_RATE, PROFILE_SLOW_MS, PROFILE_BUFFER_SIZE, PROFILE_INTERVAL_MS
+
+# Función identificada como en pstats: (archivo, primera línea, nombre)
+FunctionKey = Tuple[str, int, str]
+
+# Captura activa en el contexto actual, se copia a los hilos de run_in_thread
+_current_capture = contextvars.ContextVar("current_capture", default=None)
+
+class ProfileCapture:
+    """Muestras de pila de un turno perfilado"""
+
+    _ids = itertools.count(1)
+
+    def __init__(self, label: str, sampled: bool, interval: float):
+        self.id = next(self._ids)
+        self.label = label
+        self.sampled = sampled  # Elegido al azar, si no solo se guarda si el turno es lento
+        self.interval = interval
+        self.created_at = datetime.now()
+        self.duration_ms = 0.0
+        self.ticks = 0  # Veces que el muestreador tomó las pilas durante el turno
+        self.stacks: Counter = Counter()  # Pila (de la raíz a la hoja) -> número de muestras
+        self._threads: Dict[int, int] = {}  # Hilos que trabajan para el turno -> usos activos
+        self._lock = threading.Lock()
+
+    def attach(self, thread_id: int) -> None:
+        with self._lock:
+            self._threads[thread_id] = self._threads.get(thread_id, 0) + 1
+
+    def detach(self, thread_id: int) -> None:
+        with self._lock:
+            remaining = self._threads.get(thread_id, 0) - 1
+            if remaining > 0:
+                self._threads[thread_id] = remaining
+            else:
+                self._threads.pop(thread_id, None)
+
+    def threads(self) -> List[int]:
+        with self._lock:
+            return list(self._threads)
+
+    @property
+    def reason(self) -> str:
+        return "sampled" if self.sampled else "slow"
+
+    @property
+    def samples(self) -> int:
+        return sum(self.stacks.values())
+
+    def summary(self) -> Dict:
+        return {
+            "id": self.id,
+            "label": self.label,
+            "reason": self.reason,
+            "created_at": self.created_at.isoformat(),
+            "duration_ms": round(self.duration_ms, 1),
+            "samples": self.samples
+        }
+
+    def collapsed(self) -> str:
+        """Pilas en formato colapsado (una línea "f1;f2;f3 muestras"), para flamegraph.pl o speedscope"""
+        lines = []
+        for stack, count in self.stacks.most_common():
+            frames = ";".join(f"{name} ({_short_path(filename)}:{line})" for filename, line, name in stack)
+            lines.append(f"{frames} {count}")
+        return "\n".join(lines) + "\n"
+
+    def pstats(self) -> bytes:
+        """
+        Muestras convertidas al formato de pstats (tiempos estimados a partir
+        de las muestras), se puede abrir con pstats.Stats o snakeviz.
+        Cada muestra vale la duración del turno entre el número de veces que se
+        muestreó: con el GIL ocupado el muestreador se retrasa y el intervalo
+        configurado subestimaría los tiempos.
+        """
+        if self.ticks and self.duration_ms:
+            per_sample = self.duration_ms / 1000 / self.ticks
+        else:
+            per_sample = self.interval
+        stats: Dict[FunctionKey, list] = {}
+        for stack, count in self.stacks.items():
+            seconds = count * per_sample
+            seen = set()
+            for depth, function in enumerate(stack):
+                entry = stats.setdefault(function, [0, 0, 0.0, 0.0, {}])
+                if function not in seen:
+                    # Tiempo acumulado una sola vez por muestra aunque la función sea recursiva
+                    seen.add(function)
+                    entry[0] += count
+                    entry[1] += count
+                    entry[3] += seconds
+                if depth == len(stack) - 1:
+                    entry[2] += seconds
+                if depth > 0:
+                    caller = stack[depth - 1]
+                    cc, nc, tt, ct = entry[4].get(caller, (0, 0, 0.0, 0.0))
+                    own = seconds if depth == len(stack) - 1 else 0.0
+                    entry[4][caller] = (cc + count, nc + count, tt + own, ct + seconds)
+        return marshal.dumps({function: tuple(entry) for function, entry in stats.items()})
+
+def _short_path(filename: str) -> str:
+    for prefix in sorted({sys.prefix, sys.base_prefix, os.getcwd()}, key=len, reverse=True):
+        if filename.startswith(prefix):
+            return os.path.relpath(filename, prefix)
+    return filename
+
+class Profiler:
+    """
+    Perfilador por muestreo de turnos.
+
+    Mientras hay turnos perfilados, un hilo toma cada `interval_ms` la pila de
+    los hilos que trabajan para cada turno (el del bucle de eventos y los de
+    run_in_thread). Se perfila una fracción `sample_rate` de los turnos y, si
+    hay un umbral `slow_ms`, se muestrean todos y solo se guardan los lentos.
+    Las últimas `buffer_size` capturas quedan en memoria.
+    """
+
+    def __init__(
+        self,
+        sample_rate: float = PROFILE_SAMPLE_RATE,
+        slow_ms: float = PROFILE_SLOW_MS,
+        buffer_size: int = PROFILE_BUFFER_SIZE,
+        interval_ms: float = PROFILE_INTERVAL_MS
+    ):
+        self.sample_rate = sample_rate
+        self.slow_ms = slow_ms
+        self.interval = interval_ms / 1000
+        self.captures = deque(maxlen=buffer_size)
+        self._active: List[ProfileCapture] = []
+        self._lock = threading.Lock()
+        self._sampler: Optional[threading.Thread] = None
+
+    @property
+    def enabled(self) -> bool:
+        return self.sample_rate > 0 or self.slow_ms > 0
+
+    @contextmanager
+    def profile(self, label: str):
+        """
+        Perfila el bloque si el turno resulta elegido o si supera el umbral de lentitud
+
+        Args:
+            label (str): Descripción de la captura, por ejemplo la ruta
+        """
+        if not self.enabled:
+            yield None
+            return
+        sampled = random.random() < self.sample_rate
+        if not sampled and self.slow_ms <= 0:
+            yield None
+            return
+
+        capture = ProfileCapture(label, sampled, self.interval)
+        thread_id = threading.get_ident()
+        capture.attach(thread_id)
+        token = _current_capture.set(capture)
+        self._activate(capture)
+        started = time.perf_counter()
+        try:
+            yield capture
+        finally:
+            capture.duration_ms = (time.perf_counter() - started) * 1000
+            self._deactivate(capture)
+            _current_capture.reset(token)
+            capture.detach(thread_id)
+            if capture.sampled or capture.duration_ms >= self.slow_ms:
+                with self._lock:
+                    self.captures.append(capture)
+
+    def get(self, capture_id: int) -> Optional[ProfileCapture]:
+        with self._lock:
+            return next((capture for capture in self.captures if capture.id == capture_id), None)
+
+    def list(self) -> List[Dict]:
+        with self._lock:
+            return [capture.summary() for capture in reversed(self.captures)]
+
+    def _activate(self, capture: ProfileCapture) -> None:
+        with self._lock:
+            self._active.append(capture)
+            if self._sampler is None:
+                self._sampler = threading.Thread(target=self._sample_loop, name="profiler", daemon=True)
+                self._sampler.start()
+
+    def _deactivate(self, capture: ProfileCapture) -> None:
+        with self._lock:
+            self._active.remove(capture)
+
+    def _sample_loop(self) -> None:
+        while True:
+            time.sleep(self.interval)
+            with self._lock:
+                active = list(self._active)
+                if not active:
+                    # Sin turnos perfilados el hilo termina, se vuelve a crear con el siguiente
+                    self._sampler = None
+                    return
+            frames = sys._current_frames()
+            for capture in active:
+                capture.ticks += 1
+                for thread_id in capture.threads():
+                    frame = frames.get(thread_id)
+                    if frame is not None:
+                        capture.stacks[_stack(frame)] += 1
+
+def _stack(frame) -> Tuple[FunctionKey, ...]:
+    stack = []
+    while frame is not None:
+        code = frame.f_code
+        stack.append((code.co_filename, code.co_firstlineno, code.co_name))
+        frame = frame.f_back
+    stack.reverse()
+    return tuple(stack)
+
+@contextmanager
+def _attach_current_thread():
+    # Con un turno perfilado, el hilo de run_in_thread se muestrea mientras dura la llamada
+    capture = _current_capture.get()
+    if capture is None:
+        yield
+        return
+    thread_id = threading.get_ident()
+    capture.attach(thread_id)
+    try:
+        yield
+    finally:
+        capture.detach(thread_id)
+
+register_thread_hook(_attach_current_thread)
+
+profiler = Profiler()
@@ -0,0 +1,169 @@
+import itertools
+import re
+import threading
+from typing import Any, Dict, List, Optional
+import numpy as np
+from app.config.config import (
+    RESPONSE_CACHE_INTENTS,
+    RESPONSE_CACHE_THRESHOLD,
+    RESPONSE_CACHE_MAX_ENTRIES,
+    RESPONSE_CACHE_TTL_SECONDS
+)
+from app.utils.cache import TTLCache
+from app.utils.intent_model import CharNgramVectorizer, normalize_text
+from app.utils.metrics import response_cache_lookups
+
+# Dimensión de los vectores, menor que la del clasificador porque se guarda uno por respuesta
+CACHE_FEATURES = 2 ** 12
+
+# Datos del usuario que se reemplazan por huecos al guardar una respuesta y se rellenan al devolverla
+SLOTS = ("name", "email")
+
+class ResponseCache:
+    """
+    Caché semántica de respuestas de provide_service para intents de preguntas
+    frecuentes. Una pregunta reutiliza la respuesta de otra del mismo intent si
+    la similitud coseno de sus n-gramas de caracteres supera el umbral.
+    """
+
+    def __init__(
+        self,
+        intents: List[str] = RESPONSE_CACHE_INTENTS,
+        threshold: float = RESPONSE_CACHE_THRESHOLD,
+        max_entries: int = RESPONSE_CACHE_MAX_ENTRIES,
+        ttl_seconds: float = RESPONSE_CACHE_TTL_SECONDS
+    ):
+        """
+        Args:
+            intents (List[str]): Intents cuyas respuestas se guardan, vacío = caché desactivada
+            threshold (float): Similitud mínima (0 a 1) para reutilizar una respuesta
+            max_entries (int): Respuestas guardadas como máximo, se desalojan las usadas hace más tiempo
+            ttl_seconds (float): Tiempo tras el que una respuesta deja de usarse
+        """
+        self.intents = set(intents)
+        self.threshold = threshold
+        self.vectorizer = CharNgramVectorizer(n_features=CACHE_FEATURES)
+        self._entries = TTLCache(max_entries, ttl_seconds, on_evict=self._on_evict)
+        # Por intent: matriz de vectores (una fila por respuesta, las filas libres en cero),
+        # clave de cada fila y filas libres
+        self._index: Dict[str, Dict[str, Any]] = {}
+        self._ids = itertools.count()
+        self._lock = threading.RLock()
+        self.hits = 0
+        self.misses = 0
+
+    def enabled_for(self, intent: str) -> bool:
+        return intent in self.intents
+
+    def get(self, intent: str, message: str, user_info: Dict) -> Optional[str]:
+        """
+        Busca una respuesta guardada para una pregunta parecida del mismo intent
+
+        Args:
+            intent (str): Intent del mensaje
+            message (str): Mensaje del usuario
+            user_info (Dict): Datos del usuario para personalizar la respuesta
+
+        Returns:
+            Optional[str]: Respuesta personalizada o None si no hay ninguna
+        """
+        if not self.enabled_for(intent) or not normalize_text(message):
+            return None
+        vector = self.vectorizer.transform_one(message)
+        entry = None
+        with self._lock:
+            index = self._index.get(intent)
+            if index is not None and index["size"]:
+                similarities = index["matrix"][:index["size"]] @ vector
+                best = int(similarities.argmax())
+                key = index["keys"][best]
+                if key is not None and similarities[best] >= self.threshold:
+                    entry = self._entries.get(key)
+        content = self._render(entry, user_info) if entry is not None else None
+        with self._lock:
+            if content is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        response_cache_lookups.inc(intent, "miss" if content is None else "hit")
+        return content
+
+    def put(self, intent: str, message: str, response: str, user_info: Dict) -> None:
+        """
+        Guarda la respuesta generada para un mensaje
+
+        Args:
+            intent (str): Intent del mensaje
+            message (str): Mensaje del usuario
+            response (str): Respuesta del LLM
+            user_info (Dict): Datos del usuario, se reemplazan por huecos en la respuesta
+        """
+        if not self.enabled_for(intent) or not normalize_text(message):
+            return
+        template = response
+        for slot in SLOTS:
+            value = user_info.get(slot)
+            if value:
+                template = re.sub(rf"\b{re.escape(value)}\b", "{" + slot + "}", template)
+        vector = self.vectorizer.transform_one(message)
+        with self._lock:
+            key = next(self._ids)
+            index = self._index.get(intent)
+            if index is None:
+                index = self._index[intent] = {
+                    "matrix": np.zeros((16, self.vectorizer.n_features), dtype=np.float32),
+                    "keys": [],
+                    "free": [],
+                    "size": 0
+                }
+            if index["free"]:
+                row = index["free"].pop()
+                index["keys"][row] = key
+            else:
+                row = index["size"]
+                if row == len(index["matrix"]):
+                    index["matrix"] = np.concatenate([index["matrix"], np.zeros_like(index["matrix"])])
+                index["keys"].append(key)
+                index["size"] += 1
+            index["matrix"][row] = vector
+            self._entries.put(key, (template, intent, row))
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._index.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        total = self.hits + self.misses
+        return {
+            "intents": sorted(self.intents),
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+            "evictions": self._entries.stats()["evictions"]
+        }
+
+    def _render(self, entry, user_info: Dict) -> Optional[str]:
+        content = entry[0]
+        for slot in SLOTS:
+            placeholder = "{" + slot + "}"
+            if placeholder in content:
+                if not user_info.get(slot):
+                    # La respuesta nombra un dato que este usuario no ha dado
+                    return None
+                content = content.replace(placeholder, user_info[slot])
+        return content
+
+    def _on_evict(self, key, entry) -> None:
+        _, intent, row = entry
+        with self._lock:
+            index = self._index.get(intent)
+            if index is None or index["keys"][row] != key:
+                return
+            # Una fila en cero nunca supera el umbral, queda libre para la siguiente respuesta
+            index["matrix"][row] = 0
+            index["keys"][row] = None
+            index["free"].append(row)
+
+response_cache = ResponseCache()
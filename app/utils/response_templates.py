@@ -0,0 +1,170 @@
+import argparse
+import json
+import logging
+import os
+import random
+import tempfile
+from typing import Dict, List, Optional
+from langchain.prompts import ChatPromptTemplate
+from app.config.config import RESPONSE_TEMPLATE_STEPS, RESPONSE_TEMPLATES_PATH
+
+# Pasos del onboarding que pueden responderse con plantillas y los datos que usan
+TEMPLATE_STEPS = {
+    "greeting": [],
+    "get_name": ["name"],
+    "get_email": ["email"],
+    "request_name": [],
+    "request_email": []
+}
+
+# Qué debe decir cada paso, usado para regenerar las variantes con el LLM
+STEP_DESCRIPTIONS = {
+    "greeting": "Saluda al cliente de manera cordial, preséntate como asistente virtual de ventas y solicita su nombre y correo electrónico.",
+    "get_name": "Agradece al cliente por compartir su nombre ({name}) y pregúntale por su correo electrónico.",
+    "get_email": "Agradece al cliente por su correo electrónico ({email}) y pregúntale en qué puedes ayudarle. Menciona que puedes ayudar con horarios, reservaciones, consulta de órdenes, información de productos y quejas o sugerencias.",
+    "request_name": "Pide al cliente su nombre para poder continuar con el servicio.",
+    "request_email": "Pide al cliente un correo electrónico válido para poder continuar con el servicio."
+}
+
+logger = logging.getLogger(__name__)
+
+_pool: Dict[str, List[str]] = {}
+_pool_mtime: Optional[float] = None
+
+def load_templates(path: str = RESPONSE_TEMPLATES_PATH) -> Dict[str, List[str]]:
+    """
+    Carga el pool de variantes desde el archivo JSON si cambió desde la última carga.
+    Si el archivo nuevo no es válido se sigue usando el pool anterior, y las
+    variantes con huecos desconocidos o faltantes se descartan al cargar.
+
+    Args:
+        path (str): Ruta del archivo de plantillas
+
+    Returns:
+        Dict[str, List[str]]: Variantes por paso
+    """
+    global _pool, _pool_mtime
+    try:
+        mtime = os.path.getmtime(path)
+    except OSError:
+        return _pool
+    if mtime != _pool_mtime:
+        try:
+            with open(path, encoding="utf-8") as f:
+                pool = json.load(f)
+            if not isinstance(pool, dict):
+                raise ValueError("El archivo de plantillas debe ser un objeto con las variantes por paso")
+            _pool = _valid_pool(pool, path)
+        except Exception:
+            logger.exception("No se pudieron cargar las plantillas %s", path)
+        _pool_mtime = mtime
+    return _pool
+
+def render_step_template(step: str, **slots) -> Optional[str]:
+    """
+    Devuelve una variante pre-generada para el paso si el paso está
+    configurado en modo plantilla
+
+    Args:
+        step (str): Paso del onboarding (greeting, get_name, get_email, request_name, request_email)
+        **slots: Valores para los huecos de la plantilla (name, email)
+
+    Returns:
+        str: Respuesta renderizada o None si se debe usar el LLM
+    """
+    if step not in RESPONSE_TEMPLATE_STEPS:
+        return None
+    variants = load_templates().get(step)
+    if not variants:
+        return None
+    variant = random.choice(variants)
+    try:
+        return variant.format(**slots)
+    except (KeyError, IndexError, ValueError, AttributeError):
+        # Si la plantilla no se puede renderizar responde el LLM
+        logger.warning("No se pudo renderizar la plantilla de %s: %r", step, variant)
+        return None
+
+def _is_valid_variant(step: str, variant: str) -> bool:
+    if not isinstance(variant, str):
+        return False
+    slots = {slot: "x" for slot in TEMPLATE_STEPS[step]}
+    try:
+        variant.format(**slots)
+    except (KeyError, IndexError, ValueError, AttributeError):
+        return False
+    return all("{" + slot + "}" in variant for slot in slots)
+
+def _valid_pool(pool: Dict, path: str) -> Dict[str, List[str]]:
+    valid = {}
+    for step, variants in pool.items():
+        if step not in TEMPLATE_STEPS or not isinstance(variants, list):
+            logger.warning("Se ignoran las plantillas del paso %r en %s", step, path)
+            continue
+        valid[step] = [variant for variant in variants if _is_valid_variant(step, variant)]
+        if len(valid[step]) < len(variants):
+            logger.warning(
+                "Se descartaron %d variantes inválidas del paso %s en %s",
+                len(variants) - len(valid[step]), step, path
+            )
+    return valid
+
+def regenerate_templates(variants_per_step: int = 8, path: str = RESPONSE_TEMPLATES_PATH) -> Dict[str, List[str]]:
+    """
+    Regenera el pool de variantes con el LLM y lo guarda en el archivo JSON.
+    Está pensado para ejecutarse fuera de línea, no durante una conversación.
+
+    Args:
+        variants_per_step (int): Número de variantes a generar por paso
+        path (str): Ruta del archivo de plantillas
+
+    Returns:
+        Dict[str, List[str]]: Nuevo pool de variantes
+    """
+    from app.utils.conversation_handler import llm
+
+    prompt = ChatPromptTemplate.from_template(
+        """Eres un asistente de ventas virtual amigable que conversa por WhatsApp.
+        Escribe un mensaje breve para esta situación: {description}
+
+        Usa literalmente los marcadores {slots} donde vaya cada dato, sin reemplazarlos.
+        Solo devuelve el mensaje, sin explicaciones ni comillas."""
+    )
+    chain = prompt | llm
+    pool = {}
+    for step, slots in TEMPLATE_STEPS.items():
+        inputs = [
+            {
+                "description": STEP_DESCRIPTIONS[step],
+                "slots": ", ".join("{" + slot + "}" for slot in slots) or "(ninguno)"
+            }
+            for _ in range(variants_per_step)
+        ]
+        variants = [result.content.strip() for result in chain.batch(inputs)]
+        pool[step] = sorted({v for v in variants if _is_valid_variant(step, v)})
+
+    # Conservar las variantes actuales de los pasos en los que no se generó ninguna válida
+    current = load_templates(path)
+    for step, variants in pool.items():
+        if not variants:
+            pool[step] = current.get(step, [])
+
+    # Se escribe en un archivo temporal y se reemplaza el original de una vez, así
+    # load_templates nunca lee un archivo a medio escribir
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(path)), suffix=".tmp")
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump(pool, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+    return pool
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Regenera el pool de respuestas del onboarding")
+    parser.add_argument("--variants", type=int, default=8, help="Variantes a generar por paso")
+    args = parser.parse_args()
+    generated = regenerate_templates(args.variants)
+    for step, variants in generated.items():
+        print(f"{step}: {len(variants)} variantes")
@@ -0,0 +1,301 @@
+import logging
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Optional
+from app.config.config import (
+    SESSION_STORE,
+    SESSION_MAX_ENTRIES,
+    SESSION_MAX_BYTES,
+    SESSION_TTL_SECONDS,
+    SESSION_PURGE_EVERY_WRITES
+)
+from app.database.db_handler import (
+    get_session_state,
+    save_session_state,
+    delete_session_state,
+    count_session_states,
+    delete_expired_session_states
+)
+from app.utils.state_codec import dump_state, load_state
+
+logger = logging.getLogger(__name__)
+
+# Bytes aproximados que ocupa un mensaje además de su contenido (dict, claves, rol)
+MESSAGE_OVERHEAD_BYTES = 250
+STATE_OVERHEAD_BYTES = 2048
+
+def estimate_state_size(state: Dict) -> int:
+    """
+    Estima la memoria que ocupa el estado de una conversación
+
+    Args:
+        state (Dict): Estado de la conversación
+
+    Returns:
+        int: Tamaño aproximado en bytes
+    """
+    messages = state.get("messages") or []
+    size = STATE_OVERHEAD_BYTES + len(state.get("summary") or "") + MESSAGE_OVERHEAD_BYTES * len(messages)
+    transcript = state.get("transcript")
+    if transcript is not None and len(transcript) == len(messages):
+        # El historial renderizado tiene el mismo texto que los mensajes, y se guarda dos veces
+        # (mensajes e historial), así se evita recorrer la conversación
+        return size + 2 * transcript.chars
+    return size + 2 * sum(len(message["content"]) for message in messages)
+
+class StaleSessionError(Exception):
+    """La sesión fue guardada por otro proceso después de leerla"""
+
+class SessionStore:
+    """Interfaz de almacenamiento del estado de las conversaciones por session_id"""
+
+    def get(self, session_id: str) -> Optional[Dict]:
+        raise NotImplementedError
+
+    def put(self, session_id: str, state: Dict) -> None:
+        raise NotImplementedError
+
+    def delete(self, session_id: str) -> None:
+        raise NotImplementedError
+
+    def __len__(self) -> int:
+        raise NotImplementedError
+
+    def stats(self) -> Dict[str, Any]:
+        return {"entries": len(self)}
+
+class InMemorySessionStore(SessionStore):
+    """
+    Almacén en memoria acotado por número de sesiones, bytes aproximados
+    y tiempo de inactividad. Cuando se supera un límite se desalojan las
+    sesiones usadas hace más tiempo.
+    """
+
+    def __init__(
+        self,
+        max_entries: Optional[int] = None,
+        max_bytes: Optional[int] = None,
+        ttl_seconds: Optional[float] = None,
+        on_evict: Optional[Callable[[str, str], None]] = None,
+        sizeof: Callable[[Dict], int] = estimate_state_size
+    ):
+        """
+        Args:
+            max_entries (int): Número máximo de sesiones en memoria
+            max_bytes (int): Tamaño máximo aproximado de todas las sesiones
+            ttl_seconds (float): Tiempo de inactividad tras el que se desaloja una sesión
+            on_evict (Callable): Función llamada con (session_id, motivo) al desalojar
+            sizeof (Callable): Función que estima el tamaño de un estado
+        """
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self.on_evict = on_evict
+        self.sizeof = sizeof
+        self._entries = OrderedDict()  # session_id -> (estado, tamaño, último acceso)
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.evictions = {"ttl": 0, "max_entries": 0, "max_bytes": 0}
+
+    def get(self, session_id: str) -> Optional[Dict]:
+        evicted = []
+        with self._lock:
+            entry = self._entries.get(session_id)
+            if entry is None:
+                return None
+            state, size, last_access = entry
+            now = time.monotonic()
+            if self.ttl_seconds is not None and now - last_access > self.ttl_seconds:
+                self._remove(session_id, "ttl", evicted)
+                state = None
+            else:
+                self._entries[session_id] = (state, size, now)
+                self._entries.move_to_end(session_id)
+        self._notify(evicted)
+        return state
+
+    def put(self, session_id: str, state: Dict) -> None:
+        size = self.sizeof(state)
+        evicted = []
+        with self._lock:
+            previous = self._entries.pop(session_id, None)
+            if previous is not None:
+                self._bytes -= previous[1]
+            self._entries[session_id] = (state, size, time.monotonic())
+            self._bytes += size
+            self._evict(evicted, keep=session_id)
+        self._notify(evicted)
+
+    def delete(self, session_id: str) -> None:
+        with self._lock:
+            entry = self._entries.pop(session_id, None)
+            if entry is not None:
+                self._bytes -= entry[1]
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "entries": len(self._entries),
+            "bytes": self._bytes,
+            "evictions": dict(self.evictions)
+        }
+
+    def _remove(self, session_id: str, reason: str, evicted: list) -> None:
+        _, size, _ = self._entries.pop(session_id)
+        self._bytes -= size
+        self.evictions[reason] += 1
+        evicted.append((session_id, reason))
+
+    def _evict(self, evicted: list, keep: str) -> None:
+        # Las sesiones están ordenadas por último acceso, así que las expiradas están al principio
+        if self.ttl_seconds is not None:
+            now = time.monotonic()
+            while self._entries:
+                session_id, (_, _, last_access) = next(iter(self._entries.items()))
+                if now - last_access <= self.ttl_seconds:
+                    break
+                self._remove(session_id, "ttl", evicted)
+        while self.max_entries is not None and len(self._entries) > self.max_entries:
+            self._remove(next(iter(self._entries)), "max_entries", evicted)
+        while self.max_bytes is not None and self._bytes > self.max_bytes and len(self._entries) > 1:
+            session_id = next(iter(self._entries))
+            if session_id == keep:
+                break
+            self._remove(session_id, "max_bytes", evicted)
+
+    def _notify(self, evicted: list) -> None:
+        if self.on_evict is None:
+            return
+        for session_id, reason in evicted:
+            self.on_evict(session_id, reason)
+
+class SQLSessionStore(SessionStore):
+    """
+    Almacén compartido entre procesos: el estado se guarda serializado en la
+    tabla sessions y cada escritura comprueba que la versión no haya cambiado
+    desde que se leyó (control optimista de concurrencia). Cada purge_every
+    escrituras se borran las sesiones expiradas en un hilo aparte, para no
+    retrasar la petición que hizo esa escritura.
+    """
+
+    def __init__(
+        self,
+        ttl_seconds: Optional[float] = SESSION_TTL_SECONDS,
+        purge_every: int = SESSION_PURGE_EVERY_WRITES
+    ):
+        """
+        Args:
+            ttl_seconds (float): Tiempo de inactividad tras el que se borra una sesión, None = nunca
+            purge_every (int): Escrituras entre dos borrados de sesiones expiradas, 0 = nunca
+        """
+        self.ttl_seconds = ttl_seconds
+        self.purge_every = purge_every
+        self._versions: Dict[str, int] = {}  # Versión leída de cada sesión con un turno en curso
+        self._lock = threading.Lock()
+        self._writes = 0
+        self._purge_thread: Optional[threading.Thread] = None
+        # Sesiones guardadas: se cuentan en la tabla al empezar y tras cada purga, y entre
+        # medias se ajustan con las altas y bajas de este proceso, así el gauge no hace un COUNT(*)
+        self._count: Optional[int] = None
+        self.conflicts = 0
+
+    def get(self, session_id: str) -> Optional[Dict]:
+        row = get_session_state(session_id)
+        with self._lock:
+            if row is None:
+                self._versions.pop(session_id, None)
+                return None
+            data, version = row
+            self._versions[session_id] = version
+        return load_state(data)
+
+    def put(self, session_id: str, state: Dict) -> None:
+        """
+        Guarda el estado de la sesión
+
+        Raises:
+            StaleSessionError: Si otro proceso guardó la sesión después de leerla
+        """
+        with self._lock:
+            expected_version = self._versions.pop(session_id, None)
+        if save_session_state(session_id, dump_state(state), expected_version) is None:
+            with self._lock:
+                self.conflicts += 1
+            raise StaleSessionError(session_id)
+        with self._lock:
+            if expected_version is None and self._count is not None:
+                self._count += 1
+            self._writes += 1
+            if self.purge_every > 0 and self._writes % self.purge_every == 0:
+                self._start_purge()
+
+    def delete(self, session_id: str) -> None:
+        with self._lock:
+            self._versions.pop(session_id, None)
+        deleted = delete_session_state(session_id)
+        with self._lock:
+            if deleted and self._count:
+                self._count -= 1
+
+    def __len__(self) -> int:
+        if self._count is None:
+            count = count_session_states()
+            with self._lock:
+                self._count = count
+        return self._count
+
+    def purge_expired(self, ttl_seconds: float) -> int:
+        """
+        Elimina las sesiones sin actividad
+
+        Args:
+            ttl_seconds (float): Tiempo de inactividad máximo
+
+        Returns:
+            int: Número de sesiones eliminadas
+        """
+        deleted = delete_expired_session_states(ttl_seconds)
+        count = count_session_states()
+        with self._lock:
+            self._count = count
+        return deleted
+
+    def _start_purge(self) -> None:
+        # Se llama con el lock tomado; si la purga anterior sigue en curso no se lanza otra
+        if self.ttl_seconds is None or (self._purge_thread is not None and self._purge_thread.is_alive()):
+            return
+        self._purge_thread = threading.Thread(target=self._purge, name="session-purge", daemon=True)
+        self._purge_thread.start()
+
+    def _purge(self) -> None:
+        try:
+            self.purge_expired(self.ttl_seconds)
+        except Exception:
+            logger.exception("No se pudieron borrar las sesiones expiradas")
+
+    def stats(self) -> Dict[str, Any]:
+        return {"entries": len(self), "conflicts": self.conflicts}
+
+def create_session_store(kind: str = SESSION_STORE) -> SessionStore:
+    """
+    Crea el almacén de sesiones configurado
+
+    Args:
+        kind (str): "memory" para un almacén por proceso o "sql" para compartirlo
+            entre procesos a través de la base de datos
+
+    Returns:
+        SessionStore: Almacén de sesiones
+    """
+    if kind == "sql":
+        return SQLSessionStore()
+    if kind == "memory":
+        return InMemorySessionStore(
+            max_entries=SESSION_MAX_ENTRIES,
+            max_bytes=SESSION_MAX_BYTES,
+            ttl_seconds=SESSION_TTL_SECONDS
+        )
+    raise ValueError(f"Almacén de sesiones desconocido: {kind}")
@@ -0,0 +1,65 @@
+import json
+import zlib
+from typing import Dict
+from app.utils.message_log import MessageLog
+from app.utils.transcript import Transcript
+
+try:
+    import msgpack
+except ImportError:  # msgpack es opcional, si no está se usa JSON
+    msgpack = None
+
+# Roles abreviados para que cada mensaje ocupe menos
+ROLE_CODES = {"user": "u", "assistant": "a", "system": "s"}
+CODE_ROLES = {code: role for role, code in ROLE_CODES.items()}
+
+# Claves del estado que se reconstruyen en lugar de guardarse
+DERIVED_KEYS = {"messages", "transcript"}
+
+def dump_state(state: Dict) -> bytes:
+    """
+    Serializa el estado de una conversación de forma compacta: los mensajes
+    como pares [rol, contenido], el historial solo con los tokens por mensaje,
+    codificado con msgpack (o JSON) y comprimido con zlib
+
+    Args:
+        state (Dict): Estado de la conversación
+
+    Returns:
+        bytes: Estado serializado
+    """
+    messages = state.get("messages") or []
+    payload = {key: value for key, value in state.items() if key not in DERIVED_KEYS}
+    payload["m"] = [[ROLE_CODES.get(m["role"], m["role"]), m["content"]] for m in messages]
+    transcript = state.get("transcript")
+    if transcript is not None:
+        payload["t"] = transcript.token_counts()
+    if msgpack is not None:
+        return b"M" + zlib.compress(msgpack.packb(payload, use_bin_type=True))
+    return b"J" + zlib.compress(json.dumps(payload, ensure_ascii=False, separators=(",", ":")).encode("utf-8"))
+
+def load_state(data: bytes) -> Dict:
+    """
+    Reconstruye el estado serializado con dump_state
+
+    Args:
+        data (bytes): Estado serializado
+
+    Returns:
+        Dict: Estado de la conversación
+    """
+    kind, body = data[:1], zlib.decompress(data[1:])
+    if kind == b"M":
+        if msgpack is None:
+            raise RuntimeError("El estado se guardó con msgpack, que no está instalado")
+        payload = msgpack.unpackb(body, raw=False)
+    else:
+        payload = json.loads(body.decode("utf-8"))
+    messages = MessageLog(
+        {"role": CODE_ROLES.get(role, role), "content": content}
+        for role, content in payload.pop("m")
+    )
+    token_counts = payload.pop("t", [])
+    payload["messages"] = messages
+    payload["transcript"] = Transcript.restore(messages, token_counts)
+    return payload
@@ -0,0 +1,205 @@
+from bisect import bisect_left
+from typing import Dict, List
+
+try:
+    import tiktoken
+    _encoding = tiktoken.get_encoding("cl100k_base")
+except Exception:  # tiktoken es opcional
+    _encoding = None
+
+def count_tokens(text: str) -> int:
+    """
+    Cuenta los tokens de un texto con tiktoken si está instalado,
+    si no usa la aproximación de 4 caracteres por token
+
+    Args:
+        text (str): Texto a medir
+
+    Returns:
+        int: Número de tokens
+    """
+    if _encoding is not None:
+        return len(_encoding.encode(text, disallowed_special=()))
+    return (len(text) + 3) // 4
+
+def truncate_tokens(text: str, max_tokens: int) -> str:
+    """
+    Recorta un texto para que no supere max_tokens, conservando el principio
+
+    Args:
+        text (str): Texto a recortar
+        max_tokens (int): Tokens máximos
+
+    Returns:
+        str: El texto o su principio seguido de "…"
+    """
+    if count_tokens(text) <= max_tokens:
+        return text
+    if max_tokens <= 1:
+        return ""
+    # Se reserva un token para la marca de recorte
+    if _encoding is not None:
+        return _encoding.decode(_encoding.encode(text, disallowed_special=())[:max_tokens - 1]) + "…"
+    return text[:(max_tokens - 1) * 4] + "…"
+
+def render_message(message: Dict) -> str:
+    return f"{message['role']}: {message['content']}"
+
+class Transcript:
+    """
+    Historial de conversación renderizado de forma incremental.
+
+    Solo se renderizan los mensajes nuevos (la lista de mensajes es de solo
+    agregar) y se guarda el inicio de cada mensaje dentro del texto para poder
+    tomar los últimos mensajes como un simple corte del texto. Si los mensajes
+    ya renderizados no coinciden con los recibidos (por ejemplo un turno que
+    falló dejó su mensaje) se descartan desde el primero que difiere.
+    """
+
+    def __init__(self):
+        self._messages: List[Dict] = []  # Mensajes renderizados, para detectar si cambiaron
+        self._parts: List[str] = []
+        self._offsets: List[int] = []  # Posición de inicio de cada mensaje en el texto
+        self._token_prefix: List[int] = [0]  # Tokens acumulados hasta cada mensaje
+        self._length = 0
+        self._text = ""
+
+    def __len__(self) -> int:
+        return len(self._offsets)
+
+    @property
+    def chars(self) -> int:
+        return self._length
+
+    def __repr__(self) -> str:
+        return f"Transcript(messages={len(self)}, chars={self._length})"
+
+    def sync(self, messages: List[Dict]) -> "Transcript":
+        """
+        Renderiza los mensajes que todavía no forman parte del historial
+
+        Args:
+            messages (List[Dict]): Lista completa de mensajes de la conversación
+
+        Returns:
+            Transcript: El propio historial actualizado
+        """
+        keep = min(len(messages), len(self))
+        # Normalmente el último mensaje renderizado es el mismo objeto y no se recorre nada más
+        while keep > 0 and messages[keep - 1] is not self._messages[keep - 1] \
+                and messages[keep - 1] != self._messages[keep - 1]:
+            keep -= 1
+        if keep < len(self):
+            self._truncate(keep)
+        for message in messages[len(self):]:
+            self._messages.append(message)
+            line = render_message(message)
+            if self._offsets:
+                self._parts.append("\n")
+                self._length += 1
+            self._offsets.append(self._length)
+            self._parts.append(line)
+            self._length += len(line)
+            self._token_prefix.append(self._token_prefix[-1] + count_tokens(line))
+        return self
+
+    def _truncate(self, count: int) -> None:
+        # Conserva solo los primeros `count` mensajes (y el separador anterior al siguiente se descarta)
+        length = self._offsets[count] - 1 if count > 0 else 0
+        text = self.text[:length]
+        del self._messages[count:]
+        del self._offsets[count:]
+        del self._token_prefix[count + 1:]
+        self._parts = [text]
+        self._text = text
+        self._length = length
+
+    @classmethod
+    def restore(cls, messages: List[Dict], token_counts: List[int]) -> "Transcript":
+        """
+        Reconstruye un historial guardado sin volver a contar los tokens
+
+        Args:
+            messages (List[Dict]): Mensajes de la conversación
+            token_counts (List[int]): Tokens de cada mensaje, ver token_counts()
+
+        Returns:
+            Transcript: Historial con los mensajes renderizados
+        """
+        transcript = cls()
+        transcript._messages = list(messages[:len(token_counts)])
+        lines = [render_message(message) for message in transcript._messages]
+        offset = 0
+        for line, tokens in zip(lines, token_counts):
+            transcript._offsets.append(offset)
+            transcript._token_prefix.append(transcript._token_prefix[-1] + tokens)
+            offset += len(line) + 1
+        transcript._parts = ["\n".join(lines)]
+        transcript._length = len(transcript._parts[0])
+        return transcript.sync(messages)
+
+    def token_counts(self) -> List[int]:
+        prefix = self._token_prefix
+        return [prefix[i + 1] - prefix[i] for i in range(len(prefix) - 1)]
+
+    @property
+    def text(self) -> str:
+        if len(self._text) != self._length:
+            self._text = "".join(self._parts)
+            self._parts = [self._text]
+        return self._text
+
+    def tail(self, count: int) -> str:
+        """
+        Devuelve los últimos mensajes del historial sin volver a renderizarlos
+
+        Args:
+            count (int): Número de mensajes a incluir
+
+        Returns:
+            str: Texto de los últimos `count` mensajes
+        """
+        if count <= 0:
+            return ""
+        if count >= len(self):
+            return self.text
+        return self.text[self._offsets[-count]:]
+
+    def slice(self, start: int, end: int = None) -> str:
+        """
+        Devuelve el texto de los mensajes en el rango [start, end)
+
+        Args:
+            start (int): Índice del primer mensaje
+            end (int): Índice del mensaje final (exclusivo), por defecto hasta el último
+
+        Returns:
+            str: Texto de los mensajes del rango
+        """
+        end = len(self) if end is None else min(end, len(self))
+        if start >= end:
+            return ""
+        stop = self._offsets[end] - 1 if end < len(self) else self._length
+        return self.text[self._offsets[start]:stop]
+
+    def tokens(self, start: int, end: int = None) -> int:
+        end = len(self) if end is None else min(end, len(self))
+        return max(self._token_prefix[end] - self._token_prefix[start], 0)
+
+    def fit_start(self, start: int, budget: int) -> int:
+        """
+        Busca el primer mensaje a partir de `start` tal que desde él hasta el
+        final del historial no se supere el presupuesto de tokens. El último
+        mensaje se incluye siempre aunque por sí solo supere el presupuesto.
+
+        Args:
+            start (int): Índice mínimo del primer mensaje
+            budget (int): Presupuesto de tokens
+
+        Returns:
+            int: Índice del primer mensaje que cabe en el presupuesto
+        """
+        total = self._token_prefix[-1]
+        # Primer índice i con total - prefix[i] <= budget
+        index = bisect_left(self._token_prefix, total - budget)
+        return min(max(start, index), max(len(self) - 1, 0))
@@ -0,0 +1,6 @@
+"""
+Benchmarks fuera de línea de la aplicación.
+
+Usan un modelo de chat falso con latencia configurable en lugar de OpenAI y
+SQLite en lugar de MySQL, ver bench/run.py.
+"""
@@ -0,0 +1,214 @@
+import asyncio
+import json
+import re
+import threading
+import time
+import zlib
+from collections import Counter
+from typing import Any, Dict, List, Optional, Tuple
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+from pydantic import PrivateAttr
+from app.utils.transcript import count_tokens
+
+# Palabras clave con las que el modelo falso clasifica los mensajes
+INTENT_KEYWORDS = [
+    ("cancel_reservation", ("cancelar",)),
+    ("reservation_info", ("reserva",)),
+    ("hours_info", ("hora", "abren", "cierran", "horario")),
+    ("order_status", ("pedido", "orden", "envío")),
+    ("discounts", ("descuento", "promoción", "oferta")),
+    ("product_info", ("producto", "precio", "talla")),
+    ("quejas", ("queja", "mal servicio", "reclamo")),
+]
+
+EMAIL_RE = re.compile(r"[\w.+-]+@[\w-]+\.[\w.]+")
+CAPITALIZED_RE = re.compile(r"\b([A-ZÁÉÍÓÚÑ][a-záéíóúñ]+)\b")
+
+REPLY_WORDS = (
+    "Claro con gusto te ayudo con eso nuestro equipo revisará tu solicitud "
+    "y te enviaremos los detalles por este medio si necesitas algo más aquí estaré"
+).split()
+
+def _client_message(prompt: str) -> str:
+    # Texto del cliente dentro de los prompts de clasificación y extracción
+    match = re.search(r"Mensaje(?: del cliente)?: (.*)", prompt)
+    return match.group(1).strip() if match else prompt
+
+def _last_user_message(prompt: str) -> str:
+    # Último mensaje del cliente dentro del historial del prompt single-shot
+    messages = re.findall(r"^\s*user: (.*)$", prompt, re.MULTILINE)
+    return messages[-1].strip() if messages else ""
+
+def _classify(text: str) -> str:
+    text = text.lower()
+    return next(
+        (intent for intent, words in INTENT_KEYWORDS if any(word in text for word in words)),
+        "not_applicable"
+    )
+
+class LLMUsage:
+    """Llamadas y tokens consumidos por el modelo falso, por tipo de llamada"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self) -> None:
+        with self._lock:
+            self.calls = Counter()
+            self.prompt_tokens = 0
+            self.completion_tokens = 0
+
+    def record(self, kind: str, prompt: str, completion: str) -> Dict[str, int]:
+        prompt_tokens, completion_tokens = count_tokens(prompt), count_tokens(completion)
+        with self._lock:
+            self.calls[kind] += 1
+            self.prompt_tokens += prompt_tokens
+            self.completion_tokens += completion_tokens
+        # Mismo formato que usage_metadata de los mensajes de LangChain
+        return {
+            "input_tokens": prompt_tokens,
+            "output_tokens": completion_tokens,
+            "total_tokens": prompt_tokens + completion_tokens
+        }
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "calls": dict(self.calls),
+                "total_calls": sum(self.calls.values()),
+                "prompt_tokens": self.prompt_tokens,
+                "completion_tokens": self.completion_tokens
+            }
+
+class FakeChatModel(BaseChatModel):
+    """
+    Modelo de chat determinista para los benchmarks.
+
+    Responde según el tipo de prompt (clasificación, extracción de nombre o
+    email, resumen, respuesta JSON del modo single-shot o respuesta al cliente) y simula la latencia de un modelo
+    real: una espera inicial más el tiempo de generar cada token.
+    """
+
+    latency_ms: float = 300.0
+    tokens_per_second: float = 50.0
+    reply_tokens: int = 40
+    _usage: LLMUsage = PrivateAttr(default_factory=LLMUsage)
+
+    @property
+    def _llm_type(self) -> str:
+        return "fake-benchmark"
+
+    @property
+    def usage(self) -> LLMUsage:
+        return self._usage
+
+    def _reply(self, messages: List) -> Tuple[str, Dict[str, int]]:
+        prompt = "\n".join(str(message.content) for message in messages)
+        if "Clasifica el siguiente mensaje" in prompt:
+            kind = "classify"
+            content = _classify(_client_message(prompt))
+        elif "Extrae el nombre" in prompt:
+            kind = "extract_name"
+            match = CAPITALIZED_RE.search(_client_message(prompt))
+            content = match.group(1) if match else "Unknown"
+        elif "Extrae el email" in prompt:
+            kind = "extract_email"
+            match = EMAIL_RE.search(_client_message(prompt))
+            content = match.group(0) if match else "unknown@example.com"
+        elif "Resumen actual:" in prompt:
+            kind = "summary"
+            content = "El cliente se identificó y consultó por varios servicios."
+        elif "responde solo con un objeto JSON" in prompt:
+            kind = "single_shot"
+            message = _last_user_message(prompt)
+            name = CAPITALIZED_RE.search(EMAIL_RE.sub(" ", message))
+            email = EMAIL_RE.search(message)
+            content = json.dumps({
+                "name": name.group(1) if name else None,
+                "email": email.group(0) if email else None,
+                "intent": _classify(message),
+                "reply": self._reply_text(prompt)
+            }, ensure_ascii=False)
+        else:
+            kind = "reply"
+            content = self._reply_text(prompt)
+
+        return content, self._usage.record(kind, prompt, content)
+
+    def _reply_text(self, prompt: str) -> str:
+        # Respuesta con el largo configurado, distinta según el prompt pero reproducible
+        offset = zlib.crc32(prompt.encode("utf-8")) % len(REPLY_WORDS)
+        words = [REPLY_WORDS[(offset + i) % len(REPLY_WORDS)] for i in range(self.reply_tokens)]
+        return " ".join(words).capitalize() + "."
+
+    def _delays(self, content: str):
+        # Espera inicial y espera por token (los tokens se aproximan con palabras)
+        words = content.split(" ")
+        per_token = 1 / self.tokens_per_second if self.tokens_per_second > 0 else 0.0
+        return self.latency_ms / 1000, per_token, words
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs) -> ChatResult:
+        content, usage = self._reply(messages)
+        first, per_token, words = self._delays(content)
+        time.sleep(first + per_token * len(words))
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content=content, usage_metadata=usage))])
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs) -> ChatResult:
+        content, usage = self._reply(messages)
+        first, per_token, words = self._delays(content)
+        await asyncio.sleep(first + per_token * len(words))
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content=content, usage_metadata=usage))])
+
+    def _stream(self, messages, stop=None, run_manager=None, **kwargs):
+        content, usage = self._reply(messages)
+        first, per_token, words = self._delays(content)
+        time.sleep(first)
+        for i, word in enumerate(words):
+            time.sleep(per_token)
+            token = word if i == 0 else " " + word
+            # El uso de tokens va en el último fragmento, como en OpenAI con stream_usage
+            chunk = ChatGenerationChunk(message=AIMessageChunk(
+                content=token,
+                usage_metadata=usage if i == len(words) - 1 else None
+            ))
+            if run_manager:
+                run_manager.on_llm_new_token(token, chunk=chunk)
+            yield chunk
+
+    async def _astream(self, messages, stop=None, run_manager=None, **kwargs):
+        content, usage = self._reply(messages)
+        first, per_token, words = self._delays(content)
+        await asyncio.sleep(first)
+        for i, word in enumerate(words):
+            await asyncio.sleep(per_token)
+            token = word if i == 0 else " " + word
+            # El uso de tokens va en el último fragmento, como en OpenAI con stream_usage
+            chunk = ChatGenerationChunk(message=AIMessageChunk(
+                content=token,
+                usage_metadata=usage if i == len(words) - 1 else None
+            ))
+            if run_manager:
+                await run_manager.on_llm_new_token(token, chunk=chunk)
+            yield chunk
+
+def install_fake_llm(model: Optional[FakeChatModel] = None, **kwargs) -> FakeChatModel:
+    """
+    Reemplaza el ChatOpenAI de la aplicación por el modelo falso
+
+    Args:
+        model (FakeChatModel): Modelo a instalar, si no se crea uno con kwargs
+
+    Returns:
+        FakeChatModel: Modelo instalado
+    """
+    import app.utils.conversation_handler as conversation_handler
+    import app.utils.intent_classifier as intent_classifier
+
+    if model is None:
+        model = FakeChatModel(**kwargs)
+    conversation_handler.llm = model
+    intent_classifier.llm = model
+    return model
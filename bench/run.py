@@ -0,0 +1,230 @@
+"""
+Benchmark fuera de línea: conversaciones guionizadas con un modelo de chat
+falso y SQLite, sin llamar a OpenAI ni a MySQL.
+
+    python -m bench.run --conversations 50 --concurrency 8 --mode controller-async
+"""
+import argparse
+import json
+import os
+import resource
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List
+
+MODES = ["handler", "controller", "controller-async"]
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark de la aplicación con un LLM falso")
+    parser.add_argument("--mode", choices=MODES, default="controller",
+                        help="handler: solo process_message; controller: ConversationController "
+                             "(con base de datos); controller-async: ahandle_message en un bucle de eventos")
+    parser.add_argument("--scenario", default="default", help="Escenario de bench/scenarios.py")
+    parser.add_argument("--conversations", type=int, default=20, help="Conversaciones a simular")
+    parser.add_argument("--concurrency", type=int, default=4, help="Conversaciones simultáneas")
+    parser.add_argument("--latency-ms", type=float, default=300.0, help="Espera del LLM antes del primer token")
+    parser.add_argument("--tokens-per-second", type=float, default=50.0, help="Velocidad de generación del LLM")
+    parser.add_argument("--reply-tokens", type=int, default=40, help="Tokens de cada respuesta al cliente")
+    parser.add_argument("--database-url", help="Base de datos del benchmark, por defecto un SQLite temporal")
+    parser.add_argument("--conversation-mode", choices=["multi_call", "single_shot"],
+                        help="Forzar el modo del grafo (CONVERSATION_MODE)")
+    parser.add_argument("--speculative", choices=["on", "off"],
+                        help="Forzar la respuesta especulativa (SPECULATIVE_REPLY)")
+    parser.add_argument("--write-behind", choices=["on", "off"], help="Forzar la escritura diferida")
+    parser.add_argument("--tracemalloc", action="store_true",
+                        help="Medir el pico de memoria de Python con tracemalloc (añade sobrecarga)")
+    parser.add_argument("--json", help="Guardar el reporte en este archivo JSON")
+    return parser.parse_args(argv)
+
+def configure_environment(args) -> None:
+    # La configuración se lee al importar la aplicación, así que se fija antes.
+    # La base de datos se reemplaza siempre para no escribir nunca en la real.
+    database_url = args.database_url
+    if not database_url:
+        path = os.path.join(tempfile.mkdtemp(prefix="bench-"), "bench.db")
+        database_url = f"sqlite:///{path}"
+    os.environ["DATABASE_URL"] = database_url
+    os.environ["OPENAI_API_KEY"] = os.environ.get("OPENAI_API_KEY") or "sk-benchmark"
+    os.environ["LANGSMITH_TRACING"] = "false"
+    if args.conversation_mode:
+        os.environ["CONVERSATION_MODE"] = args.conversation_mode
+    if args.speculative:
+        os.environ["SPECULATIVE_REPLY"] = "true" if args.speculative == "on" else "false"
+    if args.write_behind:
+        os.environ["WRITE_BEHIND_ENABLED"] = "true" if args.write_behind == "on" else "false"
+
+class StatementCounter:
+    """Cuenta las sentencias SQL ejecutadas por el engine de la aplicación"""
+
+    def __init__(self, engine):
+        from sqlalchemy import event
+
+        self.count = 0
+        self._lock = threading.Lock()
+        event.listen(engine, "before_cursor_execute", self._on_execute)
+
+    def _on_execute(self, *args) -> None:
+        with self._lock:
+            self.count += 1
+
+def percentiles(values: List[float]) -> Dict[str, float]:
+    import numpy as np
+
+    if not values:
+        return {"p50": 0.0, "p95": 0.0, "p99": 0.0, "max": 0.0}
+    p50, p95, p99 = np.percentile(values, [50, 95, 99])
+    return {"p50": float(p50), "p95": float(p95), "p99": float(p99), "max": float(max(values))}
+
+def run_conversations(args, scripts: List[List[str]]) -> List[float]:
+    """Ejecuta las conversaciones y devuelve la latencia de cada turno en milisegundos"""
+    from app.controllers.conversation_controller import ConversationController
+    from app.utils.conversation_handler import process_message
+
+    latencies: List[float] = []
+    lock = threading.Lock()
+
+    if args.mode == "controller-async":
+        import asyncio
+
+        controller = ConversationController()
+
+        async def converse(number: int, script: List[str], semaphore) -> None:
+            async with semaphore:
+                for message in script:
+                    started = time.perf_counter()
+                    await controller.ahandle_message(f"bench-{number}", message)
+                    latencies.append((time.perf_counter() - started) * 1000)
+
+        async def main() -> None:
+            semaphore = asyncio.Semaphore(args.concurrency)
+            await asyncio.gather(*(converse(n, script, semaphore) for n, script in enumerate(scripts)))
+
+        asyncio.run(main())
+        flush_writer(controller)
+        return latencies
+
+    controller = ConversationController() if args.mode == "controller" else None
+
+    def converse(number: int, script: List[str]) -> None:
+        state = None
+        for message in script:
+            started = time.perf_counter()
+            if controller is not None:
+                controller.handle_message(f"bench-{number}", message)
+            else:
+                state = process_message(message, state)["state"]
+            elapsed = (time.perf_counter() - started) * 1000
+            with lock:
+                latencies.append(elapsed)
+
+    with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+        list(pool.map(converse, range(len(scripts)), scripts))
+    flush_writer(controller)
+    return latencies
+
+def flush_writer(controller) -> None:
+    # Las filas pendientes de la escritura diferida también cuentan en las sentencias
+    if controller is not None and controller.writer is not None:
+        controller.writer.flush()
+
+def run_benchmark(args) -> Dict[str, Any]:
+    """
+    Ejecuta el benchmark con los argumentos de parse_args
+
+    Returns:
+        Dict: Reporte con latencias, llamadas al LLM, sentencias SQL y memoria
+    """
+    configure_environment(args)
+
+    from bench.fake_llm import install_fake_llm
+    from bench.scenarios import build_script
+    from app.models.models import engine, init_db
+
+    init_db()
+    model = install_fake_llm(
+        latency_ms=args.latency_ms,
+        tokens_per_second=args.tokens_per_second,
+        reply_tokens=args.reply_tokens
+    )
+    statements = StatementCounter(engine)
+    scripts = [build_script(args.scenario, n) for n in range(args.conversations)]
+
+    if args.tracemalloc:
+        tracemalloc.start()
+    started = time.perf_counter()
+    latencies = run_conversations(args, scripts)
+    wall_seconds = time.perf_counter() - started
+    traced_peak = tracemalloc.get_traced_memory()[1] if args.tracemalloc else None
+    if args.tracemalloc:
+        tracemalloc.stop()
+
+    from app.config.config import CONVERSATION_MODE
+    from app.utils.conversation_handler import get_speculation_stats
+
+    turns = len(latencies)
+    usage = model.usage.snapshot()
+    return {
+        "mode": args.mode,
+        "conversation_mode": CONVERSATION_MODE,
+        "scenario": args.scenario,
+        "conversations": args.conversations,
+        "concurrency": args.concurrency,
+        "llm": {
+            "latency_ms": args.latency_ms,
+            "tokens_per_second": args.tokens_per_second,
+            "reply_tokens": args.reply_tokens
+        },
+        "turns": turns,
+        "wall_seconds": wall_seconds,
+        "turns_per_second": turns / wall_seconds if wall_seconds else 0.0,
+        "latency_ms": percentiles(latencies),
+        "llm_calls_per_turn": usage["total_calls"] / turns if turns else 0.0,
+        "llm_calls": usage["calls"],
+        "prompt_tokens_per_turn": usage["prompt_tokens"] / turns if turns else 0.0,
+        "completion_tokens_per_turn": usage["completion_tokens"] / turns if turns else 0.0,
+        "db_statements_per_turn": statements.count / turns if turns else 0.0,
+        "speculation": get_speculation_stats(),
+        # ru_maxrss está en KB en Linux
+        "peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+        "peak_traced_mb": traced_peak / (1024 * 1024) if traced_peak is not None else None
+    }
+
+def format_report(report: Dict[str, Any]) -> str:
+    latency = report["latency_ms"]
+    lines = [
+        f"Modo: {report['mode']} ({report['conversation_mode']})  escenario: {report['scenario']}  "
+        f"conversaciones: {report['conversations']}  concurrencia: {report['concurrency']}",
+        f"Turnos: {report['turns']} en {report['wall_seconds']:.2f} s ({report['turns_per_second']:.1f} turnos/s)",
+        f"Latencia por turno (ms): p50 {latency['p50']:.1f}  p95 {latency['p95']:.1f}  "
+        f"p99 {latency['p99']:.1f}  máx {latency['max']:.1f}",
+        f"Llamadas al LLM por turno: {report['llm_calls_per_turn']:.2f} {report['llm_calls']}",
+        f"Tokens por turno: prompt {report['prompt_tokens_per_turn']:.0f}  "
+        f"respuesta {report['completion_tokens_per_turn']:.0f}",
+        f"Sentencias SQL por turno: {report['db_statements_per_turn']:.2f}",
+        f"Memoria máxima (RSS): {report['peak_rss_mb']:.1f} MB"
+    ]
+    speculation = report["speculation"]
+    if speculation["hits"] or speculation["misses"]:
+        lines.append(
+            f"Respuestas especulativas: aciertos {speculation['hits']}  fallos {speculation['misses']}  "
+            f"tasa {speculation['hit_rate']:.0%}  tokens desperdiciados "
+            f"{speculation['wasted_prompt_tokens'] + speculation['wasted_completion_tokens']}"
+        )
+    if report["peak_traced_mb"] is not None:
+        lines.append(f"Pico de memoria de Python (tracemalloc): {report['peak_traced_mb']:.1f} MB")
+    return "\n".join(lines)
+
+def main(argv=None) -> None:
+    args = parse_args(argv)
+    report = run_benchmark(args)
+    print(format_report(report))
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,49 @@
+from typing import Dict, List
+
+# Conversaciones guionizadas: {n} se reemplaza por el número de conversación
+# para que cada una tenga un usuario distinto
+SCENARIOS: Dict[str, List[str]] = {
+    # Onboarding completo y varias consultas de servicio
+    "default": [
+        "",
+        "Hola, me llamo Ana",
+        "ana{n}@example.com",
+        "¿A qué hora abren el sábado?",
+        "Quiero hacer una reserva para 4 personas",
+        "¿Tienen algún descuento esta semana?",
+        "¿Dónde está mi pedido 1234?",
+        "Gracias, eso es todo"
+    ],
+    # Nombre y email en el mismo mensaje y una conversación larga que fuerza el resumen del historial
+    "long": [
+        "",
+        "Soy Luis, mi correo es luis{n}@example.com",
+    ] + [
+        question
+        for _ in range(6)
+        for question in (
+            "¿Cuál es el precio del producto estrella?",
+            "¿A qué hora cierran hoy?",
+            "Tengo una queja por el mal servicio",
+        )
+    ],
+    # Solo el onboarding
+    "onboarding": [
+        "",
+        "Me llamo Sofía",
+        "sofia{n}@example.com"
+    ]
+}
+
+def build_script(name: str, number: int) -> List[str]:
+    """
+    Devuelve los mensajes de una conversación guionizada
+
+    Args:
+        name (str): Nombre del escenario en SCENARIOS
+        number (int): Número de la conversación
+
+    Returns:
+        List[str]: Mensajes del usuario en orden
+    """
+    return [message.format(n=number) for message in SCENARIOS[name]]
@@ -21,6 +21,43 @@ CREATE TABLE IF NOT EXISTS conversations (
     created_at DATETIME DEFAULT CURRENT_TIMESTAMP
 ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
 
+-- Crear tabla de sesiones compartidas entre procesos
+CREATE TABLE IF NOT EXISTS sessions (
+    session_id VARCHAR(64) PRIMARY KEY,
+    version INT NOT NULL DEFAULT 1,
+    state MEDIUMBLOB,
+    updated_at DATETIME DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+    INDEX (updated_at)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
+
+-- Crear tabla de conversaciones por hora e intent (se actualiza al guardar cada turno)
+CREATE TABLE IF NOT EXISTS intent_stats (
+    hour_bucket DATETIME NOT NULL,
+    intent VARCHAR(50) CHARACTER SET utf8mb4 COLLATE utf8mb4_unicode_ci NOT NULL,
+    count INT NOT NULL DEFAULT 0,
+    PRIMARY KEY (hour_bucket, intent)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
+
+-- Cargar las estadísticas de las conversaciones existentes (solo la primera vez)
+INSERT IGNORE INTO intent_stats (hour_bucket, intent, count)
+SELECT DATE_FORMAT(created_at, '%Y-%m-%d %H:00:00'), COALESCE(intent, ''), COUNT(*)
+FROM conversations
+GROUP BY 1, 2;
+
 -- Añadir índices para mejorar rendimiento
-ALTER TABLE conversations ADD INDEX (user_id);
-ALTER TABLE users ADD INDEX (email);
\ No newline at end of file
+-- Índice compuesto para leer el historial de un usuario por páginas (también sirve para filtrar por user_id)
+ALTER TABLE conversations ADD INDEX ix_conversations_user_created (user_id, created_at, id);
+-- Sesión de cada turno. La columna se añade aquí y no en CREATE TABLE para que también
+-- se cree en una base existente, donde CREATE TABLE IF NOT EXISTS no modifica la tabla
+ALTER TABLE conversations ADD COLUMN session_id VARCHAR(64) NULL AFTER user_id;
+ALTER TABLE conversations ADD INDEX (session_id);
+-- Origen del intent de cada turno ("local", "llm" o "human"); el clasificador local solo se
+-- entrena con "llm" y "human". Los turnos anteriores quedan en NULL y no se usan para entrenar
+ALTER TABLE conversations ADD COLUMN label_source VARCHAR(10) NULL AFTER intent;
+-- Email único para que save_user sea un upsert atómico. En una base existente hay que
+-- eliminar antes los usuarios duplicados, conservando el de menor id:
+-- UPDATE conversations c JOIN users u ON c.user_id = u.id
+--     JOIN (SELECT email, MIN(id) AS keep_id FROM users GROUP BY email) k ON k.email = u.email
+--     SET c.user_id = k.keep_id;
+-- DELETE u1 FROM users u1 JOIN users u2 ON u1.email = u2.email AND u1.id > u2.id;
+ALTER TABLE users ADD UNIQUE INDEX uq_users_email (email);
\ No newline at end of file
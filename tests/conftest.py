@@ -0,0 +1,22 @@
+import os
+import tempfile
+
+# La configuración se lee al importar la aplicación, así que se fija antes:
+# SQLite temporal, sin OpenAI ni LangSmith y respuestas del LLM (falso) en todos los pasos
+os.environ["DATABASE_URL"] = "sqlite:///" + os.path.join(tempfile.mkdtemp(prefix="tests-"), "tests.db")
+os.environ.setdefault("OPENAI_API_KEY", "sk-tests")
+os.environ["LANGSMITH_TRACING"] = "false"
+os.environ["RESPONSE_TEMPLATE_STEPS"] = ""
+os.environ["KNOWLEDGE_BASE_PATH"] = ""
+
+import pytest
+
+@pytest.fixture(scope="session", autouse=True)
+def database():
+    from app.models.models import init_db
+    init_db()
+
+@pytest.fixture
+def fake_llm():
+    from bench.fake_llm import install_fake_llm
+    return install_fake_llm(latency_ms=50, tokens_per_second=200, reply_tokens=10)
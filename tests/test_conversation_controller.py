@@ -0,0 +1,37 @@
+import asyncio
+from app.controllers.conversation_controller import ConversationController
+from app.utils.session_store import InMemorySessionStore
+
+async def collect(controller, session_id, message):
+    tokens, done = [], None
+    async for event in controller.astream_message(session_id, message):
+        if event["type"] == "token":
+            tokens.append(event["content"])
+        elif event["type"] == "done":
+            done = event
+    return tokens, done
+
+def test_coalesced_stream_sends_the_response_to_the_request_that_streamed_it(fake_llm):
+    controller = ConversationController(session_store=InMemorySessionStore(), write_behind=False)
+
+    async def scenario():
+        for message in ("hola", "me llamo Ana", "ana@example.com"):
+            await collect(controller, "s1", message)
+        # Con un turno en curso, los dos mensajes siguientes se agrupan en un solo turno
+        first = asyncio.create_task(collect(controller, "s1", "¿a qué hora abren?"))
+        await asyncio.sleep(0.01)
+        second = asyncio.create_task(collect(controller, "s1", "quiero hacer un pedido"))
+        third = asyncio.create_task(collect(controller, "s1", "de dos productos"))
+        return await asyncio.gather(first, second, third)
+
+    _, second, third = asyncio.run(scenario())
+
+    assert controller.coalesced_messages == 1
+    streamed = [result for result in (second, third) if result[0]]
+    silent = [result for result in (second, third) if not result[0]]
+    assert len(streamed) == 1 and len(silent) == 1
+    tokens, done = streamed[0]
+    assert not done["coalesced"]
+    assert done["response"] == "".join(tokens)
+    assert silent[0][1]["coalesced"]
+    assert silent[0][1]["response"] == ""
@@ -0,0 +1,18 @@
+import pytest
+from app.utils.extractors import extract_name
+
+@pytest.mark.parametrize("message, expected", [
+    ("Ana", ("Ana", False)),
+    ("Hola, Ana López", ("Ana López", False)),
+    ("me llamo ana", ("Ana", False)),
+    ("Soy María de la Cruz", ("María de la Cruz", False)),
+    ("mi nombre es Carlos pero dime Charly", ("Carlos", False)),
+    ("Me llamo Ana y soy de México", ("Ana", False)),
+    ("me llamo juan carlos", (None, True)),
+    ("precios", (None, True)),
+    ("Perfecto", (None, True)),
+    ("Soy de México", (None, True)),
+    ("gracias", (None, False)),
+])
+def test_extract_name(message, expected):
+    assert extract_name(message) == expected
@@ -0,0 +1,20 @@
+import pytest
+from app.utils import intent_classifier
+
+@pytest.mark.parametrize("message", ["quiero hablar con un humano", "mi pedido llegó roto"])
+def test_unclear_messages_are_not_resolved_locally(message):
+    assert not intent_classifier.is_confident(intent_classifier.local_model.predict(message))
+
+@pytest.mark.parametrize("message, intent", [
+    ("a qué hora abren", "hours_info"),
+    ("quiero cancelar mi reserva", "cancel_reservation")
+])
+def test_clear_messages_are_resolved_locally(message, intent):
+    prediction = intent_classifier.local_model.predict(message)
+    assert intent_classifier.is_confident(prediction)
+    assert prediction[0] == intent
+
+def test_is_confident_does_not_count_hits():
+    hits = intent_classifier.stats["local_hits"]
+    intent_classifier.is_confident(intent_classifier.local_model.predict("a qué hora abren"))
+    assert intent_classifier.stats["local_hits"] == hits
@@ -0,0 +1,32 @@
+from datetime import date
+from app.utils import knowledge_base
+
+TODAY = date(2026, 10, 18)
+
+KB = knowledge_base.build_index({
+    "hours": {day: ["09:00", "20:00"] for day in knowledge_base.WEEKDAYS},
+    "special_hours": {"2026-12-24": ["10:00", "15:00"], "2026-12-25": None},
+    "templates": {
+        "hours_day": "El {day} abrimos de {open} a {close}.",
+        "hours_closed": "El {day} permanecemos cerrados.",
+        "hours_week": "{schedule}",
+        "hours_days": "{schedule}"
+    }
+})
+
+def test_date_with_month_uses_that_date():
+    assert knowledge_base._mentioned_days("¿Qué horario tienen el 24 de diciembre?", TODAY) == [date(2026, 12, 24)]
+    answer = knowledge_base._answer_hours(KB, "¿abren el 25 de diciembre?", "Ana", TODAY)
+    assert answer == "El viernes 25 de diciembre permanecemos cerrados."
+
+def test_day_without_month_is_the_next_one():
+    assert knowledge_base._mentioned_days("¿abren el 24?", TODAY) == [date(2026, 10, 24)]
+    assert knowledge_base._mentioned_days("¿y el 5?", TODAY) == [date(2026, 11, 5)]
+
+def test_past_date_with_month_is_next_year():
+    assert knowledge_base._mentioned_days("el 1 de enero", TODAY) == [date(2027, 1, 1)]
+
+def test_empty_name_drops_the_slot():
+    assert knowledge_base._format("¡Sí, {name}! Hay promociones.", "") == "¡Sí! Hay promociones."
+    assert knowledge_base._format("No hay, {name}, pero avisaremos.", "") == "No hay, pero avisaremos."
+    assert knowledge_base._format("¡Sí, {name}!", "Ana") == "¡Sí, Ana!"
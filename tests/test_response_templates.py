@@ -0,0 +1,30 @@
+import json
+import pytest
+from app.utils import response_templates
+
+@pytest.fixture
+def templates(tmp_path, monkeypatch):
+    monkeypatch.setattr(response_templates, "RESPONSE_TEMPLATE_STEPS", list(response_templates.TEMPLATE_STEPS))
+    monkeypatch.setattr(response_templates, "_pool", {})
+    monkeypatch.setattr(response_templates, "_pool_mtime", None)
+    path = tmp_path / "templates.json"
+
+    def write(pool):
+        path.write_text(json.dumps(pool), encoding="utf-8")
+        return response_templates.load_templates(str(path))
+    return write
+
+def test_invalid_variants_are_dropped_on_load(templates):
+    pool = templates({
+        "get_name": ["Gracias {name}, ¿tu correo?", "Hola {nombre}", "Hola {name} {email}", "¿Tu correo?", 3],
+        "greeting": ["¡Hola! ¿Cómo te llamas?"],
+        "despedida": ["Adiós"]
+    })
+    assert pool == {"get_name": ["Gracias {name}, ¿tu correo?"], "greeting": ["¡Hola! ¿Cómo te llamas?"]}
+
+def test_template_that_fails_to_render_falls_back_to_llm(templates, monkeypatch):
+    pool = templates({"get_name": ["Gracias {name}, ¿tu correo?"]})
+    monkeypatch.setattr(response_templates, "load_templates", lambda: pool)
+    assert response_templates.render_step_template("get_name", name="Ana") == "Gracias Ana, ¿tu correo?"
+    # Sin el dato del hueco la plantilla no se puede renderizar
+    assert response_templates.render_step_template("get_name") is None
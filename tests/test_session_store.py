@@ -0,0 +1,35 @@
+import threading
+from app.utils.session_store import SQLSessionStore
+
+def test_deleting_a_missing_session_keeps_the_count():
+    store = SQLSessionStore(ttl_seconds=None, purge_every=0)
+    store.put("count-keep", {"messages": []})
+    before = len(store)
+    store.put("count-a", {"messages": []})
+    store.delete("count-a")
+    store.delete("count-a")
+    store.delete("count-missing")
+    assert len(store) == before
+    store.delete("count-keep")
+
+def test_purge_runs_outside_the_writing_request(monkeypatch):
+    purge_threads = []
+    started = threading.Event()
+    release = threading.Event()
+
+    def purge(ttl_seconds):
+        purge_threads.append(threading.current_thread())
+        started.set()
+        release.wait(5)
+        return 0
+    store = SQLSessionStore(ttl_seconds=3600, purge_every=2)
+    monkeypatch.setattr(store, "purge_expired", purge)
+    for i in range(6):
+        store.put(f"purge-{i}", {"messages": []})
+    # Las escrituras no esperan a la purga, y no se lanza otra mientras sigue en curso
+    assert started.wait(5)
+    assert len(purge_threads) == 1 and purge_threads[0] is not threading.current_thread()
+    release.set()
+    store._purge_thread.join(5)
+    for i in range(6):
+        store.delete(f"purge-{i}")
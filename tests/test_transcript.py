@@ -0,0 +1,20 @@
+from app.utils.conversation_handler import build_conversation_history, create_initial_state
+from app.utils.message_log import MessageLog
+from app.utils.transcript import Transcript, count_tokens
+
+def test_fit_start_keeps_the_last_message_over_budget():
+    transcript = Transcript().sync([
+        {"role": "assistant", "content": "¿En qué te ayudo?"},
+        {"role": "user", "content": "hola " * 3000}
+    ])
+    assert transcript.fit_start(0, 100) == 1
+
+def test_history_truncates_a_last_message_over_budget():
+    state = create_initial_state(messages=MessageLog.from_messages([
+        {"role": "assistant", "content": "¿En qué te ayudo?"},
+        {"role": "user", "content": "hola " * 3000}
+    ]))
+    history = build_conversation_history(state, "provide_service")
+    assert history.startswith("user: hola hola")
+    assert history.endswith("…")
+    assert count_tokens(history) < count_tokens("hola " * 3000)